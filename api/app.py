@@ -1,28 +1,32 @@
 from flask import Flask, request, jsonify, render_template
 from flask_cors import CORS
-import sqlite3
+import hashlib
+import io
 import json
 import logging
 import os
-from datetime import datetime
-from textblob import TextBlob
-import nltk
+from datetime import datetime, timedelta, timezone
 import uuid
+import atexit
 from dotenv import load_dotenv
 from utils.fragrance_mapping import FragranceMapper
 from state_machine.conversation_state_machine import ConversationStateMachine
+from state_machine.conversation_record import MAX_USER_ID_BYTES, ConversationRecord
+from db.connection import SQLiteConnectionManager
 from db.user_database import UserDatabase
-from db.postgres_database import PostgresDatabase
+from db.schema import init_app_schema
+from db.analytics import choose_bucket_hours, sentiment_summary, sentiment_timeseries
+from db.fragrance_store import FRAGRANCE_COLUMNS, create_fragrance_store
+from db.fragrance_catalog import FragranceCatalog
+from db.fragrance_import import FragranceImportError, detect_format, import_fragrances
+from db.session_store import create_session_store
+from db.conversation_writer import ConversationWriter
+from detectors.sentiment_pipeline import SentimentPipeline
+from utils.polarity import PolarityScorer, polarity_label
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Download required NLTK data
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
-
 # Setup logging
 def setup_logging():
     """Thiết lập hệ thống logging"""
@@ -57,92 +61,131 @@ app = Flask(__name__, template_folder=os.path.abspath(os.path.join(os.path.dirna
 CORS(app)
 
 # Initialize components
-fragrance_db = PostgresDatabase()
-user_db = UserDatabase()
+# Kết nối SQLite thread-local (WAL) dùng chung cho UserDatabase, conversations và analytics
+db_connections = SQLiteConnectionManager(
+    'chatbot.db',
+    busy_timeout_ms=int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    synchronous=os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+)
+atexit.register(db_connections.close)
+# Danh mục nến thơm: FRAGRANCE_BACKEND=postgres (DATABASE_URL), sqlite (bảng trong chatbot.db, seed từ
+# FragranceMapper) hoặc memory; mặc định postgres khi có DATABASE_URL, ngược lại sqlite
+# Backend Postgres dùng pool connection chung giữa các luồng request, tự kết nối lại khi Postgres restart
+fragrance_db = create_fragrance_store(
+    os.getenv('FRAGRANCE_BACKEND', 'postgres' if os.getenv('DATABASE_URL') else 'sqlite'),
+    connections=db_connections,
+    min_size=int(os.getenv('POSTGRES_POOL_MIN', 1)),
+    max_size=int(os.getenv('POSTGRES_POOL_MAX', 10)),
+    acquire_timeout=float(os.getenv('POSTGRES_ACQUIRE_TIMEOUT', 5)),
+    ping_idle_seconds=float(os.getenv('POSTGRES_PING_IDLE_SECONDS', 5)),
+)
+atexit.register(fragrance_db.close)
+# Danh mục nến thơm trong bộ nhớ, poll phiên bản danh mục mỗi FRAGRANCE_CATALOG_POLL_SECONDS giây
+fragrance_catalog = FragranceCatalog(
+    fragrance_db, poll_interval=float(os.getenv('FRAGRANCE_CATALOG_POLL_SECONDS', 30)))
+fragrance_catalog.start()
+atexit.register(fragrance_catalog.close)
+# PREFERENCE_CACHE_SIZE > 0 bật cache gợi ý cá nhân hóa (chỉ nên bật khi chạy một worker)
+user_db = UserDatabase(
+    connections=db_connections,
+    suggestion_cache_size=int(os.getenv('PREFERENCE_CACHE_SIZE', 0)),
+)
+
+def finalize_sessions(records):
+    """Kết thúc theo lô các phiên bị session store loại (idle quá TTL, vượt giới hạn, worker tắt)"""
+    user_db.end_sessions([
+        (record.session_id, record.emotions_discussed, get_fragrance_names(record.fragrance_ids))
+        for record in records
+    ])
 
-# Store active conversations (in production, use Redis or database)
-active_conversations = {}
+# Store active conversations: idle TTL + giới hạn số phiên (LRU), sweeper nền kết thúc phiên bị loại.
+# SESSION_BACKEND=sqlite dùng chung phiên giữa các worker gunicorn trên cùng máy
+active_conversations = create_session_store(
+    finalize_sessions,
+    backend=os.getenv('SESSION_BACKEND', 'memory'),
+    db_path=os.getenv('SESSION_DB_PATH', 'sessions.db'),
+    idle_ttl=float(os.getenv('SESSION_IDLE_TTL', 1800)),
+    max_entries=int(os.getenv('SESSION_MAX_ENTRIES', 10000)),
+    sweep_interval=float(os.getenv('SESSION_SWEEP_INTERVAL', 60)),
+    sweep_batch_size=int(os.getenv('SESSION_SWEEP_BATCH_SIZE', 100)),
+)
+active_conversations.start()
+atexit.register(active_conversations.close)
 
 # Database initialization
 def init_db():
-    conn = sqlite3.connect('chatbot.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT,
-            session_id TEXT,
-            message TEXT,
-            response TEXT,
-            sentiment TEXT,
-            confidence REAL,
-            fragrance_recommendation TEXT,
-            conversation_state TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    # Bảng conversations và index (các bảng của UserDatabase đã được migrate khi khởi tạo)
+    init_app_schema(db_connections)
 
 # Initialize database
 init_db()
 
+# Ghi conversations theo lô ở luồng nền (CONVERSATION_WRITER=sync: ghi ngay trên luồng request)
+conversation_writer = ConversationWriter(
+    connections=db_connections,
+    batch_size=int(os.getenv('CONVERSATION_BATCH_SIZE', 100)),
+    flush_interval_ms=float(os.getenv('CONVERSATION_FLUSH_MS', 50)),
+    synchronous=os.getenv('CONVERSATION_WRITER', 'async') == 'sync',
+)
+atexit.register(conversation_writer.close)
+
 app_logger.info("🚀 EmotionAI Chatbot khởi động thành công")
 
+# user_id do client gửi: giới hạn độ dài trước khi vào log, session store và database
+USER_ID_MAX_BYTES = min(int(os.getenv('USER_ID_MAX_BYTES', 256)), MAX_USER_ID_BYTES)
+
+def user_id_error(user_id):
+    """Lý do user_id không hợp lệ (None nếu hợp lệ)"""
+    if not isinstance(user_id, str) or not user_id:
+        return 'user_id phải là chuỗi không rỗng'
+    if len(user_id.encode('utf-8')) > USER_ID_MAX_BYTES:
+        return f'user_id dài quá {USER_ID_MAX_BYTES} byte'
+    return None
+
 def get_or_create_conversation(user_id: str):
     """Lấy hoặc tạo conversation mới cho user"""
-    if user_id not in active_conversations:
-        # Tạo session mới
-        session_id = str(uuid.uuid4())
-        user_db.create_session(user_id, session_id)
-        
-        # Tạo state machine mới
-        state_machine = ConversationStateMachine()
-        state_machine.reset_conversation(user_id)
-        
-        active_conversations[user_id] = {
-            'session_id': session_id,
-            'state_machine': state_machine,
-            'emotions_discussed': [],
-            'fragrances_suggested': []
-        }
-        
-        app_logger.info(f"🆕 Tạo conversation mới cho user: {user_id}, session: {session_id}")
+    conversation = active_conversations.get(user_id)
+    if conversation is None:
+        def create_conversation():
+            # Tạo session mới
+            session_id = str(uuid.uuid4())
+            user_db.create_session(user_id, session_id)
+            app_logger.info(f"🆕 Tạo conversation mới cho user: {user_id}, session: {session_id}")
+            # Bản ghi gọn (state, cảm xúc, lịch sử id); state machine được dựng lại khi xử lý tin nhắn
+            return ConversationRecord(user_id, session_id)
+        
+        conversation = active_conversations.get_or_create(user_id, create_conversation)
     else:
         app_logger.debug(f"📝 Sử dụng conversation hiện có cho user: {user_id}")
     
-    return active_conversations[user_id]
+    return conversation
+
+# Lexicon polarity biên dịch sẵn (utils/polarity_lexicon.json), nạp vài ms khi worker khởi động
+polarity_scorer = PolarityScorer()
 
 def analyze_sentiment(text):
     """Phân tích cảm xúc của văn bản"""
     try:
-        blob = TextBlob(text)
-        polarity = blob.sentiment.polarity
-        
-        if polarity > 0.1:
-            sentiment = "positive"
-            confidence = abs(polarity)
-        elif polarity < -0.1:
-            sentiment = "negative"
-            confidence = abs(polarity)
-        else:
-            sentiment = "neutral"
-            confidence = 1 - abs(polarity)
-        
-        app_logger.debug(f"🔍 TextBlob analysis: '{text[:50]}...' -> {sentiment} ({confidence:.3f})")
+        sentiment, confidence = polarity_label(polarity_scorer.polarity(text))
+        app_logger.debug(f"🔍 Polarity analysis: '{text[:50]}...' -> {sentiment} ({confidence:.3f})")
         return sentiment, confidence
         
     except Exception as e:
         app_logger.error(f"❌ Lỗi phân tích sentiment: {e}")
         return "neutral", 0.0
 
+# Polarity fallback chỉ chạy khi state machine và lexicon cảm xúc không quyết định được
+# (SENTIMENT_FALLBACK=async: response không chờ fallback, kết quả chỉ đi vào dòng conversations)
+sentiment_pipeline = SentimentPipeline(analyze_sentiment, mode=os.getenv('SENTIMENT_FALLBACK', 'lazy'))
+atexit.register(sentiment_pipeline.close)
+
 def get_fragrance_recommendation(sentiment, confidence, user_id=None):
     """Lấy gợi ý nến thơm dựa trên cảm xúc và lịch sử user"""
     # Kiểm tra gợi ý cá nhân hóa trước
     if user_id:
         personalized_fragrance = user_db.get_personalized_suggestion(user_id, sentiment)
         if personalized_fragrance:
-            emotion_fragrances = fragrance_db.get_fragrances(sentiment)
+            emotion_fragrances = fragrance_catalog.get_fragrances(sentiment)
             for fragrance in emotion_fragrances:
                 if isinstance(fragrance, dict) and fragrance.get('name') == personalized_fragrance:
                     return {
@@ -152,7 +195,7 @@ def get_fragrance_recommendation(sentiment, confidence, user_id=None):
                         'personalized': True
                     }
     # Nếu không có gợi ý cá nhân hóa, dùng logic mặc định
-    emotion_fragrances = fragrance_db.get_fragrances(sentiment)
+    emotion_fragrances = fragrance_catalog.get_fragrances(sentiment)
     import random
     if emotion_fragrances:
         selected_fragrance = random.choice(emotion_fragrances)
@@ -165,31 +208,133 @@ def get_fragrance_recommendation(sentiment, confidence, user_id=None):
     else:
         return None
 
+def get_fragrance_names(fragrance_ids):
+    """Đổi id nến thơm trong bản ghi hội thoại thành tên (bỏ qua nến đã bị xóa)"""
+    names = []
+    for fragrance_id in fragrance_ids:
+        fragrance = fragrance_catalog.get_fragrance_by_id(fragrance_id)
+        if fragrance:
+            names.append(fragrance['name'])
+    return names
+
 def save_conversation(user_id, session_id, message, response, sentiment, confidence, fragrance_rec=None, conversation_state=None):
-    """Lưu cuộc trò chuyện vào database"""
-    conn = sqlite3.connect('chatbot.db')
-    cursor = conn.cursor()
-    
+    """Lưu cuộc trò chuyện vào database (đưa vào hàng đợi, ghi theo lô)"""
     # Convert fragrance recommendation to JSON string if it exists
     fragrance_json = json.dumps(fragrance_rec) if fragrance_rec else None
     
-    cursor.execute('''
-        INSERT INTO conversations (user_id, session_id, message, response, sentiment, confidence, fragrance_recommendation, conversation_state)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, session_id, message, response, sentiment, confidence, fragrance_json, conversation_state))
-    conn.commit()
-    conn.close()
+    conversation_writer.write(
+        (user_id, session_id, message, response, sentiment, confidence, fragrance_json, conversation_state)
+    )
 
 @app.route('/')
 def home():
     return render_template('index.html')
 
+def process_chat_message(user_id: str, message: str):
+    """Xử lý một tin nhắn của user (caller giữ khóa của user) và trả về dữ liệu response"""
+    # Lấy hoặc tạo conversation cho user
+    conversation = get_or_create_conversation(user_id)
+    state_machine = conversation.state_machine()
+    session_id = conversation.session_id
+    
+    # Log state trước khi xử lý
+    previous_state = state_machine.get_current_state()
+    api_logger.debug(f"🔄 State transition - User: {user_id}, From: {previous_state}")
+    
+    # Xử lý tin nhắn qua state machine
+    state_response = state_machine.process_message(message)
+    conversation.update_from(state_machine)
+    bot_response = state_response['response']
+    current_state = state_response['state']
+    suggestions = state_response.get('suggestions', [])
+    
+    # Log state transition
+    if previous_state != current_state:
+        api_logger.info(f"🔄 State changed - User: {user_id}, {previous_state} -> {current_state}")
+    
+    # Phân tích cảm xúc theo tầng: state machine -> lexicon -> polarity fallback (chỉ khi cần)
+    sentiment_result = sentiment_pipeline.analyze(message, state_machine)
+    sentiment, confidence = sentiment_result.sentiment, sentiment_result.confidence
+    
+    # Lấy emotion từ state machine nếu có
+    detected_emotion, emotion_confidence = state_machine.get_detected_emotion()
+    if detected_emotion:
+        api_logger.info(f"🎯 Emotion detected - User: {user_id}, Emotion: {sentiment}, Confidence: {confidence:.3f}")
+    
+    # Lấy gợi ý nến thơm nếu user đồng ý nhận gợi ý (chỉ đọc: preference, catalog)
+    fragrance_recommendation = None
+    if current_state == 'suggest_fragrance' and detected_emotion:
+        fragrance_recommendation = get_fragrance_recommendation(detected_emotion, emotion_confidence, user_id)
+        if fragrance_recommendation:
+            conversation.add_fragrance(fragrance_recommendation['fragrance']['id'])
+            api_logger.info(f"🕯️ Fragrance suggested - User: {user_id}, Emotion: {detected_emotion}, "
+                            f"Fragrance: {fragrance_recommendation['fragrance']['name']}")
+    
+    # Cập nhật danh sách emotions discussed
+    if 'emotion' in state_response:
+        conversation.add_emotion(state_response['emotion'])
+    
+    # Các lệnh ghi SQLite của lượt chat là một unit of work (một commit), chỉ bao quanh phần ghi:
+    # state machine, sentiment và catalog chạy trước nên khóa ghi chỉ giữ trong lúc ghi.
+    # BEGIN IMMEDIATE vì get_or_create_user đọc rồi ghi (xem SQLiteConnectionManager.transaction)
+    user_data = None
+    with db_connections.transaction(immediate=True):
+        # Lưu preference nếu có gợi ý nến thơm
+        if fragrance_recommendation:
+            user_db.save_user_preference(user_id, detected_emotion, fragrance_recommendation['fragrance']['name'])
+        
+        # Lưu vào database (fallback async: ghi khi fallback chạy xong ở luồng nền)
+        if sentiment_result.pending is None:
+            save_conversation(
+                user_id, session_id, message, bot_response, 
+                sentiment, confidence, fragrance_recommendation, current_state
+            )
+        
+        if current_state == 'greeting':
+            user_data = user_db.get_or_create_user(user_id)
+    
+    if sentiment_result.pending is not None:
+        sentiment_result.pending.add_done_callback(lambda future: save_conversation(
+            user_id, session_id, message, bot_response,
+            *future.result(), fragrance_recommendation, current_state
+        ))
+    
+    # Ghi state để tin nhắn tiếp theo (có thể ở worker khác) đọc được
+    active_conversations.save(user_id, conversation)
+    
+    # Chuẩn bị response
+    response_data = {
+        'response': bot_response,
+        'state': current_state,
+        'suggestions': suggestions,
+        'sentiment': sentiment,
+        'confidence': round(confidence, 3),
+        'timestamp': datetime.now().isoformat()
+    }
+    
+    # Thêm fragrance recommendation nếu có
+    if fragrance_recommendation:
+        response_data['fragrance_recommendation'] = fragrance_recommendation
+    
+    # Thêm thông tin user nếu là user mới
+    if user_data is not None:
+        response_data['user_info'] = {
+            'is_new_user': user_data['total_conversations'] == 1,
+            'total_conversations': user_data['total_conversations']
+        }
+    
+    return response_data
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     try:
         data = request.get_json()
         message = data.get('message', '')
         user_id = data.get('user_id', 'anonymous')
+        error = user_id_error(user_id)
+        if error:
+            api_logger.warning(f"⚠️ Invalid user_id: {error}")
+            return jsonify({'error': error}), 400
         
         api_logger.info(f"💬 API call - User: {user_id}, Message: '{message[:50]}...'")
         
@@ -197,81 +342,12 @@ def chat():
             api_logger.warning(f"⚠️ Empty message from user: {user_id}")
             return jsonify({'error': 'Tin nhắn không được để trống'}), 400
         
-        # Lấy hoặc tạo conversation cho user
-        conversation = get_or_create_conversation(user_id)
-        state_machine = conversation['state_machine']
-        session_id = conversation['session_id']
-        
-        # Log state trước khi xử lý
-        previous_state = state_machine.get_current_state()
-        api_logger.debug(f"🔄 State transition - User: {user_id}, From: {previous_state}")
-        
-        # Xử lý tin nhắn qua state machine
-        state_response = state_machine.process_message(message)
-        bot_response = state_response['response']
-        current_state = state_response['state']
-        suggestions = state_response.get('suggestions', [])
-        
-        # Log state transition
-        if previous_state != current_state:
-            api_logger.info(f"🔄 State changed - User: {user_id}, {previous_state} -> {current_state}")
-        
-        # Phân tích cảm xúc (backup cho state machine)
-        sentiment, confidence = analyze_sentiment(message)
-        
-        # Lấy emotion từ state machine nếu có
-        detected_emotion, emotion_confidence = state_machine.get_detected_emotion()
-        if detected_emotion:
-            sentiment = detected_emotion
-            confidence = emotion_confidence
-            api_logger.info(f"🎯 Emotion detected - User: {user_id}, Emotion: {sentiment}, Confidence: {confidence:.3f}")
-        
-        # Lấy gợi ý nến thơm nếu user đồng ý nhận gợi ý
-        fragrance_recommendation = None
-        if current_state == 'suggest_fragrance' and detected_emotion:
-            fragrance_recommendation = get_fragrance_recommendation(detected_emotion, emotion_confidence, user_id)
-            
-            # Lưu preference nếu có gợi ý nến thơm
-            if fragrance_recommendation and detected_emotion:
-                fragrance_name = fragrance_recommendation['fragrance']['name']
-                user_db.save_user_preference(user_id, detected_emotion, fragrance_name)
-                conversation['fragrances_suggested'].append(fragrance_name)
-                
-                api_logger.info(f"🕯️ Fragrance suggested - User: {user_id}, Emotion: {detected_emotion}, Fragrance: {fragrance_name}")
-        
-        # Cập nhật danh sách emotions discussed
-        if 'emotion' in state_response:
-            conversation['emotions_discussed'].append(state_response['emotion'])
-        
-        # Lưu vào database
-        save_conversation(
-            user_id, session_id, message, bot_response, 
-            sentiment, confidence, fragrance_recommendation, current_state
-        )
-        
-        # Chuẩn bị response
-        response_data = {
-            'response': bot_response,
-            'state': current_state,
-            'suggestions': suggestions,
-            'sentiment': sentiment,
-            'confidence': round(confidence, 3),
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        # Thêm fragrance recommendation nếu có
-        if fragrance_recommendation:
-            response_data['fragrance_recommendation'] = fragrance_recommendation
-        
-        # Thêm thông tin user nếu là user mới
-        if current_state == 'greeting':
-            user_data = user_db.get_or_create_user(user_id)
-            response_data['user_info'] = {
-                'is_new_user': user_data['total_conversations'] == 1,
-                'total_conversations': user_data['total_conversations']
-            }
+        # Tin nhắn của cùng một user được xử lý tuần tự, kể cả khi đến các worker khác nhau.
+        # Các lệnh ghi SQLite của lượt chat là một transaction ngắn trong process_chat_message
+        with active_conversations.lock(user_id):
+            response_data = process_chat_message(user_id, message)
         
-        api_logger.info(f"✅ API response - User: {user_id}, State: {current_state}, Sentiment: {sentiment}")
+        api_logger.info(f"✅ API response - User: {user_id}, State: {response_data['state']}, Sentiment: {response_data['sentiment']}")
         return jsonify(response_data)
         
     except Exception as e:
@@ -284,20 +360,11 @@ def get_analytics():
     try:
         api_logger.info("📊 Analytics request received")
         
-        conn = sqlite3.connect('chatbot.db')
+        conn = db_connections.connection()
         cursor = conn.cursor()
         
-        # Thống kê tổng quan
-        cursor.execute('SELECT COUNT(*) FROM conversations')
-        total_messages = cursor.fetchone()[0]
-        
-        # Thống kê theo cảm xúc
-        cursor.execute('''
-            SELECT sentiment, COUNT(*) as count, AVG(confidence) as avg_confidence
-            FROM conversations 
-            GROUP BY sentiment
-        ''')
-        sentiment_stats = cursor.fetchall()
+        # Thống kê tổng quan và theo cảm xúc: đọc từ bảng tổng do trigger cập nhật, không quét conversations
+        total_messages, sentiment_stats = sentiment_summary(conn)
         
         # Tin nhắn gần đây với gợi ý nến thơm
         cursor.execute('''
@@ -308,8 +375,6 @@ def get_analytics():
         ''')
         recent_messages = cursor.fetchall()
         
-        conn.close()
-        
         # Process recent messages to include fragrance data
         processed_recent_messages = []
         for row in recent_messages:
@@ -339,6 +404,43 @@ def get_analytics():
         api_logger.error(f"❌ Analytics error: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+# Số điểm tối đa một chuỗi thời gian trả về (bucket được gộp lớn hơn nếu cần)
+ANALYTICS_MAX_POINTS = int(os.getenv('ANALYTICS_MAX_POINTS', 500))
+
+def parse_utc(value):
+    """Đọc thời điểm ISO 8601 (ngày hoặc ngày giờ) thành giờ UTC không kèm múi giờ như trong SQLite"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+@app.route('/api/analytics/timeseries', methods=['GET'])
+def get_analytics_timeseries():
+    """Chuỗi thời gian cảm xúc: ?from=&to= (ISO 8601, UTC, mặc định 7 ngày gần nhất),
+    bucket=auto|hour|day|week, points= (tối đa ANALYTICS_MAX_POINTS)"""
+    try:
+        end = parse_utc(request.args['to']) if request.args.get('to') else datetime.utcnow()
+        start = parse_utc(request.args['from']) if request.args.get('from') else end - timedelta(days=7)
+        max_points = min(int(request.args.get('points', ANALYTICS_MAX_POINTS)), ANALYTICS_MAX_POINTS)
+        if start >= end or max_points < 1:
+            raise ValueError("cần from < to và points >= 1")
+        bucket_hours = choose_bucket_hours(start, end, request.args.get('bucket', 'auto'), max_points)
+    except ValueError as e:
+        return jsonify({'error': f"Tham số không hợp lệ: {e}"}), 400
+    
+    try:
+        api_logger.info(f"📈 Timeseries request - {start} -> {end}, bucket {bucket_hours}h")
+        points = sentiment_timeseries(db_connections.connection(), start, end, bucket_hours)
+        return jsonify({
+            'from': start.isoformat(sep=' '),
+            'to': end.isoformat(sep=' '),
+            'bucket_hours': bucket_hours,
+            'points': points
+        })
+    except Exception as e:
+        api_logger.error(f"❌ Timeseries error: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/user/<user_id>/stats', methods=['GET'])
 def get_user_stats(user_id):
     """Lấy thống kê của user cụ thể"""
@@ -363,13 +465,59 @@ def get_user_preferences(user_id):
         api_logger.error(f"❌ User preferences error - User: {user_id}, Error: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+# Kích thước trang mặc định/tối đa của /api/fragrances
+FRAGRANCE_PAGE_SIZE = int(os.getenv('FRAGRANCE_PAGE_SIZE', 100))
+FRAGRANCE_PAGE_MAX = int(os.getenv('FRAGRANCE_PAGE_MAX', 500))
+
+def fragrance_etag(version, query):
+    """ETag theo phiên bản danh mục và tham số trang: danh mục đổi thì mọi trang đổi ETag"""
+    digest = hashlib.sha1(repr(query).encode('utf-8')).hexdigest()[:12]
+    return f"catalog-{version}-{digest}"
+
 @app.route('/api/fragrances', methods=['GET'])
 def get_fragrances():
-    """Lấy tất cả thông tin nến thơm"""
+    """Danh sách nến thơm, phân trang keyset theo id: ?cursor= (next_cursor của trang trước),
+    limit= (tối đa FRAGRANCE_PAGE_MAX), emotion=, fields=name,emotion (luôn kèm id).
+    Hỗ trợ If-None-Match: client đã có đúng phiên bản danh mục nhận 304, không đọc danh mục"""
+    try:
+        emotion = request.args.get('emotion') or None
+        after_id = int(request.args['cursor']) if request.args.get('cursor') else None
+        limit = int(request.args.get('limit', FRAGRANCE_PAGE_SIZE))
+        if not 1 <= limit <= FRAGRANCE_PAGE_MAX:
+            raise ValueError(f"limit phải từ 1 đến {FRAGRANCE_PAGE_MAX}")
+        fields = None
+        if request.args.get('fields'):
+            requested = {field.strip() for field in request.args['fields'].split(',') if field.strip()}
+            unknown = requested - set(FRAGRANCE_COLUMNS)
+            if unknown:
+                raise ValueError(f"fields không hỗ trợ: {', '.join(sorted(unknown))}")
+            fields = tuple(column for column in FRAGRANCE_COLUMNS if column == 'id' or column in requested)
+    except ValueError as e:
+        return jsonify({'error': f"Tham số không hợp lệ: {e}"}), 400
+
+    query = (emotion, after_id, limit, fields)
     try:
-        all_fragrances = fragrance_db.get_fragrances()
-        return jsonify({'fragrances': all_fragrances})
+        # Phiên bản nằm sẵn trong bộ nhớ: so ETag trước khi đọc danh mục
+        version = fragrance_catalog.version
+        if version is not None and request.if_none_match.contains_weak(fragrance_etag(version, query)):
+            response = app.response_class(status=304)
+            response.set_etag(fragrance_etag(version, query))
+            return response
+
+        rows, next_after, version = fragrance_catalog.page(after_id, limit, emotion)
+        if fields is not None:
+            rows = [{field: row.get(field) for field in fields} for row in rows]
+        response = jsonify({
+            'fragrances': rows,
+            'next_cursor': str(next_after) if next_after is not None else None,
+            'version': version
+        })
+        if version is not None:
+            response.set_etag(fragrance_etag(version, query))
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
+        api_logger.error(f"❌ Fragrances error: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/fragrance/<emotion>', methods=['GET'])
@@ -390,21 +538,23 @@ def end_conversation():
     try:
         data = request.get_json()
         user_id = data.get('user_id')
-        
-        if user_id in active_conversations:
-            conversation = active_conversations[user_id]
-            session_id = conversation['session_id']
+        error = user_id_error(user_id)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Gỡ khỏi active conversations (chờ tin nhắn đang xử lý của user xong trước)
+        with active_conversations.lock(user_id):
+            conversation = active_conversations.pop(user_id)
+        if conversation is not None:
+            session_id = conversation.session_id
             
             # Kết thúc session
             user_db.end_session(
                 session_id,
-                conversation['emotions_discussed'],
-                conversation['fragrances_suggested']
+                conversation.emotions_discussed,
+                get_fragrance_names(conversation.fragrance_ids)
             )
             
-            # Xóa khỏi active conversations
-            del active_conversations[user_id]
-            
             return jsonify({'message': 'Conversation ended successfully'})
         else:
             return jsonify({'error': 'No active conversation found'}), 404
@@ -412,6 +562,24 @@ def end_conversation():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Lấy số liệu vận hành (cache phát hiện cảm xúc, ...)"""
+    try:
+        return jsonify({
+            'emotion_cache': ConversationStateMachine.cache_stats(),
+            'sessions': active_conversations.stats(),
+            'conversation_writer': conversation_writer.stats(),
+            'database': db_connections.stats(),
+            'suggestion_cache': user_db.suggestion_cache.stats() if user_db.suggestion_cache else None,
+            'sentiment': sentiment_pipeline.stats(),
+            'fragrance_catalog': fragrance_catalog.stats(),
+            'fragrance_store': fragrance_db.stats()
+        })
+    except Exception as e:
+        api_logger.error(f"❌ Metrics error: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
     """Lấy log entries gần đây"""
@@ -472,12 +640,44 @@ def add_fragrance():
         image_url = data.get('image_url')
         if not all([name, emotion]):
             return jsonify({'error': 'Thiếu tên hoặc cảm xúc'}), 400
-        new_fragrance = fragrance_db.add_fragrance(name, description, emotion, image_url)
+        new_fragrance = fragrance_catalog.add_fragrance(name, description, emotion, image_url)
         return jsonify({'fragrance': new_fragrance}), 201
     except Exception as e:
         import traceback
         api_logger.error(f"❌ Error in add_fragrance: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': str(e), 'trace': traceback.format_exc()}), 500
 
+def flag_arg(name):
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+@app.route('/api/fragrance/import', methods=['POST'])
+def import_fragrance_catalog():
+    """Import danh mục nến thơm hàng loạt (admin): CSV hoặc NDJSON, một transaction
+
+    Body là file upload (field 'file') hoặc nội dung thô (Content-Type text/csv hoặc application/x-ndjson).
+    Query: format=csv|ndjson, dedupe=1 (bỏ dòng trùng tên + cảm xúc), skip_invalid=1 (bỏ qua dòng lỗi).
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            binary, filename, content_type = upload.stream, upload.filename, upload.mimetype
+        else:
+            binary, filename, content_type = io.BufferedReader(request.stream), None, request.mimetype
+        fmt = request.args.get('format') or detect_format(filename, content_type)
+        # Đọc dần request: không nạp cả file vào bộ nhớ
+        stream = io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+        report = import_fragrances(fragrance_catalog, stream, fmt,
+                                   dedupe=flag_arg('dedupe'), skip_invalid=flag_arg('skip_invalid'))
+        api_logger.info(f"📦 Fragrance import - Inserted: {report['inserted']}, Duplicates: {report['duplicates']}, "
+                        f"Invalid: {report['invalid']}")
+        return jsonify(report), 201
+    except FragranceImportError as e:
+        return jsonify({'error': str(e), 'invalid': e.invalid, 'errors': e.errors}), 400
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        api_logger.error(f"❌ Fragrance import error: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
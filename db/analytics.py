@@ -0,0 +1,206 @@
+"""
+Analytics Rollups - Thống kê cảm xúc tổng hợp sẵn cho /api/analytics
+File này chứa schema rollup (theo giờ và tổng toàn thời gian cho mỗi sentiment), được trigger
+trên conversations cập nhật trong cùng transaction ghi, cùng hàm đọc (tổng, chuỗi thời gian
+đã gộp bucket) và hàm dựng lại từ dữ liệu gốc
+"""
+
+import logging
+import math
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from db.connection import SQLiteConnectionManager
+
+db_logger = logging.getLogger('emotionai.database')
+
+# sentiment NULL lưu thành '' để khóa chính gộp được (NULL luôn khác NULL)
+ROLLUP_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS conversation_rollups (
+        bucket TEXT NOT NULL,
+        sentiment TEXT NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        confidence_sum REAL NOT NULL DEFAULT 0,
+        confidence_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (bucket, sentiment)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS conversation_totals (
+        sentiment TEXT PRIMARY KEY,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        confidence_sum REAL NOT NULL DEFAULT 0,
+        confidence_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS trg_conversations_rollup AFTER INSERT ON conversations
+    BEGIN
+        INSERT INTO conversation_rollups (bucket, sentiment, message_count, confidence_sum, confidence_count)
+        VALUES (COALESCE(strftime('%Y-%m-%d %H:00:00', NEW.timestamp), ''), COALESCE(NEW.sentiment, ''),
+                1, COALESCE(NEW.confidence, 0), NEW.confidence IS NOT NULL)
+        ON CONFLICT (bucket, sentiment) DO UPDATE SET
+            message_count = message_count + 1,
+            confidence_sum = confidence_sum + excluded.confidence_sum,
+            confidence_count = confidence_count + excluded.confidence_count;
+        INSERT INTO conversation_totals (sentiment, message_count, confidence_sum, confidence_count)
+        VALUES (COALESCE(NEW.sentiment, ''), 1, COALESCE(NEW.confidence, 0), NEW.confidence IS NOT NULL)
+        ON CONFLICT (sentiment) DO UPDATE SET
+            message_count = message_count + 1,
+            confidence_sum = confidence_sum + excluded.confidence_sum,
+            confidence_count = confidence_count + excluded.confidence_count;
+    END
+    ''',
+)
+
+
+# Trigger hiện tại: thêm số lần gợi ý nến thơm theo giờ (migration 6)
+ROLLUP_TRIGGER = '''
+    CREATE TRIGGER IF NOT EXISTS trg_conversations_rollup AFTER INSERT ON conversations
+    BEGIN
+        INSERT INTO conversation_rollups (bucket, sentiment, message_count, confidence_sum, confidence_count,
+                                          fragrance_count)
+        VALUES (COALESCE(strftime('%Y-%m-%d %H:00:00', NEW.timestamp), ''), COALESCE(NEW.sentiment, ''),
+                1, COALESCE(NEW.confidence, 0), NEW.confidence IS NOT NULL,
+                NEW.fragrance_recommendation IS NOT NULL)
+        ON CONFLICT (bucket, sentiment) DO UPDATE SET
+            message_count = message_count + 1,
+            confidence_sum = confidence_sum + excluded.confidence_sum,
+            confidence_count = confidence_count + excluded.confidence_count,
+            fragrance_count = fragrance_count + excluded.fragrance_count;
+        INSERT INTO conversation_totals (sentiment, message_count, confidence_sum, confidence_count)
+        VALUES (COALESCE(NEW.sentiment, ''), 1, COALESCE(NEW.confidence, 0), NEW.confidence IS NOT NULL)
+        ON CONFLICT (sentiment) DO UPDATE SET
+            message_count = message_count + 1,
+            confidence_sum = confidence_sum + excluded.confidence_sum,
+            confidence_count = confidence_count + excluded.confidence_count;
+    END
+'''
+
+# Độ rộng bucket (giờ) khi gộp chuỗi thời gian: chọn mức nhỏ nhất không vượt số điểm tối đa
+BUCKET_HOURS = {'hour': 1, 'day': 24, 'week': 168}
+NICE_BUCKET_HOURS = (1, 2, 3, 6, 12, 24, 48, 168, 336, 720)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def create_rollups(cursor: sqlite3.Cursor):
+    """Tạo bảng rollup và trigger (migration 5; migration 6 điền dữ liệu)"""
+    for statement in ROLLUP_SCHEMA:
+        cursor.execute(statement)
+
+
+def add_fragrance_counts(cursor: sqlite3.Cursor):
+    """Thêm số lần gợi ý nến thơm vào rollup theo giờ và điền lại từ conversations (migration 6)"""
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(conversation_rollups)')}
+    if 'fragrance_count' not in columns:
+        cursor.execute('ALTER TABLE conversation_rollups ADD COLUMN fragrance_count INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('DROP TRIGGER IF EXISTS trg_conversations_rollup')
+    cursor.execute(ROLLUP_TRIGGER)
+    _rebuild(cursor)
+
+
+def _rebuild(cursor: sqlite3.Cursor) -> int:
+    cursor.execute('DELETE FROM conversation_rollups')
+    cursor.execute('DELETE FROM conversation_totals')
+    cursor.execute('''
+        INSERT INTO conversation_rollups (bucket, sentiment, message_count, confidence_sum, confidence_count,
+                                          fragrance_count)
+        SELECT COALESCE(strftime('%Y-%m-%d %H:00:00', timestamp), ''), COALESCE(sentiment, ''),
+               COUNT(*), COALESCE(SUM(confidence), 0), COUNT(confidence), COUNT(fragrance_recommendation)
+        FROM conversations
+        GROUP BY 1, 2
+    ''')
+    buckets = cursor.rowcount
+    cursor.execute('''
+        INSERT INTO conversation_totals (sentiment, message_count, confidence_sum, confidence_count)
+        SELECT sentiment, SUM(message_count), SUM(confidence_sum), SUM(confidence_count)
+        FROM conversation_rollups
+        GROUP BY sentiment
+    ''')
+    return buckets
+
+
+def rebuild_rollups(connections: SQLiteConnectionManager) -> int:
+    """Dựng lại rollup từ các dòng conversations gốc trong một transaction, trả về số bucket"""
+    with connections.transaction() as conn:
+        buckets = _rebuild(conn.cursor())
+    db_logger.info(f"📊 Dựng lại {buckets} bucket rollup từ conversations")
+    return buckets
+
+
+def sentiment_summary(conn: sqlite3.Connection) -> Tuple[int, List[Tuple[Optional[str], int, Optional[float]]]]:
+    """Tổng số tin nhắn và (sentiment, số tin nhắn, confidence trung bình) từ bảng tổng"""
+    rows = conn.execute('''
+        SELECT NULLIF(sentiment, ''), message_count,
+               CASE WHEN confidence_count > 0 THEN confidence_sum / confidence_count END
+        FROM conversation_totals
+        WHERE message_count > 0
+        ORDER BY sentiment
+    ''').fetchall()
+    return sum(row[1] for row in rows), rows
+
+
+
+def _align(start: datetime, bucket_hours: int) -> datetime:
+    """Làm tròn xuống đầu giờ (đầu ngày nếu bucket >= 1 ngày)"""
+    start = start.replace(minute=0, second=0, microsecond=0)
+    return start.replace(hour=0) if bucket_hours >= 24 else start
+
+
+def _slot_count(start: datetime, end: datetime, bucket_hours: int) -> int:
+    return max(1, math.ceil((end - _align(start, bucket_hours)).total_seconds() / 3600 / bucket_hours))
+
+
+def choose_bucket_hours(start: datetime, end: datetime, bucket: str = 'auto', max_points: int = 500) -> int:
+    """Độ rộng bucket (giờ) cho khoảng [start, end): ít nhất bằng bucket yêu cầu, tối đa max_points điểm"""
+    if bucket != 'auto' and bucket not in BUCKET_HOURS:
+        raise ValueError(f"bucket phải là auto, {', '.join(BUCKET_HOURS)}")
+    minimum = BUCKET_HOURS.get(bucket, 1)
+    for hours in NICE_BUCKET_HOURS:
+        if hours >= minimum and _slot_count(start, end, hours) <= max_points:
+            return hours
+    # Khoảng rất dài: bội số của một ngày
+    hours = math.ceil(max(minimum, (end - start).total_seconds() / 3600 / max_points) / 24) * 24
+    while _slot_count(start, end, hours) > max_points:
+        hours += 24
+    return hours
+
+
+def sentiment_timeseries(conn: sqlite3.Connection, start: datetime, end: datetime,
+                         bucket_hours: int) -> List[Dict]:
+    """Chuỗi thời gian từ rollup theo giờ trong [start, end), gộp thành bucket bucket_hours giờ
+
+    Đọc bằng range scan trên khóa chính (bucket, sentiment); bucket rỗng trả về số 0 để
+    biểu đồ có trục thời gian đều. start được làm tròn xuống đầu giờ (đầu ngày nếu bucket >= 1 ngày).
+    """
+    slots = _slot_count(start, end, bucket_hours)
+    start = _align(start, bucket_hours)
+    width = timedelta(hours=bucket_hours)
+    points = [{
+        'start': (start + width * slot).strftime(TIMESTAMP_FORMAT),
+        'total': 0,
+        'fragrance_suggestions': 0,
+        'sentiments': {},
+    } for slot in range(slots)]
+
+    rows = conn.execute('''
+        SELECT CAST(ROUND((julianday(bucket) - julianday(?)) * 24) AS INTEGER) / ? AS slot,
+               NULLIF(sentiment, ''), SUM(message_count), SUM(confidence_sum), SUM(confidence_count),
+               SUM(fragrance_count)
+        FROM conversation_rollups
+        WHERE bucket >= ? AND bucket < ?
+        GROUP BY slot, sentiment
+    ''', (start.strftime(TIMESTAMP_FORMAT), bucket_hours,
+          start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT))).fetchall()
+
+    for slot, sentiment, count, confidence_sum, confidence_count, fragrance_count in rows:
+        point = points[slot]
+        point['total'] += count
+        point['fragrance_suggestions'] += fragrance_count
+        point['sentiments'][sentiment] = {
+            'count': count,
+            'avg_confidence': round(confidence_sum / confidence_count, 3) if confidence_count else None,
+        }
+    return points
@@ -0,0 +1,158 @@
+"""
+Connection Manager - Quản lý kết nối SQLite dùng chung cho UserDatabase, app.py và các store
+File này chứa SQLiteConnectionManager: mỗi luồng một kết nối, cấu hình một lần với WAL
+(reader không bị chặn sau writer), busy timeout, synchronous và cache prepared statement
+"""
+
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+db_logger = logging.getLogger('emotionai.database')
+
+
+class SQLiteConnectionManager:
+    """Kết nối thread-local tới một file SQLite, dùng lại trong suốt vòng đời của luồng"""
+
+    def __init__(self, db_path: str = 'chatbot.db', busy_timeout_ms: int = 5000, synchronous: str = 'NORMAL',
+                 cached_statements: int = 256, journal_mode: str = 'WAL', isolation_level: Optional[str] = ''):
+        self.db_path = db_path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+        self.cached_statements = cached_statements
+        self.journal_mode = journal_mode
+        # '' là mặc định của sqlite3 (transaction ngầm cho lệnh ghi); None là autocommit
+        self.isolation_level = isolation_level
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Kết nối đã mở theo luồng, để đóng khi tắt và dọn kết nối của luồng đã kết thúc
+        self._connections: List[Tuple[threading.Thread, sqlite3.Connection]] = []
+
+        self.connections_opened = 0
+        self.transactions = 0
+        self.rollbacks = 0
+
+    def connection(self) -> sqlite3.Connection:
+        """Kết nối của luồng hiện tại (mở và cấu hình ở lần gọi đầu tiên)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000.0,
+                               isolation_level=self.isolation_level, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+
+        with self._lock:
+            alive = []
+            for thread, other in self._connections:
+                if thread.is_alive():
+                    alive.append((thread, other))
+                else:
+                    other.close()
+            alive.append((threading.current_thread(), conn))
+            self._connections = alive
+            self.connections_opened += 1
+        db_logger.debug(f"🔌 Mở kết nối SQLite {self.db_path} ({self.journal_mode}, synchronous={self.synchronous})")
+        return conn
+
+    @contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """Commit khi khối lệnh thành công, rollback khi có lỗi
+
+        Lồng được: transaction bên trong (ví dụ các lệnh của UserDatabase trong một request)
+        chỉ là SAVEPOINT của transaction ngoài cùng, nên cả request là một unit of work,
+        một lần commit trên một kết nối. Lỗi bên trong chỉ hoàn tác phần của nó.
+
+        immediate=True (transaction ngoài cùng): BEGIN IMMEDIATE lấy khóa ghi ngay (chờ theo
+        busy timeout). Cần khi đọc rồi mới ghi: với BEGIN thường, writer khác commit xen giữa
+        thì lệnh ghi lỗi "database is locked" ngay, busy timeout không giúp được vì SQLite
+        không nâng snapshot đọc đã cũ lên ghi.
+        """
+        conn = self.connection()
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            savepoint = f'uow_{depth}'
+            conn.execute(f'SAVEPOINT {savepoint}')
+            self._local.depth = depth + 1
+            # Callback đăng ký trong SAVEPOINT bị rollback cũng bị bỏ
+            pending = len(self._local.after_commit)
+            try:
+                yield conn
+            except BaseException:
+                conn.execute(f'ROLLBACK TO {savepoint}')
+                conn.execute(f'RELEASE {savepoint}')
+                del self._local.after_commit[pending:]
+                raise
+            else:
+                conn.execute(f'RELEASE {savepoint}')
+            finally:
+                self._local.depth = depth
+            return
+
+        # BEGIN tường minh để SAVEPOINT bên trong không tự mở (và tự commit) transaction riêng
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        self._local.depth = 1
+        self._local.after_commit = []
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            self.rollbacks += 1
+            raise
+        else:
+            conn.commit()
+            self.transactions += 1
+        finally:
+            self._local.depth = 0
+            callbacks, self._local.after_commit = self._local.after_commit, []
+        for callback in callbacks:
+            self._run_after_commit(callback)
+
+    def after_commit(self, callback: Callable[[], None]):
+        """Chạy callback khi transaction ngoài cùng của luồng này commit (ngay nếu không trong transaction)
+
+        Dùng để cập nhật cache theo dữ liệu đã commit: transaction (hoặc SAVEPOINT) bị rollback
+        thì callback bị bỏ, cache không giữ giá trị chưa bao giờ được ghi.
+        """
+        if getattr(self._local, 'depth', 0):
+            self._local.after_commit.append(callback)
+        else:
+            self._run_after_commit(callback)
+
+    @staticmethod
+    def _run_after_commit(callback: Callable[[], None]):
+        # Dữ liệu đã commit: lỗi của callback không được làm caller tưởng transaction thất bại
+        try:
+            callback()
+        except Exception as e:
+            db_logger.warning(f"⚠️ Callback sau commit lỗi: {e}")
+
+    def close(self):
+        """Đóng mọi kết nối đã mở (gọi khi worker tắt)"""
+        with self._lock:
+            for _, conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def stats(self) -> Dict:
+        """Số liệu: số kết nối đang mở, số transaction đã commit/rollback"""
+        with self._lock:
+            open_connections = len(self._connections)
+        return {
+            'db_path': self.db_path,
+            'journal_mode': self.journal_mode,
+            'open_connections': open_connections,
+            'connections_opened': self.connections_opened,
+            'transactions': self.transactions,
+            'rollbacks': self.rollbacks,
+        }
@@ -0,0 +1,141 @@
+"""
+Conversation Writer - Ghi tin nhắn vào bảng conversations theo lô (write-behind)
+File này chứa ConversationWriter: request chỉ đưa dòng vào hàng đợi, luồng nền gom lại
+và ghi bằng executemany trong một transaction khi đủ lô hoặc sau mỗi khoảng flush
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from db.connection import SQLiteConnectionManager
+
+db_logger = logging.getLogger('emotionai.database')
+
+# (user_id, session_id, message, response, sentiment, confidence, fragrance_json, conversation_state)
+ConversationRow = Tuple
+
+INSERT_CONVERSATION = '''
+    INSERT INTO conversations (user_id, session_id, message, response, sentiment, confidence, fragrance_recommendation, conversation_state)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class ConversationWriter:
+    """Hàng đợi ghi conversations: flush theo batch_size hoặc mỗi flush_interval_ms
+
+    synchronous=True ghi ngay trên luồng gọi (dùng cho test và script).
+    """
+
+    def __init__(self, db_path: str = 'chatbot.db', batch_size: int = 100, flush_interval_ms: float = 50,
+                 max_queue: int = 10000, synchronous: bool = False,
+                 connections: Optional[SQLiteConnectionManager] = None):
+        # Manager do caller truyền vào (dùng chung với UserDatabase) thì caller tự đóng
+        self._owns_connections = connections is None
+        self.connections = connections or SQLiteConnectionManager(db_path)
+        self.db_path = self.connections.db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.synchronous = synchronous
+        # Hàng đợi có giới hạn: khi database chậm, request bị chặn lại thay vì làm đầy bộ nhớ
+        self._queue: "queue.Queue[Optional[ConversationRow]]" = queue.Queue(maxsize=max_queue)
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.batches = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+        if not synchronous:
+            self._thread = threading.Thread(target=self._run, name='conversation-writer', daemon=True)
+            self._thread.start()
+
+    def write(self, row: ConversationRow):
+        """Ghi một dòng (bất đồng bộ: chỉ đưa vào hàng đợi)"""
+        if self.synchronous:
+            self._write_batch([row])
+        else:
+            self._queue.put(row)
+
+    def flush(self):
+        """Chờ đến khi mọi dòng đã đưa vào hàng đợi được ghi xong"""
+        if not self.synchronous:
+            self._queue.join()
+
+    def close(self):
+        """Ghi nốt hàng đợi rồi dừng luồng nền (gọi khi worker tắt)"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            # Dòng đến sau khi đóng (request còn dở lúc tắt) được ghi trực tiếp
+            self.synchronous = True
+        if self._owns_connections:
+            with self._flush_lock:
+                self.connections.close()
+
+    def _run(self):
+        """Luồng nền: chờ dòng đầu tiên, gom thêm đến batch_size hoặc hết flush_interval rồi ghi"""
+        stopping = False
+        while not stopping:
+            row = self._queue.get()
+            if row is None:
+                self._queue.task_done()
+                break
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            self._write_batch(batch)
+            # task_done cho cả dòng None (nếu có) để flush() không chờ mãi
+            for _ in range(len(batch) + (1 if stopping else 0)):
+                self._queue.task_done()
+
+    def _write_batch(self, batch: List[ConversationRow]):
+        """Ghi một lô bằng executemany trong một transaction"""
+        start = time.perf_counter()
+        with self._flush_lock:
+            try:
+                with self.connections.transaction() as conn:
+                    conn.executemany(INSERT_CONVERSATION, batch)
+                self.rows_written += len(batch)
+            except Exception as e:
+                self.rows_failed += len(batch)
+                db_logger.error(f"❌ Lỗi ghi {len(batch)} conversation: {e}", exc_info=True)
+                return
+            finally:
+                elapsed = time.perf_counter() - start
+                self.batches += 1
+                self.last_flush_seconds = elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+                self.total_flush_seconds += elapsed
+        db_logger.debug(f"💾 Ghi {len(batch)} conversation trong {elapsed * 1000:.1f}ms")
+
+    def stats(self) -> Dict:
+        """Số liệu: độ sâu hàng đợi, số dòng đã ghi/lỗi, thời gian flush"""
+        return {
+            'mode': 'sync' if self.synchronous else 'async',
+            'queue_depth': self._queue.qsize(),
+            'rows_written': self.rows_written,
+            'rows_failed': self.rows_failed,
+            'batches': self.batches,
+            'avg_batch_size': round(self.rows_written / self.batches, 2) if self.batches else 0,
+            'last_flush_ms': round(self.last_flush_seconds * 1000, 3),
+            'max_flush_ms': round(self.max_flush_seconds * 1000, 3),
+            'avg_flush_ms': round(self.total_flush_seconds / self.batches * 1000, 3) if self.batches else 0,
+        }
@@ -0,0 +1,179 @@
+"""
+Fragrance Catalog - Cache danh mục nến thơm trong bộ nhớ của worker, làm mới theo phiên bản
+File này chứa FragranceCatalog: snapshot bất biến (theo cảm xúc và theo id) được thay nguyên
+khối khi phiên bản danh mục trong database đổi (add_fragrance, trigger trên bảng fragrances).
+Luồng nền poll phiên bản; người đọc chỉ đọc snapshot hiện tại nên không bao giờ chờ refresh
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+db_logger = logging.getLogger('emotionai.database')
+
+
+class CatalogSnapshot:
+    """Danh mục tại một phiên bản; không sửa sau khi tạo (đọc từ nhiều luồng không cần khóa)"""
+
+    __slots__ = ('version', 'fragrances', 'by_id', 'by_emotion', 'ids', 'ids_by_emotion', 'loaded_at')
+
+    def __init__(self, version: Optional[int], fragrances: List[Dict]):
+        self.version = version
+        # Sắp theo id để phân trang keyset bằng bisect
+        self.fragrances: Tuple[Dict, ...] = tuple(sorted(fragrances, key=lambda fragrance: fragrance['id']))
+        self.by_id: Dict = {fragrance['id']: fragrance for fragrance in self.fragrances}
+        by_emotion: Dict[str, List[Dict]] = {}
+        for fragrance in self.fragrances:
+            by_emotion.setdefault(fragrance.get('emotion'), []).append(fragrance)
+        self.by_emotion: Dict[str, Tuple[Dict, ...]] = {emotion: tuple(rows) for emotion, rows in by_emotion.items()}
+        self.ids: Tuple = tuple(self.by_id)
+        self.ids_by_emotion: Dict[str, Tuple] = {
+            emotion: tuple(fragrance['id'] for fragrance in rows) for emotion, rows in self.by_emotion.items()}
+        self.loaded_at = time.time()
+
+    def page(self, after_id=None, limit: int = 100, emotion: Optional[str] = None) -> Tuple[Tuple[Dict, ...], Optional[int]]:
+        """Các nến có id > after_id (tối đa limit) và id cuối trang nếu còn trang sau"""
+        if emotion:
+            rows, ids = self.by_emotion.get(emotion, ()), self.ids_by_emotion.get(emotion, ())
+        else:
+            rows, ids = self.fragrances, self.ids
+        start = bisect_right(ids, after_id) if after_id is not None else 0
+        page = rows[start:start + limit]
+        next_after = page[-1]['id'] if page and start + limit < len(rows) else None
+        return page, next_after
+
+
+class FragranceCatalog:
+    """Đọc danh mục từ snapshot trong bộ nhớ thay vì một round-trip database mỗi lần gợi ý
+
+    source cần get_fragrances(), get_fragrance_by_id(), add_fragrance() và catalog_version()
+    (PostgresDatabase). Các dict trả về dùng chung giữa các request, chỉ đọc.
+    """
+
+    def __init__(self, source, poll_interval: float = 30.0):
+        self.source = source
+        self.poll_interval = poll_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.polls = 0
+        self.passthrough_reads = 0
+        self.last_refresh_seconds = 0.0
+
+    def get_fragrances(self, emotion: Optional[str] = None) -> List[Dict]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            # Chưa nạp được lần nào (database lỗi lúc khởi động): đọc thẳng database
+            self.passthrough_reads += 1
+            return self.source.get_fragrances(emotion)
+        if emotion:
+            return list(snapshot.by_emotion.get(emotion, ()))
+        return list(snapshot.fragrances)
+
+    def page(self, after_id=None, limit: int = 100, emotion: Optional[str] = None):
+        """Phân trang keyset theo id trên một snapshot; trả về (rows, next_after_id, version)
+
+        version là phiên bản của đúng snapshot đã đọc (None khi chưa nạp được và phải đọc database).
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.passthrough_reads += 1
+            snapshot = CatalogSnapshot(None, self.source.get_fragrances(emotion))
+        rows, next_after = snapshot.page(after_id, limit, emotion)
+        return list(rows), next_after, snapshot.version
+
+    def get_fragrance_by_id(self, fragrance_id) -> Optional[Dict]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.passthrough_reads += 1
+            return self.source.get_fragrance_by_id(fragrance_id)
+        return snapshot.by_id.get(fragrance_id)
+
+    def add_fragrance(self, name, description, emotion, image_url=None):
+        """Thêm nến thơm rồi làm mới ngay để worker này đọc được nến vừa thêm"""
+        fragrance = self.source.add_fragrance(name, description, emotion, image_url)
+        self.refresh(wait=True)
+        return fragrance
+
+    def bulk_add_fragrances(self, rows, dedupe=False, batch_size=1000):
+        """Import nhiều nến thơm trong một transaction rồi làm mới một lần"""
+        result = self.source.bulk_add_fragrances(rows, dedupe=dedupe, batch_size=batch_size)
+        if result['inserted']:
+            self.refresh(wait=True)
+        return result
+
+    @property
+    def version(self) -> Optional[int]:
+        snapshot = self._snapshot
+        return snapshot.version if snapshot is not None else None
+
+    def refresh(self, wait: bool = False, force: bool = False) -> bool:
+        """Nạp lại danh mục nếu phiên bản đổi; trả về True khi đã thay snapshot
+
+        wait=False: đang có luồng khác refresh thì bỏ qua (poller). Lỗi database giữ snapshot cũ.
+        """
+        if not self._refresh_lock.acquire(blocking=wait):
+            return False
+        try:
+            start = time.perf_counter()
+            self.polls += 1
+            # Đọc phiên bản trước các dòng: sửa đổi xen giữa sẽ được lần poll sau nạp lại
+            version = self.source.catalog_version()
+            current = self._snapshot
+            if not force and current is not None and current.version == version:
+                return False
+            snapshot = CatalogSnapshot(version, self.source.get_fragrances())
+            self._snapshot = snapshot
+
+            self.refreshes += 1
+            self.last_refresh_seconds = time.perf_counter() - start
+            db_logger.info(f"🕯️ Fragrance catalog v{version}: {len(snapshot.fragrances)} nến thơm, "
+                           f"{self.last_refresh_seconds * 1000:.1f}ms")
+            return True
+        except Exception as e:
+            self.refresh_errors += 1
+            db_logger.error(f"❌ Lỗi làm mới fragrance catalog: {e}", exc_info=True)
+            return False
+        finally:
+            self._refresh_lock.release()
+
+    def start(self):
+        """Nạp lần đầu rồi chạy luồng poll phiên bản (daemon) mỗi poll_interval giây"""
+        self.refresh(wait=True)
+        if self.poll_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='fragrance-catalog', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            self.refresh()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict:
+        """Số liệu: phiên bản, số nến thơm, số lần poll/làm mới/lỗi, tuổi của snapshot"""
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version if snapshot is not None else None,
+            'fragrances': len(snapshot.fragrances) if snapshot is not None else 0,
+            'emotions': len(snapshot.by_emotion) if snapshot is not None else 0,
+            'age_seconds': round(time.time() - snapshot.loaded_at, 1) if snapshot is not None else None,
+            'poll_interval_seconds': self.poll_interval,
+            'polls': self.polls,
+            'refreshes': self.refreshes,
+            'refresh_errors': self.refresh_errors,
+            'passthrough_reads': self.passthrough_reads,
+            'last_refresh_ms': round(self.last_refresh_seconds * 1000, 3),
+        }
@@ -0,0 +1,125 @@
+"""
+Fragrance Import - Nhập danh mục nến thơm hàng loạt từ CSV hoặc NDJSON
+File này chứa read_records (đọc dần từng dòng của stream), validate_records (chuẩn hóa và
+kiểm tra từng dòng) và import_fragrances: đưa các dòng hợp lệ vào bulk_add_fragrances của
+store/catalog trong một transaction, nên danh mục chỉ đổi phiên bản một lần khi import xong
+"""
+
+import csv
+import json
+import logging
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+db_logger = logging.getLogger('emotionai.database')
+
+FORMATS = ('csv', 'ndjson')
+EMOTIONS = ('positive', 'negative', 'neutral')
+MAX_NAME_LENGTH = 200
+MAX_REPORTED_ERRORS = 20
+
+
+class FragranceImportError(Exception):
+    """File import có dòng không hợp lệ (hoặc sai định dạng); không dòng nào được ghi"""
+
+    def __init__(self, errors: List[Dict]):
+        self.errors = errors[:MAX_REPORTED_ERRORS]
+        self.invalid = len(errors)
+        super().__init__(f"{self.invalid} dòng không hợp lệ (dòng {errors[0]['line']}: {errors[0]['error']})")
+
+
+def detect_format(filename: Optional[str] = None, content_type: Optional[str] = None) -> str:
+    """Đoán định dạng từ phần mở rộng file hoặc Content-Type; mặc định CSV"""
+    name = (filename or '').lower()
+    mime = (content_type or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')) or 'json' in mime:
+        return 'ndjson'
+    return 'csv'
+
+
+def read_records(stream: TextIO, fmt: str = 'csv') -> Iterator[Tuple[int, object]]:
+    """Đọc dần stream, trả về (số dòng, bản ghi); CSV cần dòng tiêu đề, NDJSON mỗi dòng một object"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as e:
+                yield line_number, e
+
+
+def validate_fragrance(record) -> Dict:
+    """Chuẩn hóa một bản ghi thành dòng fragrances; sai thì ValueError kèm lý do"""
+    if isinstance(record, ValueError):
+        raise ValueError(f"JSON không hợp lệ: {record}")
+    if not isinstance(record, dict):
+        raise ValueError("mỗi dòng phải là một object")
+
+    def text(field):
+        value = record.get(field)
+        if value is None:
+            return None
+        if not isinstance(value, str):
+            raise ValueError(f"{field} phải là chuỗi")
+        return value.strip() or None
+
+    name = text('name')
+    emotion = text('emotion')
+    image_url = text('image_url')
+    if not name:
+        raise ValueError("thiếu tên")
+    if len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f"tên dài quá {MAX_NAME_LENGTH} ký tự")
+    if not emotion:
+        raise ValueError("thiếu cảm xúc")
+    emotion = emotion.lower()
+    if emotion not in EMOTIONS:
+        raise ValueError(f"cảm xúc '{emotion}' không thuộc {', '.join(EMOTIONS)}")
+    if image_url and not image_url.startswith(('http://', 'https://')):
+        raise ValueError("image_url phải bắt đầu bằng http:// hoặc https://")
+    return {'name': name, 'description': text('description'), 'emotion': emotion, 'image_url': image_url}
+
+
+def validate_records(records: Iterable[Tuple[int, object]], errors: List[Dict],
+                     skip_invalid: bool = False) -> Iterator[Dict]:
+    """Trả về các dòng hợp lệ, ghi dòng lỗi vào errors
+
+    skip_invalid=False: hết stream mà có dòng lỗi thì raise FragranceImportError. Lỗi được raise
+    từ bên trong bulk_add_fragrances nên transaction rollback, không dòng nào được ghi.
+    """
+    for line_number, record in records:
+        try:
+            yield validate_fragrance(record)
+        except ValueError as e:
+            errors.append({'line': line_number, 'error': str(e)})
+    if errors and not skip_invalid:
+        raise FragranceImportError(errors)
+
+
+def import_fragrances(target, stream: TextIO, fmt: str = 'csv', dedupe: bool = False,
+                      skip_invalid: bool = False, batch_size: int = 1000) -> Dict:
+    """Import stream vào target (FragranceStore hoặc FragranceCatalog) trong một transaction
+
+    Trả về báo cáo {'received', 'inserted', 'duplicates', 'invalid', 'errors', 'seconds'}.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Định dạng import không hỗ trợ: {fmt}")
+    start = time.perf_counter()
+    errors: List[Dict] = []
+    try:
+        result = target.bulk_add_fragrances(
+            validate_records(read_records(stream, fmt), errors, skip_invalid),
+            dedupe=dedupe, batch_size=batch_size)
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise FragranceImportError([{'line': None, 'error': f"file {fmt} không đọc được: {e}"}])
+    seconds = time.perf_counter() - start
+    report = dict(result, invalid=len(errors), errors=errors[:MAX_REPORTED_ERRORS],
+                  seconds=round(seconds, 3))
+    db_logger.info(f"📦 Import nến thơm ({fmt}): {report['inserted']}/{report['received']} dòng mới, "
+                   f"{report['duplicates']} trùng, {report['invalid']} lỗi, {seconds * 1000:.1f}ms")
+    return report
@@ -0,0 +1,314 @@
+"""
+Fragrance Store - Giao diện lưu danh mục nến thơm và các backend nhúng
+File này chứa FragranceStore (get_fragrances/get_fragrance_by_id/add_fragrance/catalog_version),
+SQLiteFragranceStore (bảng fragrances trong file SQLite) và MemoryFragranceStore (trong bộ nhớ),
+cả hai được seed từ FragranceMapper.emotion_fragrance_map khi còn trống, để chạy app, load test
+và benchmark không cần DATABASE_URL. Backend Postgres nằm ở db/postgres_database.py
+"""
+
+import logging
+import threading
+from abc import ABC, abstractmethod
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from db.connection import SQLiteConnectionManager
+from utils.fragrance_mapping import FragranceMapper
+
+db_logger = logging.getLogger('emotionai.database')
+
+FRAGRANCE_COLUMNS = ('id', 'name', 'description', 'emotion', 'image_url')
+
+
+class FragranceStore(ABC):
+    """Giao diện chung của các backend danh mục nến thơm (dùng bởi FragranceCatalog và app.py)"""
+
+    backend = 'base'
+
+    @abstractmethod
+    def get_fragrances(self, emotion: Optional[str] = None) -> List[Dict]:
+        """Các nến thơm (lọc theo cảm xúc nếu có)"""
+
+    @abstractmethod
+    def get_fragrance_by_id(self, fragrance_id) -> Optional[Dict]:
+        """Một nến thơm theo id, None nếu không có"""
+
+    @abstractmethod
+    def add_fragrance(self, name, description, emotion, image_url=None) -> Dict:
+        """Thêm một nến thơm, trả về dòng vừa thêm (kèm id)"""
+
+    @abstractmethod
+    def bulk_add_fragrances(self, rows: Iterable[Dict], dedupe: bool = False, batch_size: int = 1000) -> Dict:
+        """Thêm nhiều nến thơm trong một transaction; dedupe=True bỏ dòng trùng (name, emotion)
+
+        Trả về {'received', 'inserted', 'duplicates'}. Lỗi giữa chừng (kể cả từ iterable rows)
+        rollback toàn bộ, danh mục không đổi.
+        """
+
+    @abstractmethod
+    def catalog_version(self) -> int:
+        """Phiên bản danh mục, tăng sau mỗi lần sửa (FragranceCatalog poll giá trị này)"""
+
+    def stats(self) -> Dict:
+        return {'backend': self.backend}
+
+    def close(self):
+        pass
+
+
+def batches(rows: Iterable, size: int) -> Iterator[List]:
+    """Chia iterable thành các list tối đa size phần tử (đọc dần, không nạp hết vào bộ nhớ)"""
+    iterator = iter(rows)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def seed_fragrances(mapper: Optional[FragranceMapper] = None) -> List[Dict]:
+    """Các dòng fragrances (không có id) từ sơ đồ cảm xúc -> nến thơm của FragranceMapper"""
+    mapper = mapper or FragranceMapper()
+    rows = []
+    for emotion, emotion_data in mapper.emotion_fragrance_map.items():
+        for fragrance in emotion_data['fragrances']:
+            rows.append({
+                'name': fragrance['name'],
+                'description': f"{fragrance['benefit']}. Hương: {fragrance['scent']}",
+                'emotion': emotion,
+                'image_url': None,
+            })
+    return rows
+
+
+class SQLiteFragranceStore(FragranceStore):
+    """Danh mục trong file SQLite (mặc định dùng chung chatbot.db với app), trigger tăng phiên bản"""
+
+    backend = 'sqlite'
+
+    def __init__(self, db_path: str = 'chatbot.db', connections: Optional[SQLiteConnectionManager] = None,
+                 seed: bool = True):
+        self.owns_connections = connections is None
+        self.connections = connections or SQLiteConnectionManager(db_path)
+        self.ensure_tables()
+        if seed:
+            self.seed()
+
+    def ensure_tables(self):
+        with self.connections.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS fragrances (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    description TEXT,
+                    emotion TEXT,
+                    image_url TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_fragrances_emotion ON fragrances (emotion)')
+            # Dedupe khi import hàng loạt tra theo (name, emotion)
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_fragrances_name_emotion ON fragrances (name, emotion)')
+            # bulk_load = 1 trong lúc import hàng loạt: trigger theo dòng bỏ qua, import tự tăng phiên bản một lần
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS fragrance_catalog_version (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL DEFAULT 0,
+                    bulk_load INTEGER NOT NULL DEFAULT 0,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(fragrance_catalog_version)')}
+            if 'bulk_load' not in columns:
+                conn.execute('ALTER TABLE fragrance_catalog_version ADD COLUMN bulk_load INTEGER NOT NULL DEFAULT 0')
+            conn.execute('INSERT OR IGNORE INTO fragrance_catalog_version (id) VALUES (1)')
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                # Tạo lại để database cũ (trigger chưa có điều kiện WHEN) cũng được cập nhật
+                conn.execute(f'DROP TRIGGER IF EXISTS trg_fragrances_version_{event.lower()}')
+                conn.execute(f'''
+                    CREATE TRIGGER trg_fragrances_version_{event.lower()}
+                    AFTER {event} ON fragrances
+                    WHEN (SELECT bulk_load FROM fragrance_catalog_version WHERE id = 1) = 0
+                    BEGIN
+                        UPDATE fragrance_catalog_version
+                        SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+                    END
+                ''')
+
+    def seed(self, mapper: Optional[FragranceMapper] = None) -> int:
+        """Nạp danh mục mặc định nếu bảng còn trống; trả về số dòng đã thêm"""
+        with self.connections.transaction(immediate=True) as conn:
+            if conn.execute('SELECT 1 FROM fragrances LIMIT 1').fetchone():
+                return 0
+            inserted = self.bulk_add_fragrances(seed_fragrances(mapper))['inserted']
+        db_logger.info(f"🌱 Seed {inserted} nến thơm vào {self.connections.db_path}")
+        return inserted
+
+    def _rows(self, cursor) -> List[Dict]:
+        return [dict(zip(FRAGRANCE_COLUMNS, row)) for row in cursor.fetchall()]
+
+    def get_fragrances(self, emotion=None):
+        conn = self.connections.connection()
+        if emotion:
+            return self._rows(conn.execute(
+                'SELECT id, name, description, emotion, image_url FROM fragrances WHERE emotion = ? ORDER BY id',
+                (emotion,)))
+        return self._rows(conn.execute('SELECT id, name, description, emotion, image_url FROM fragrances ORDER BY id'))
+
+    def get_fragrance_by_id(self, fragrance_id):
+        rows = self._rows(self.connections.connection().execute(
+            'SELECT id, name, description, emotion, image_url FROM fragrances WHERE id = ?', (fragrance_id,)))
+        return rows[0] if rows else None
+
+    def add_fragrance(self, name, description, emotion, image_url=None):
+        with self.connections.transaction() as conn:
+            cursor = conn.execute('''
+                INSERT INTO fragrances (name, description, emotion, image_url)
+                VALUES (?, ?, ?, ?)
+            ''', (name, description, emotion, image_url))
+        return {'id': cursor.lastrowid, 'name': name, 'description': description,
+                'emotion': emotion, 'image_url': image_url}
+
+    def bulk_add_fragrances(self, rows, dedupe=False, batch_size=1000):
+        # Bước 1: nạp từng lô vào bảng tạm trong transaction thường. Bảng temp thuộc riêng kết nối này
+        # nên không khóa ghi chatbot.db: rows (với /api/fragrance/import là body upload đang stream và
+        # được validate dần) được đọc hết trước khi lấy khóa, các writer khác không phải chờ.
+        # Bước 2: BEGIN IMMEDIATE chỉ cho một câu INSERT ... SELECT và một lần tăng phiên bản. SQLite
+        # chỉ có trigger FOR EACH ROW nên bulk_load tắt trigger phiên bản trong bước này
+        received = 0
+        try:
+            with self.connections.transaction() as conn:
+                conn.execute('''
+                    CREATE TEMP TABLE IF NOT EXISTS fragrance_import (
+                        position INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        description TEXT,
+                        emotion TEXT,
+                        image_url TEXT
+                    )
+                ''')
+                conn.execute('DELETE FROM temp.fragrance_import')
+                for batch in batches(rows, batch_size):
+                    conn.executemany('''
+                        INSERT INTO temp.fragrance_import (position, name, description, emotion, image_url)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', [(received + offset, row['name'], row.get('description'), row['emotion'],
+                           row.get('image_url')) for offset, row in enumerate(batch)])
+                    received += len(batch)
+
+            with self.connections.transaction(immediate=True) as conn:
+                conn.execute('UPDATE fragrance_catalog_version SET bulk_load = 1 WHERE id = 1')
+                if dedupe:
+                    cursor = conn.execute('''
+                        INSERT INTO fragrances (name, description, emotion, image_url)
+                        SELECT name, description, emotion, image_url FROM (
+                            SELECT *, ROW_NUMBER() OVER (PARTITION BY name, emotion ORDER BY position) AS occurrence
+                            FROM temp.fragrance_import
+                        ) AS staged
+                        WHERE occurrence = 1 AND NOT EXISTS (
+                            SELECT 1 FROM fragrances f WHERE f.name = staged.name AND f.emotion = staged.emotion
+                        )
+                        ORDER BY position
+                    ''')
+                else:
+                    cursor = conn.execute('''
+                        INSERT INTO fragrances (name, description, emotion, image_url)
+                        SELECT name, description, emotion, image_url FROM temp.fragrance_import ORDER BY position
+                    ''')
+                inserted = cursor.rowcount
+                conn.execute('''
+                    UPDATE fragrance_catalog_version
+                    SET bulk_load = 0,
+                        version = version + (CASE WHEN ? > 0 THEN 1 ELSE 0 END),
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = 1
+                ''', (inserted,))
+        finally:
+            # Không giữ các dòng đã nạp trong kết nối sau khi import xong hoặc lỗi
+            self.connections.connection().execute('DROP TABLE IF EXISTS temp.fragrance_import')
+        return {'received': received, 'inserted': inserted, 'duplicates': received - inserted}
+
+    def catalog_version(self):
+        row = self.connections.connection().execute(
+            'SELECT version FROM fragrance_catalog_version WHERE id = 1').fetchone()
+        return row[0] if row else 0
+
+    def stats(self):
+        return {'backend': self.backend, 'db_path': self.connections.db_path}
+
+    def close(self):
+        if self.owns_connections:
+            self.connections.close()
+
+
+class MemoryFragranceStore(FragranceStore):
+    """Danh mục chỉ trong bộ nhớ của worker (load test, benchmark): không I/O, mất khi tắt"""
+
+    backend = 'memory'
+
+    def __init__(self, rows: Optional[List[Dict]] = None):
+        self._lock = threading.Lock()
+        self._rows: Dict[int, Dict] = {}
+        self._next_id = 1
+        self._version = 0
+        for row in (seed_fragrances() if rows is None else rows):
+            self.add_fragrance(row['name'], row.get('description'), row.get('emotion'), row.get('image_url'))
+
+    def get_fragrances(self, emotion=None):
+        with self._lock:
+            return [dict(row) for row in self._rows.values() if not emotion or row['emotion'] == emotion]
+
+    def get_fragrance_by_id(self, fragrance_id):
+        with self._lock:
+            row = self._rows.get(fragrance_id)
+            return dict(row) if row is not None else None
+
+    def add_fragrance(self, name, description, emotion, image_url=None):
+        with self._lock:
+            row = {'id': self._next_id, 'name': name, 'description': description,
+                   'emotion': emotion, 'image_url': image_url}
+            self._rows[row['id']] = row
+            self._next_id += 1
+            self._version += 1
+            return dict(row)
+
+    def bulk_add_fragrances(self, rows, dedupe=False, batch_size=1000):
+        # Đọc hết rows trước khi khóa: lỗi giữa chừng không để lại danh mục dở dang
+        staged = [row for batch in batches(rows, batch_size) for row in batch]
+        with self._lock:
+            seen = {(row['name'], row['emotion']) for row in self._rows.values()} if dedupe else None
+            inserted = 0
+            for row in staged:
+                if dedupe:
+                    key = (row['name'], row['emotion'])
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                self._rows[self._next_id] = {'id': self._next_id, 'name': row['name'],
+                                             'description': row.get('description'),
+                                             'emotion': row['emotion'], 'image_url': row.get('image_url')}
+                self._next_id += 1
+                inserted += 1
+            if inserted:
+                self._version += 1
+        return {'received': len(staged), 'inserted': inserted, 'duplicates': len(staged) - inserted}
+
+    def catalog_version(self):
+        return self._version
+
+
+def create_fragrance_store(backend: str = 'postgres', **options) -> FragranceStore:
+    """Tạo backend danh mục theo cấu hình: 'postgres' (DATABASE_URL), 'sqlite' hoặc 'memory'"""
+    pool_options = ('dsn', 'min_size', 'max_size', 'acquire_timeout', 'ping_idle_seconds')
+    if backend == 'postgres':
+        # psycopg2 chỉ cần khi dùng backend Postgres
+        from db.postgres_database import PostgresDatabase
+        options.pop('connections', None)
+        return PostgresDatabase(**options)
+    for option in pool_options:
+        options.pop(option, None)
+    if backend == 'sqlite':
+        return SQLiteFragranceStore(**options)
+    if backend == 'memory':
+        options.pop('connections', None)
+        return MemoryFragranceStore(**options)
+    raise ValueError(f"Fragrance backend không hỗ trợ: {backend}")
@@ -0,0 +1,157 @@
+"""
+Schema Migrations - Thay đổi schema SQLite theo phiên bản, chạy lúc khởi động
+File này chứa danh sách migration (index, bảng rollup) và apply_migrations: các phiên bản đã
+áp dụng lưu trong bảng schema_migrations, mỗi migration chạy một lần trong transaction riêng
+"""
+
+import logging
+import sqlite3
+from typing import Callable, List, Set, Tuple
+
+from db.analytics import add_fragrance_counts, create_rollups
+from db.connection import SQLiteConnectionManager
+
+db_logger = logging.getLogger('emotionai.database')
+
+
+class Migration:
+    """Một bước schema: chỉ chạy khi mọi bảng trong requires đã được tạo"""
+
+    def __init__(self, version: int, description: str, requires: Tuple[str, ...],
+                 apply: Callable[[sqlite3.Cursor], None]):
+        self.version = version
+        self.description = description
+        self.requires = requires
+        self.apply = apply
+
+
+def _merge_duplicate_preferences(cursor: sqlite3.Cursor) -> int:
+    """Gộp các dòng preference trùng (user, cảm xúc, nến thơm) vào dòng cũ nhất
+
+    used_count được cộng dồn, rating lấy từ lần dùng gần nhất (như save_user_preference
+    vẫn ghi đè), last_used lấy mới nhất. Trả về số dòng trùng đã xóa.
+    """
+    cursor.execute('''
+        SELECT user_id, emotion, fragrance_name, MIN(id), SUM(used_count), MAX(last_used), MIN(created_at)
+        FROM user_preferences
+        GROUP BY user_id, emotion, fragrance_name
+        HAVING COUNT(*) > 1
+    ''')
+    duplicates = cursor.fetchall()
+    if not duplicates:
+        return 0
+
+    removed = 0
+    for user_id, emotion, fragrance_name, keep_id, used_count, last_used, created_at in duplicates:
+        cursor.execute('''
+            SELECT rating FROM user_preferences
+            WHERE user_id = ? AND emotion = ? AND fragrance_name = ?
+            ORDER BY last_used DESC, id DESC
+            LIMIT 1
+        ''', (user_id, emotion, fragrance_name))
+        rating = cursor.fetchone()[0]
+        cursor.execute('''
+            UPDATE user_preferences
+            SET used_count = ?, rating = ?, last_used = ?, created_at = ?
+            WHERE id = ?
+        ''', (used_count, rating, last_used, created_at, keep_id))
+        cursor.execute('''
+            DELETE FROM user_preferences
+            WHERE user_id = ? AND emotion = ? AND fragrance_name = ? AND id != ?
+        ''', (user_id, emotion, fragrance_name, keep_id))
+        removed += cursor.rowcount
+
+    db_logger.info(f"🔧 Gộp {removed} preference trùng ({len(duplicates)} nhóm) trước khi tạo unique index")
+    return removed
+
+
+def _unique_preferences(cursor: sqlite3.Cursor):
+    # Mỗi (user, cảm xúc, nến thơm) chỉ một dòng: UPSERT của save_user_preference dựa vào index này
+    _merge_duplicate_preferences(cursor)
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_user_preferences_unique
+        ON user_preferences (user_id, emotion, fragrance_name)
+    ''')
+
+
+def _preference_suggestion_index(cursor: sqlite3.Cursor):
+    # Index phủ cho get_personalized_suggestion (không cần đọc bảng)
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_preferences_suggestion
+        ON user_preferences (user_id, emotion, rating, used_count, last_used, fragrance_name)
+    ''')
+
+
+def _session_indexes(cursor: sqlite3.Cursor):
+    # end_session/end_sessions tìm theo session_id, get_user_stats theo user_id
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversation_sessions_session_id ON conversation_sessions (session_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversation_sessions_user_id ON conversation_sessions (user_id)')
+
+
+def _conversation_indexes(cursor: sqlite3.Cursor):
+    # Tin nhắn gần đây của /api/analytics (ORDER BY timestamp DESC LIMIT 10)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations (timestamp)')
+
+
+# Chỉ thêm vào cuối, không sửa migration đã phát hành
+MIGRATIONS = (
+    Migration(1, "unique (user_id, emotion, fragrance_name) cho user_preferences", ('user_preferences',),
+              _unique_preferences),
+    Migration(2, "index phủ cho gợi ý cá nhân hóa", ('user_preferences',), _preference_suggestion_index),
+    Migration(3, "index session_id, user_id cho conversation_sessions", ('conversation_sessions',),
+              _session_indexes),
+    Migration(4, "index timestamp cho conversations", ('conversations',), _conversation_indexes),
+    Migration(5, "rollup cảm xúc theo giờ và tổng, cập nhật bằng trigger", ('conversations',), create_rollups),
+    Migration(6, "số lần gợi ý nến thơm trong rollup theo giờ, điền lại rollup", ('conversations',),
+              add_fragrance_counts),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def applied_versions(conn: sqlite3.Connection) -> Set[int]:
+    """Các phiên bản migration đã áp dụng"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return {version for version, in conn.execute('SELECT version FROM schema_migrations')}
+
+
+def _has_tables(conn: sqlite3.Connection, tables: Tuple[str, ...]) -> bool:
+    placeholders = ', '.join('?' for _ in tables)
+    found = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})", tables
+    ).fetchone()[0]
+    return found == len(tables)
+
+
+def apply_migrations(connections: SQLiteConnectionManager) -> List[int]:
+    """Áp dụng các migration còn thiếu theo thứ tự, trả về các phiên bản vừa áp dụng
+
+    Migration có bảng chưa tồn tại (ví dụ conversations do init_db tạo sau UserDatabase)
+    được để lại cho lần gọi sau. An toàn khi nhiều worker cùng khởi động: mỗi migration
+    giữ khóa ghi (BEGIN IMMEDIATE) và kiểm tra lại trước khi chạy.
+    """
+    conn = connections.connection()
+    with connections.transaction():
+        done = applied_versions(conn)
+
+    applied = []
+    for migration in MIGRATIONS:
+        if migration.version in done or not _has_tables(conn, migration.requires):
+            continue
+
+        conn.execute('BEGIN IMMEDIATE')
+        with connections.transaction():
+            if migration.version in applied_versions(conn):
+                continue  # worker khác vừa áp dụng
+            migration.apply(conn.cursor())
+            conn.execute('INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                         (migration.version, migration.description))
+        applied.append(migration.version)
+        db_logger.info(f"🔧 Schema migration {migration.version}: {migration.description}")
+    return applied
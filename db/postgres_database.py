@@ -1,14 +1,68 @@
+import csv
+import io
+import logging
 import os
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
-class PostgresDatabase:
-    def __init__(self):
-        self.conn = psycopg2.connect(os.environ["DATABASE_URL"], cursor_factory=RealDictCursor)
+from db.fragrance_store import FragranceStore, batches
+from db.postgres_pool import PostgresConnectionPool
+
+db_logger = logging.getLogger('emotionai.database')
+
+# Lỗi mất kết nối (Postgres restart, mạng): connection bị bỏ khỏi pool
+DISCONNECT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# Khóa advisory tuần tự hóa ensure_tables giữa các worker khởi động cùng lúc
+SCHEMA_LOCK_ID = 0x656D6F61  # 'emoa'
+
+class PostgresDatabase(FragranceStore):
+    backend = 'postgres'
+
+    def __init__(self, dsn=None, min_size=1, max_size=10, acquire_timeout=5.0, ping_idle_seconds=5.0, pool=None):
+        if pool is None:
+            dsn = dsn or os.environ["DATABASE_URL"]
+            pool = PostgresConnectionPool(
+                lambda: psycopg2.connect(dsn, cursor_factory=RealDictCursor),
+                min_size=min_size,
+                max_size=max_size,
+                acquire_timeout=acquire_timeout,
+                ping_idle_seconds=ping_idle_seconds,
+                disconnect_errors=DISCONNECT_ERRORS,
+            )
+        self.pool = pool
         self.ensure_tables()
+        self.pool.warm_up()
+
+    def _execute(self, sql, params=(), fetch='all', retry=True):
+        """Chạy một câu lệnh trong một transaction trên connection mượn từ pool
+
+        retry=True (chỉ dùng cho câu đọc): mất kết nối thì chạy lại một lần trên connection mới.
+        """
+        attempts = 2 if retry else 1
+        for attempt in range(attempts):
+            try:
+                with self.pool.connection() as conn, conn.cursor() as cur:
+                    cur.execute(sql, params)
+                    if fetch == 'one':
+                        return cur.fetchone()
+                    if fetch == 'all':
+                        return cur.fetchall()
+                    return None
+            except DISCONNECT_ERRORS as e:
+                if attempt + 1 == attempts:
+                    raise
+                db_logger.warning(f"⚠️ Mất kết nối Postgres, thử lại trên connection mới: {e}")
 
     def ensure_tables(self):
-        with self.conn.cursor() as cur:
+        """Tạo bảng, function và trigger nếu chưa có
+
+        Mọi DDL chạy trong một transaction giữ pg_advisory_xact_lock: nhiều worker gunicorn khởi động
+        cùng lúc trên database trống lần lượt chạy (giống BEGIN IMMEDIATE + kiểm tra lại của migration
+        SQLite), không lỗi "tuple concurrently updated" hay trùng object. Khóa tự nhả khi commit.
+        """
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute('SELECT pg_advisory_xact_lock(%s)', (SCHEMA_LOCK_ID,))
             cur.execute('''
                 CREATE TABLE IF NOT EXISTS fragrances (
                     id SERIAL PRIMARY KEY,
@@ -18,30 +72,100 @@ class PostgresDatabase:
                     image_url TEXT
                 );
             ''')
-            self.conn.commit()
+            # Phiên bản danh mục: trigger tăng sau mỗi câu lệnh sửa fragrances (kể cả sửa bằng tay),
+            # các worker poll một dòng này thay vì đọc lại cả bảng
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS fragrance_catalog_version (
+                    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                    version BIGINT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+                INSERT INTO fragrance_catalog_version (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+                CREATE OR REPLACE FUNCTION bump_fragrance_catalog_version() RETURNS trigger AS $$
+                BEGIN
+                    UPDATE fragrance_catalog_version SET version = version + 1, updated_at = now() WHERE id = 1;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+                DO $$
+                BEGIN
+                    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_fragrances_catalog_version') THEN
+                        CREATE TRIGGER trg_fragrances_catalog_version
+                            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON fragrances
+                            FOR EACH STATEMENT EXECUTE PROCEDURE bump_fragrance_catalog_version();
+                    END IF;
+                END
+                $$;
+            ''')
 
     def add_fragrance(self, name, description, emotion, image_url=None):
-        with self.conn.cursor() as cur:
+        # Không chạy lại: lỗi lúc commit không cho biết dòng đã được ghi hay chưa
+        return self._execute('''
+            INSERT INTO fragrances (name, description, emotion, image_url)
+            VALUES (%s, %s, %s, %s)
+            RETURNING *;
+        ''', (name, description, emotion, image_url), fetch='one', retry=False)
+
+    def bulk_add_fragrances(self, rows, dedupe=False, batch_size=1000):
+        # COPY từng lô vào bảng tạm rồi một câu INSERT ... SELECT: trigger FOR EACH STATEMENT
+        # chỉ tăng phiên bản một lần. Không chạy lại khi mất kết nối (rows có thể là stream).
+        with self.pool.connection() as conn, conn.cursor() as cur:
             cur.execute('''
-                INSERT INTO fragrances (name, description, emotion, image_url)
-                VALUES (%s, %s, %s, %s)
-                RETURNING *;
-            ''', (name, description, emotion, image_url))
-            self.conn.commit()
-            return cur.fetchone()
+                CREATE TEMP TABLE fragrance_import (
+                    position INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    description TEXT,
+                    emotion TEXT,
+                    image_url TEXT
+                ) ON COMMIT DROP;
+            ''')
+            received = 0
+            for batch in batches(rows, batch_size):
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row in batch:
+                    writer.writerow((received, row['name'], row.get('description'), row['emotion'], row.get('image_url')))
+                    received += 1
+                buffer.seek(0)
+                cur.copy_expert(
+                    'COPY fragrance_import (position, name, description, emotion, image_url) FROM STDIN WITH (FORMAT csv)',
+                    buffer)
+            if not received:
+                return {'received': 0, 'inserted': 0, 'duplicates': 0}
+            if dedupe:
+                cur.execute('''
+                    INSERT INTO fragrances (name, description, emotion, image_url)
+                    SELECT name, description, emotion, image_url FROM (
+                        SELECT DISTINCT ON (name, emotion) * FROM fragrance_import
+                        ORDER BY name, emotion, position
+                    ) AS staged
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM fragrances f WHERE f.name = staged.name AND f.emotion = staged.emotion
+                    )
+                    ORDER BY position;
+                ''')
+            else:
+                cur.execute('''
+                    INSERT INTO fragrances (name, description, emotion, image_url)
+                    SELECT name, description, emotion, image_url FROM fragrance_import ORDER BY position;
+                ''')
+            inserted = cur.rowcount
+        return {'received': received, 'inserted': inserted, 'duplicates': received - inserted}
 
     def get_fragrances(self, emotion=None):
-        with self.conn.cursor() as cur:
-            if emotion:
-                cur.execute('SELECT * FROM fragrances WHERE emotion = %s', (emotion,))
-            else:
-                cur.execute('SELECT * FROM fragrances')
-            return cur.fetchall()
+        if emotion:
+            return self._execute('SELECT * FROM fragrances WHERE emotion = %s', (emotion,))
+        return self._execute('SELECT * FROM fragrances')
 
     def get_fragrance_by_id(self, fragrance_id):
-        with self.conn.cursor() as cur:
-            cur.execute('SELECT * FROM fragrances WHERE id = %s', (fragrance_id,))
-            return cur.fetchone()
+        return self._execute('SELECT * FROM fragrances WHERE id = %s', (fragrance_id,), fetch='one')
+
+    def catalog_version(self):
+        row = self._execute('SELECT version FROM fragrance_catalog_version WHERE id = 1', fetch='one')
+        return row['version'] if row else 0
+
+    def stats(self):
+        return {'backend': self.backend, 'pool': self.pool.stats()}
 
     def close(self):
-        self.conn.close() 
\ No newline at end of file
+        self.pool.close() 
\ No newline at end of file
@@ -0,0 +1,227 @@
+"""
+Postgres Pool - Pool connection an toàn đa luồng cho PostgresDatabase
+File này chứa PostgresConnectionPool: giới hạn min/max connection, chờ có timeout khi pool đầy,
+kiểm tra sức khỏe connection khi mượn (đã đóng, idle lâu thì ping), bỏ connection hỏng để
+lần mượn sau tự kết nối lại, và số liệu thời gian chờ/timeout/reconnect
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Tuple, Type
+
+db_logger = logging.getLogger('emotionai.database')
+
+
+class PoolTimeoutError(Exception):
+    """Không mượn được connection trong acquire_timeout giây (mọi connection đều đang bận)"""
+
+
+def ping(conn) -> None:
+    """Health check mặc định: một round-trip SELECT 1"""
+    with conn.cursor() as cur:
+        cur.execute('SELECT 1')
+        cur.fetchone()
+    conn.rollback()
+
+
+class PostgresConnectionPool:
+    """Pool connection psycopg2 dùng chung giữa các luồng request của một worker
+
+    connection() mượn một connection cho một transaction: commit khi khối lệnh xong,
+    rollback khi lỗi; lỗi mất kết nối (disconnect_errors) thì connection bị bỏ thay vì trả về pool.
+    """
+
+    def __init__(self, connect: Callable[[], Any], min_size: int = 1, max_size: int = 10,
+                 acquire_timeout: float = 5.0, ping_idle_seconds: float = 5.0,
+                 health_check: Callable[[Any], None] = ping,
+                 disconnect_errors: Tuple[Type[BaseException], ...] = (),
+                 clock: Callable[[], float] = time.monotonic):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Kích thước pool không hợp lệ: min={min_size}, max={max_size}")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.ping_idle_seconds = ping_idle_seconds
+        self.health_check = health_check
+        self.disconnect_errors = disconnect_errors
+        self.clock = clock
+
+        # (connection, thời điểm trả về pool); LIFO để dùng lại connection vừa dùng (còn "ấm")
+        self._idle: deque = deque()
+        self._size = 0  # connection đang mở, kể cả đang được mượn và đang kết nối
+        self._closed = False
+        self._condition = threading.Condition()
+
+        self.acquires = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.connections_opened = 0
+        self.connect_errors = 0
+        self.discarded = 0
+        self.health_check_failures = 0
+
+    def warm_up(self):
+        """Mở sẵn min_size connection (lỗi thì bỏ qua, lần mượn sau sẽ kết nối lại)"""
+        opened = []
+        try:
+            while self._size < self.min_size:
+                opened.append(self._open())
+        except Exception as e:
+            db_logger.warning(f"⚠️ Không mở sẵn được connection Postgres: {e}")
+        for conn in opened:
+            self._release(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException as e:
+            if self._is_broken(conn, e):
+                self._discard(conn)
+                raise
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+                raise e
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def acquire(self) -> Any:
+        """Mượn connection khỏe; chờ tối đa acquire_timeout giây khi pool đã đủ max_size"""
+        start = self.clock()
+        deadline = start + self.acquire_timeout
+        waited = False
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("PostgresConnectionPool đã đóng")
+                    if self._idle:
+                        conn, released_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        # Giữ chỗ rồi kết nối ngoài khóa
+                        self._size += 1
+                        conn, released_at = None, None
+                        break
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Không mượn được connection Postgres sau {self.acquire_timeout}s "
+                            f"({self._size}/{self.max_size} đang dùng)")
+                    waited = True
+                    self._condition.wait(remaining)
+
+            if conn is None:
+                conn = self._open(reserved=True)
+            elif not self._healthy(conn, released_at):
+                self._discard(conn)
+                continue
+            self._record_acquire(self.clock() - start, waited)
+            return conn
+
+    def _open(self, reserved: bool = False) -> Any:
+        if not reserved:
+            with self._condition:
+                self._size += 1
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self.connect_errors += 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.connections_opened += 1
+        return conn
+
+    def _healthy(self, conn, released_at: float) -> bool:
+        if getattr(conn, 'closed', False):
+            return False
+        if self.ping_idle_seconds is not None and self.clock() - released_at >= self.ping_idle_seconds:
+            try:
+                self.health_check(conn)
+            except Exception as e:
+                with self._condition:
+                    self.health_check_failures += 1
+                db_logger.warning(f"⚠️ Connection Postgres không phản hồi, kết nối lại: {e}")
+                return False
+        return True
+
+    def _is_broken(self, conn, error: BaseException) -> bool:
+        return bool(getattr(conn, 'closed', False)) or isinstance(error, self.disconnect_errors)
+
+    def _release(self, conn):
+        with self._condition:
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, self.clock()))
+            self._condition.notify()
+
+    def _discard(self, conn):
+        """Bỏ connection hỏng; chỗ trống được lấp bằng connection mới ở lần mượn sau"""
+        self._close_quietly(conn)
+        with self._condition:
+            self._size -= 1
+            self.discarded += 1
+            self._condition.notify()
+
+    def _record_acquire(self, wait_seconds: float, waited: bool):
+        with self._condition:
+            self.acquires += 1
+            self.waits += waited
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Đóng connection đang rảnh; connection đang mượn được đóng khi trả về"""
+        with self._condition:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self) -> Dict:
+        """Số liệu: kích thước pool, thời gian chờ mượn, timeout, connection mở lại/bị bỏ"""
+        with self._condition:
+            return {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'acquires': self.acquires,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': round(self.total_wait_seconds / self.acquires * 1000, 3) if self.acquires else 0,
+                'max_wait_ms': round(self.max_wait_seconds * 1000, 3),
+                'connections_opened': self.connections_opened,
+                'connect_errors': self.connect_errors,
+                'discarded': self.discarded,
+                'health_check_failures': self.health_check_failures,
+            }
@@ -0,0 +1,52 @@
+"""
+App Schema - Schema SQLite của app (chatbot.db)
+File này chứa CONVERSATIONS_TABLE và init_app_schema mà init_db của api/app.py dùng, cùng
+create_app_db để test và benchmark mở database mới đúng schema app thay vì giữ bản sao DDL
+"""
+
+import os
+
+from db.connection import SQLiteConnectionManager
+from db.migrations import apply_migrations
+from db.user_database import UserDatabase
+
+CONVERSATIONS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT,
+        session_id TEXT,
+        message TEXT,
+        response TEXT,
+        sentiment TEXT,
+        confidence REAL,
+        fragrance_recommendation TEXT,
+        conversation_state TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+def create_conversations_table(connections: SQLiteConnectionManager):
+    """Tạo bảng conversations (chưa có index/rollup, các thứ đó do migration thêm)"""
+    with connections.transaction() as conn:
+        conn.execute(CONVERSATIONS_TABLE)
+
+
+def init_app_schema(connections: SQLiteConnectionManager):
+    """Tạo bảng conversations rồi áp dụng migration (bảng của UserDatabase đã có khi khởi tạo)"""
+    create_conversations_table(connections)
+    return apply_migrations(connections)
+
+
+def create_app_db(directory: str, migrate: bool = True) -> SQLiteConnectionManager:
+    """Mở chatbot.db mới trong directory với schema như khi app khởi động
+
+    migrate=False chỉ tạo bảng conversations, giống database cũ trước khi có migration.
+    """
+    connections = SQLiteConnectionManager(os.path.join(directory, "chatbot.db"))
+    if not migrate:
+        create_conversations_table(connections)
+        return connections
+    UserDatabase(connections=connections)
+    init_app_schema(connections)
+    return connections
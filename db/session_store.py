@@ -0,0 +1,413 @@
+"""
+Session Store - Lưu các cuộc hội thoại đang hoạt động, có giới hạn thời gian và số lượng
+File này chứa SessionStore thay cho dict active_conversations: hết hạn khi idle quá TTL,
+giới hạn số phiên với loại bỏ LRU, phiên bị loại được kết thúc theo lô bởi luồng sweeper.
+SQLiteSessionStore dùng chung phiên giữa các worker gunicorn trên cùng một máy (SQLite WAL)
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Iterator, List, Optional
+
+from db.connection import SQLiteConnectionManager
+from state_machine.conversation_record import ConversationRecord
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ có khóa trong một tiến trình
+    fcntl = None
+
+db_logger = logging.getLogger('emotionai.database')
+
+# Hàm kết thúc một lô phiên bị loại (ví dụ gọi UserDatabase.end_sessions)
+Finalizer = Callable[[List[ConversationRecord]], None]
+
+
+class StripedLock:
+    """Khóa theo key trong một tiến trình: key được băm vào một trong các stripe threading.Lock"""
+
+    def __init__(self, stripes: int = 1024):
+        self.stripes = stripes
+        self._thread_locks = [threading.Lock() for _ in range(stripes)]
+
+    def stripe(self, key: Hashable) -> int:
+        # crc32 thay vì hash(): cùng key phải rơi vào cùng stripe ở mọi worker
+        return zlib.crc32(str(key).encode('utf-8')) % self.stripes
+
+    @contextmanager
+    def __call__(self, key: Hashable) -> Iterator[None]:
+        with self._thread_locks[self.stripe(key)]:
+            yield
+
+
+class StripedFileLock(StripedLock):
+    """Khóa theo key giữa các worker: byte-range lock (fcntl) trên file khóa, mỗi stripe một byte.
+    fcntl khóa theo tiến trình nên vẫn cần threading.Lock cho các luồng trong cùng worker."""
+
+    def __init__(self, path: str, stripes: int = 1024):
+        super().__init__(stripes)
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644) if fcntl is not None else None
+        if fcntl is None:
+            db_logger.warning("⚠️ fcntl không khả dụng, khóa phiên chỉ có hiệu lực trong một worker")
+
+    @contextmanager
+    def __call__(self, key: Hashable) -> Iterator[None]:
+        stripe = self.stripe(key)
+        with self._thread_locks[stripe]:
+            if self._fd is None:
+                yield
+                return
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class BaseSessionStore:
+    """Phần dùng chung của các backend: hàng đợi kết thúc phiên, sweeper nền và số liệu
+
+    Backend cài đặt get/get_or_create/save/pop/_evict_expired/_live_count. Caller giữ
+    lock(user_id) trong suốt get -> xử lý -> save để tin nhắn của một user được xử lý tuần tự.
+    """
+
+    def __init__(self, finalizer: Finalizer, idle_ttl: float = 1800.0, max_entries: int = 10000,
+                 sweep_interval: float = 60.0, sweep_batch_size: int = 100,
+                 clock: Callable[[], float] = time.monotonic):
+        self.finalizer = finalizer
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self.sweep_batch_size = sweep_batch_size
+        self.clock = clock
+
+        # Phiên đã bị loại, chờ sweeper kết thúc (không gọi database trên luồng xử lý request)
+        self._pending: deque = deque()
+        self._lock = threading.Lock()
+        self._finalize_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._user_locks = StripedLock()
+
+        self.evictions = {'idle': 0, 'capacity': 0, 'duplicate': 0, 'shutdown': 0}
+        self.finalized = 0
+        self.finalize_errors = 0
+        self.sweeps = 0
+        self.last_sweep_seconds = 0.0
+        self.total_sweep_seconds = 0.0
+
+    def lock(self, user_id: Hashable):
+        """Context manager: tuần tự hóa các request của cùng một user"""
+        return self._user_locks(user_id)
+
+    def save(self, user_id: Hashable, record: ConversationRecord):
+        """Ghi lại bản ghi sau khi xử lý tin nhắn"""
+
+    def __contains__(self, user_id: Hashable) -> bool:
+        return self.get(user_id) is not None
+
+    def __len__(self) -> int:
+        return self._live_count()
+
+    def _queue(self, records: List[ConversationRecord], reason: str):
+        """Đưa phiên bị loại vào hàng đợi kết thúc"""
+        with self._lock:
+            self._pending.extend(records)
+            self.evictions[reason] += len(records)
+
+    def sweep(self) -> int:
+        """Loại các phiên idle quá TTL rồi kết thúc mọi phiên đang chờ theo lô; trả về số phiên đã kết thúc"""
+        start = time.perf_counter()
+        self._evict_expired(self.clock())
+        finalized = self._drain()
+
+        elapsed = time.perf_counter() - start
+        self.sweeps += 1
+        self.last_sweep_seconds = elapsed
+        self.total_sweep_seconds += elapsed
+        if finalized:
+            db_logger.info(f"🧹 Session sweep: kết thúc {finalized} phiên trong {elapsed * 1000:.1f}ms")
+        return finalized
+
+    def _drain(self) -> int:
+        """Kết thúc các phiên đang chờ, mỗi lần tối đa sweep_batch_size phiên"""
+        finalized = 0
+        with self._finalize_lock:
+            while self._pending:
+                batch = []
+                while self._pending and len(batch) < self.sweep_batch_size:
+                    batch.append(self._pending.popleft())
+                try:
+                    self.finalizer(batch)
+                    self.finalized += len(batch)
+                    finalized += len(batch)
+                except Exception as e:
+                    # Không đưa lại vào hàng đợi để một lô lỗi không chặn sweeper mãi mãi
+                    self.finalize_errors += len(batch)
+                    db_logger.error(f"❌ Lỗi kết thúc {len(batch)} phiên: {e}", exc_info=True)
+        return finalized
+
+    def start(self):
+        """Chạy sweeper nền (daemon) mỗi sweep_interval giây"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                db_logger.error(f"❌ Session sweeper error: {e}", exc_info=True)
+
+    def close(self):
+        """Dừng sweeper và kết thúc các phiên đang chờ"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._on_close()
+        self._drain()
+
+    def _on_close(self):
+        """Backend xử lý phiên còn sống khi worker tắt"""
+
+    def stats(self) -> Dict:
+        """Số liệu: phiên đang sống, số lần loại theo lý do, thời gian sweep"""
+        live_sessions = self._live_count()
+        with self._lock:
+            return {
+                'backend': self.backend,
+                'live_sessions': live_sessions,
+                'max_entries': self.max_entries,
+                'idle_ttl_seconds': self.idle_ttl,
+                'pending_finalize': len(self._pending),
+                'evictions': dict(self.evictions),
+                'finalized': self.finalized,
+                'finalize_errors': self.finalize_errors,
+                'sweeps': self.sweeps,
+                'last_sweep_ms': round(self.last_sweep_seconds * 1000, 3),
+                'total_sweep_ms': round(self.total_sweep_seconds * 1000, 3),
+            }
+
+
+class SessionStore(BaseSessionStore):
+    """Store phiên trong bộ nhớ của một worker: idle TTL + max entries (LRU)"""
+
+    backend = 'memory'
+
+    def __init__(self, finalizer: Finalizer, **options):
+        super().__init__(finalizer, **options)
+        # user_id -> bản ghi, theo thứ tự truy cập (cũ nhất ở đầu) nên phiên hết hạn luôn nằm ở đầu
+        self._sessions: "OrderedDict[Hashable, ConversationRecord]" = OrderedDict()
+        self._last_seen: Dict[Hashable, float] = {}
+
+    def get(self, user_id: Hashable) -> Optional[ConversationRecord]:
+        """Lấy phiên đang hoạt động (phiên đã idle quá TTL coi như không còn)"""
+        now = self.clock()
+        with self._lock:
+            record = self._sessions.get(user_id)
+            if record is None:
+                return None
+            if now - self._last_seen[user_id] > self.idle_ttl:
+                self._evict(user_id, 'idle')
+                return None
+            self._sessions.move_to_end(user_id)
+            self._last_seen[user_id] = now
+            return record
+
+    def get_or_create(self, user_id: Hashable, factory: Callable[[], ConversationRecord]) -> ConversationRecord:
+        """Lấy phiên hoặc tạo mới bằng factory (factory chạy ngoài lock)"""
+        record = self.get(user_id)
+        if record is not None:
+            return record
+        created = factory()
+        with self._lock:
+            record = self._sessions.get(user_id)
+            if record is not None:
+                # Request song song đã tạo phiên trước: dùng phiên đó, kết thúc phiên thừa
+                self._pending.append(created)
+                self.evictions['duplicate'] += 1
+                self._touch(user_id)
+                return record
+            self._sessions[user_id] = created
+            self._touch(user_id)
+            while len(self._sessions) > self.max_entries:
+                self._evict(next(iter(self._sessions)), 'capacity')
+            return created
+
+    def save(self, user_id: Hashable, record: ConversationRecord):
+        """Bản ghi nằm sẵn trong bộ nhớ, chỉ cần làm mới thời hạn"""
+        with self._lock:
+            if self._sessions.get(user_id) is record:
+                self._touch(user_id)
+
+    def pop(self, user_id: Hashable) -> Optional[ConversationRecord]:
+        """Gỡ phiên khỏi store (caller tự kết thúc phiên, ví dụ /api/conversation/end)"""
+        with self._lock:
+            self._last_seen.pop(user_id, None)
+            return self._sessions.pop(user_id, None)
+
+    def _touch(self, user_id: Hashable):
+        self._sessions.move_to_end(user_id)
+        self._last_seen[user_id] = self.clock()
+
+    def _evict(self, user_id: Hashable, reason: str):
+        """Gỡ phiên và đưa vào hàng đợi kết thúc (gọi khi đang giữ lock)"""
+        self._pending.append(self._sessions.pop(user_id))
+        del self._last_seen[user_id]
+        self.evictions[reason] += 1
+
+    def _evict_expired(self, now: float):
+        with self._lock:
+            for user_id in list(self._sessions):
+                if now - self._last_seen[user_id] <= self.idle_ttl:
+                    break
+                self._evict(user_id, 'idle')
+
+    def _live_count(self) -> int:
+        return len(self._sessions)
+
+    def _on_close(self):
+        # Worker tắt thì phiên trong bộ nhớ cũng mất: kết thúc tất cả
+        with self._lock:
+            for user_id in list(self._sessions):
+                self._evict(user_id, 'shutdown')
+
+
+class SQLiteSessionStore(BaseSessionStore):
+    """Store phiên dùng chung giữa các worker trên một máy: bản ghi nhị phân trong SQLite (WAL)
+
+    Khóa theo user dùng fcntl trên file khóa cạnh database, nên tin nhắn liên tiếp của một
+    user luôn đọc được state mà worker trước vừa ghi. Phiên còn sống không bị kết thúc khi
+    một worker tắt (worker khác tiếp tục phục vụ); mỗi phiên hết hạn chỉ được một sweeper nhận.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, finalizer: Finalizer, db_path: str = 'sessions.db', lock_stripes: int = 1024,
+                 clock: Callable[[], float] = time.time, **options):
+        # Đồng hồ thật (không phải monotonic) vì thời điểm được so sánh giữa các tiến trình
+        super().__init__(finalizer, clock=clock, **options)
+        self.db_path = db_path
+        # Autocommit: transaction mở tường minh bằng BEGIN IMMEDIATE
+        self.connections = SQLiteConnectionManager(db_path, busy_timeout_ms=30000, isolation_level=None)
+        self._user_locks = StripedFileLock(db_path + '.lock', lock_stripes)
+        self._closed = False
+
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS active_sessions (
+                user_id TEXT PRIMARY KEY,
+                record BLOB NOT NULL,
+                last_seen REAL NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_active_sessions_last_seen ON active_sessions (last_seen)')
+
+    def _connection(self) -> sqlite3.Connection:
+        return self.connections.connection()
+
+    def get(self, user_id: Hashable) -> Optional[ConversationRecord]:
+        """Lấy phiên đang hoạt động (phiên đã idle quá TTL bị loại và coi như không còn)"""
+        now = self.clock()
+        row = self._connection().execute(
+            'SELECT record, last_seen FROM active_sessions WHERE user_id = ?', (user_id,)).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.idle_ttl:
+            self._queue(self._take('user_id = ? AND last_seen < ?', (user_id, now - self.idle_ttl)), 'idle')
+            return None
+        return ConversationRecord.from_bytes(row[0])
+
+    def get_or_create(self, user_id: Hashable, factory: Callable[[], ConversationRecord]) -> ConversationRecord:
+        """Lấy phiên hoặc tạo mới bằng factory; phiên được ghi ngay để worker khác thấy"""
+        record = self.get(user_id)
+        if record is not None:
+            return record
+        created = factory()
+        conn = self._connection()
+        inserted = conn.execute(
+            'INSERT OR IGNORE INTO active_sessions (user_id, record, last_seen) VALUES (?, ?, ?)',
+            (user_id, created.to_bytes(), self.clock())).rowcount
+        if not inserted:
+            # Worker khác đã tạo phiên trước (caller không giữ lock): dùng phiên đó, kết thúc phiên thừa
+            self._queue([created], 'duplicate')
+            return self.get(user_id) or created
+
+        excess = conn.execute('SELECT COUNT(*) FROM active_sessions').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._queue(self._take(
+                'user_id IN (SELECT user_id FROM active_sessions WHERE user_id != ? ORDER BY last_seen LIMIT ?)',
+                (user_id, excess)), 'capacity')
+        return created
+
+    def save(self, user_id: Hashable, record: ConversationRecord):
+        """Ghi bản ghi và làm mới thời hạn (phiên đã bị gỡ trong lúc xử lý thì không ghi lại)"""
+        updated = self._connection().execute(
+            'UPDATE active_sessions SET record = ?, last_seen = ? WHERE user_id = ?',
+            (record.to_bytes(), self.clock(), user_id)).rowcount
+        if not updated:
+            # _take đã gỡ phiên giữa get và save (idle, capacity hoặc kết thúc hội thoại) và phiên đang
+            # được kết thúc; ghi lại sẽ làm sống lại phiên đó và nó bị kết thúc lần nữa ở lượt sweep sau.
+            # Giống store trong bộ nhớ: bỏ qua, tin nhắn tiếp theo của user mở phiên mới
+            db_logger.warning(f"⚠️ Phiên {record.session_id} của user {user_id} đã bị gỡ khỏi store, không ghi lại")
+
+    def pop(self, user_id: Hashable) -> Optional[ConversationRecord]:
+        """Gỡ phiên khỏi store (caller tự kết thúc phiên)"""
+        records = self._take('user_id = ?', (user_id,))
+        return records[0] if records else None
+
+    def _take(self, where: str, params: tuple) -> List[ConversationRecord]:
+        """Đọc và xóa các phiên thỏa điều kiện trong một transaction, để mỗi phiên chỉ một worker nhận"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(f'SELECT user_id, record FROM active_sessions WHERE {where}', params).fetchall()
+            conn.executemany('DELETE FROM active_sessions WHERE user_id = ?', [(row[0],) for row in rows])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return [ConversationRecord.from_bytes(row[1]) for row in rows]
+
+    def _evict_expired(self, now: float):
+        self._queue(self._take('last_seen < ?', (now - self.idle_ttl,)), 'idle')
+
+    def _live_count(self) -> int:
+        if self._closed:
+            return 0
+        return self._connection().execute('SELECT COUNT(*) FROM active_sessions').fetchone()[0]
+
+    def close(self):
+        """Dừng sweeper, rồi đóng kết nối SQLite và file khóa của worker này"""
+        if self._closed:
+            return
+        super().close()
+        self._closed = True
+        self._user_locks.close()
+        self.connections.close()
+
+
+def create_session_store(finalizer: Finalizer, backend: str = 'memory', **options) -> BaseSessionStore:
+    """Tạo session store theo cấu hình: 'memory' (một worker) hoặc 'sqlite' (nhiều worker trên một máy)"""
+    if backend == 'memory':
+        options.pop('db_path', None)
+        return SessionStore(finalizer, **options)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(finalizer, **options)
+    raise ValueError(f"Session backend không hỗ trợ: {backend}")
@@ -6,155 +6,187 @@ File này chứa logic lưu trữ và truy xuất thông tin user profile
 import sqlite3
 import json
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db.connection import SQLiteConnectionManager
+from db.migrations import apply_migrations
+from utils.lru_cache import LRUCache
+
+# Cộng dồn vào dòng (user, cảm xúc, nến thơm) nếu đã có, dựa trên idx_user_preferences_unique (db/migrations.py)
+UPSERT_PREFERENCE = '''
+    INSERT INTO user_preferences (user_id, emotion, fragrance_name, rating, used_count)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, emotion, fragrance_name) DO UPDATE SET
+        used_count = used_count + excluded.used_count,
+        last_used = CURRENT_TIMESTAMP,
+        rating = excluded.rating
+'''
+
+# Gợi ý cá nhân hóa: nến thơm dùng nhiều nhất với rating >= 3 cho cảm xúc này
+# (cùng thứ tự get_user_preferences), đọc hoàn toàn từ idx_user_preferences_suggestion
+BEST_SUGGESTION = '''
+    SELECT fragrance_name FROM user_preferences
+    WHERE user_id = ? AND emotion = ? AND rating >= ?
+    ORDER BY used_count DESC, last_used DESC
+    LIMIT 1
+'''
+MIN_SUGGESTION_RATING = 3
 
 class UserDatabase:
-    def __init__(self, db_path: str = 'chatbot.db'):
-        self.db_path = db_path
+    def __init__(self, db_path: str = 'chatbot.db', connections: Optional[SQLiteConnectionManager] = None,
+                 suggestion_cache_size: int = 0):
+        # Kết nối thread-local dùng chung (WAL); app.py truyền manager chung với bảng conversations
+        self.connections = connections or SQLiteConnectionManager(db_path)
+        self.db_path = self.connections.db_path
+        # Cache gợi ý theo (user, cảm xúc), cập nhật mỗi khi save_user_preference ghi.
+        # Chỉ đúng khi một tiến trình ghi preferences của user: mặc định tắt
+        self.suggestion_cache = LRUCache(suggestion_cache_size) if suggestion_cache_size > 0 else None
         self.init_database()
     
     def init_database(self):
         """Khởi tạo database với các bảng cần thiết"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Bảng users - thông tin cơ bản
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT UNIQUE NOT NULL,
-                first_interaction DATETIME DEFAULT CURRENT_TIMESTAMP,
-                last_interaction DATETIME DEFAULT CURRENT_TIMESTAMP,
-                total_conversations INTEGER DEFAULT 0,
-                favorite_emotion TEXT,
-                favorite_fragrance TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Bảng user_preferences - sở thích nến thơm
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_preferences (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                emotion TEXT NOT NULL,
-                fragrance_name TEXT NOT NULL,
-                rating INTEGER DEFAULT 0,
-                used_count INTEGER DEFAULT 1,
-                last_used DATETIME DEFAULT CURRENT_TIMESTAMP,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Bảng conversation_sessions - phiên trò chuyện
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversation_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                session_id TEXT NOT NULL,
-                start_time DATETIME DEFAULT CURRENT_TIMESTAMP,
-                end_time DATETIME,
-                total_messages INTEGER DEFAULT 0,
-                emotions_discussed TEXT,
-                fragrances_suggested TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Cập nhật bảng conversations hiện có (nếu chưa có cột user_id)
-        try:
-            cursor.execute('ALTER TABLE conversations ADD COLUMN session_id TEXT')
-        except sqlite3.OperationalError:
-            pass  # Cột đã tồn tại
+        with self.connections.transaction() as conn:
+            cursor = conn.cursor()
         
-        conn.commit()
-        conn.close()
+            # Bảng users - thông tin cơ bản
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT UNIQUE NOT NULL,
+                    first_interaction DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    last_interaction DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    total_conversations INTEGER DEFAULT 0,
+                    favorite_emotion TEXT,
+                    favorite_fragrance TEXT,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        
+            # Bảng user_preferences - sở thích nến thơm
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_preferences (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    emotion TEXT NOT NULL,
+                    fragrance_name TEXT NOT NULL,
+                    rating INTEGER DEFAULT 0,
+                    used_count INTEGER DEFAULT 1,
+                    last_used DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+        
+            # Bảng conversation_sessions - phiên trò chuyện
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversation_sessions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    session_id TEXT NOT NULL,
+                    start_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    end_time DATETIME,
+                    total_messages INTEGER DEFAULT 0,
+                    emotions_discussed TEXT,
+                    fragrances_suggested TEXT,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+        
+            # Cập nhật bảng conversations hiện có (nếu chưa có cột user_id)
+            try:
+                cursor.execute('ALTER TABLE conversations ADD COLUMN session_id TEXT')
+            except sqlite3.OperationalError:
+                pass  # Cột đã tồn tại
+        
+        # Index và các thay đổi schema theo phiên bản (PRAGMA user_version)
+        apply_migrations(self.connections)
     
     def get_or_create_user(self, user_id: str) -> Dict:
         """Lấy hoặc tạo user mới"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Kiểm tra user có tồn tại không
-        cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
-        user = cursor.fetchone()
-        
-        if user:
-            # Cập nhật last_interaction
-            cursor.execute('''
-                UPDATE users 
-                SET last_interaction = CURRENT_TIMESTAMP,
-                    total_conversations = total_conversations + 1
-                WHERE user_id = ?
-            ''', (user_id,))
+        # Đọc rồi ghi: giữ khóa ghi từ đầu để writer khác không commit xen giữa
+        with self.connections.transaction(immediate=True) as conn:
+            cursor = conn.cursor()
+        
+            # Kiểm tra user có tồn tại không
+            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            user = cursor.fetchone()
+        
+            if user:
+                # Cập nhật last_interaction
+                cursor.execute('''
+                    UPDATE users 
+                    SET last_interaction = CURRENT_TIMESTAMP,
+                        total_conversations = total_conversations + 1
+                    WHERE user_id = ?
+                ''', (user_id,))
             
-            user_data = {
-                'id': user[0],
-                'user_id': user[1],
-                'first_interaction': user[2],
-                'last_interaction': user[3],
-                'total_conversations': user[4] + 1,
-                'favorite_emotion': user[5],
-                'favorite_fragrance': user[6],
-                'created_at': user[7]
-            }
-        else:
-            # Tạo user mới
-            cursor.execute('''
-                INSERT INTO users (user_id, first_interaction, last_interaction, total_conversations)
-                VALUES (?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, 1)
-            ''', (user_id,))
+                user_data = {
+                    'id': user[0],
+                    'user_id': user[1],
+                    'first_interaction': user[2],
+                    'last_interaction': user[3],
+                    'total_conversations': user[4] + 1,
+                    'favorite_emotion': user[5],
+                    'favorite_fragrance': user[6],
+                    'created_at': user[7]
+                }
+            else:
+                # Tạo user mới
+                cursor.execute('''
+                    INSERT INTO users (user_id, first_interaction, last_interaction, total_conversations)
+                    VALUES (?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, 1)
+                ''', (user_id,))
             
-            user_data = {
-                'user_id': user_id,
-                'first_interaction': datetime.now().isoformat(),
-                'last_interaction': datetime.now().isoformat(),
-                'total_conversations': 1,
-                'favorite_emotion': None,
-                'favorite_fragrance': None,
-                'created_at': datetime.now().isoformat()
-            }
+                user_data = {
+                    'user_id': user_id,
+                    'first_interaction': datetime.now().isoformat(),
+                    'last_interaction': datetime.now().isoformat(),
+                    'total_conversations': 1,
+                    'favorite_emotion': None,
+                    'favorite_fragrance': None,
+                    'created_at': datetime.now().isoformat()
+                }
         
-        conn.commit()
-        conn.close()
         return user_data
     
     def save_user_preference(self, user_id: str, emotion: str, fragrance_name: str, rating: int = 0):
-        """Lưu sở thích nến thơm của user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Kiểm tra preference đã tồn tại chưa
-        cursor.execute('''
-            SELECT id, used_count FROM user_preferences 
-            WHERE user_id = ? AND emotion = ? AND fragrance_name = ?
-        ''', (user_id, emotion, fragrance_name))
-        
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Cập nhật preference hiện có
-            cursor.execute('''
-                UPDATE user_preferences 
-                SET used_count = used_count + 1,
-                    last_used = CURRENT_TIMESTAMP,
-                    rating = ?
-                WHERE id = ?
-            ''', (rating, existing[0]))
-        else:
-            # Tạo preference mới
-            cursor.execute('''
-                INSERT INTO user_preferences (user_id, emotion, fragrance_name, rating, used_count)
-                VALUES (?, ?, ?, ?, 1)
-            ''', (user_id, emotion, fragrance_name, rating))
-        
-        conn.commit()
-        conn.close()
+        """Lưu sở thích nến thơm của user (một lệnh UPSERT, an toàn khi nhiều request cùng lúc)"""
+        with self.connections.transaction() as conn:
+            conn.execute(UPSERT_PREFERENCE, (user_id, emotion, fragrance_name, rating, 1))
+            if self.suggestion_cache is not None:
+                # Cập nhật cache sau khi transaction ngoài cùng (cả lượt chat) commit, tính từ dữ liệu đã commit
+                self.connections.after_commit(lambda: self._refresh_suggestion(user_id, emotion))
+    
+    def save_user_preferences(self, events: Iterable[Tuple[str, str, str, int]]) -> int:
+        """Lưu nhiều lần dùng (user_id, emotion, fragrance_name, rating) một lúc (replay, backfill)
+
+        Các lần dùng trùng khóa được gộp trước (cộng used_count, giữ rating cuối cùng),
+        rồi ghi bằng một executemany trong một transaction. Trả về số dòng đã UPSERT.
+        """
+        merged: Dict[Tuple[str, str, str], List] = {}
+        for user_id, emotion, fragrance_name, rating in events:
+            key = (user_id, emotion, fragrance_name)
+            entry = merged.get(key)
+            if entry is None:
+                merged[key] = [rating, 1]
+            else:
+                entry[0] = rating
+                entry[1] += 1
+        if not merged:
+            return 0
+        
+        with self.connections.transaction() as conn:
+            conn.executemany(UPSERT_PREFERENCE, [
+                (user_id, emotion, fragrance_name, rating, used_count)
+                for (user_id, emotion, fragrance_name), (rating, used_count) in merged.items()
+            ])
+            if self.suggestion_cache is not None:
+                self.connections.after_commit(self.suggestion_cache.clear)
+        return len(merged)
     
     def get_user_preferences(self, user_id: str) -> List[Dict]:
         """Lấy sở thích của user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connections.connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -174,12 +206,11 @@ class UserDatabase:
                 'last_used': row[4]
             })
         
-        conn.close()
         return preferences
     
     def get_favorite_emotion(self, user_id: str) -> Optional[str]:
         """Lấy cảm xúc yêu thích nhất của user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connections.connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -192,13 +223,12 @@ class UserDatabase:
         ''', (user_id,))
         
         result = cursor.fetchone()
-        conn.close()
         
         return result[0] if result else None
     
     def get_favorite_fragrance(self, user_id: str, emotion: str = None) -> Optional[str]:
         """Lấy nến thơm yêu thích nhất của user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connections.connection()
         cursor = conn.cursor()
         
         if emotion:
@@ -219,48 +249,66 @@ class UserDatabase:
             ''', (user_id,))
         
         result = cursor.fetchone()
-        conn.close()
         
         return result[0] if result else None
     
     def create_session(self, user_id: str, session_id: str) -> str:
         """Tạo phiên trò chuyện mới"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.connections.transaction() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO conversation_sessions (user_id, session_id, start_time)
-            VALUES (?, ?, CURRENT_TIMESTAMP)
-        ''', (user_id, session_id))
+            cursor.execute('''
+                INSERT INTO conversation_sessions (user_id, session_id, start_time)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+            ''', (user_id, session_id))
         
-        conn.commit()
-        conn.close()
         return session_id
     
     def end_session(self, session_id: str, emotions_discussed: List[str] = None, fragrances_suggested: List[str] = None):
         """Kết thúc phiên trò chuyện"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.connections.transaction() as conn:
+            cursor = conn.cursor()
         
-        # Cập nhật session
-        cursor.execute('''
-            UPDATE conversation_sessions 
-            SET end_time = CURRENT_TIMESTAMP,
-                emotions_discussed = ?,
-                fragrances_suggested = ?
-            WHERE session_id = ?
-        ''', (
-            json.dumps(emotions_discussed) if emotions_discussed else None,
-            json.dumps(fragrances_suggested) if fragrances_suggested else None,
-            session_id
-        ))
+            # Cập nhật session
+            cursor.execute('''
+                UPDATE conversation_sessions 
+                SET end_time = CURRENT_TIMESTAMP,
+                    emotions_discussed = ?,
+                    fragrances_suggested = ?
+                WHERE session_id = ?
+            ''', (
+                json.dumps(emotions_discussed) if emotions_discussed else None,
+                json.dumps(fragrances_suggested) if fragrances_suggested else None,
+                session_id
+            ))
         
-        conn.commit()
-        conn.close()
-    
+
+    def end_sessions(self, sessions: List[Tuple[str, Optional[List[str]], Optional[List[str]]]]):
+        """Kết thúc nhiều phiên trong một transaction: (session_id, emotions_discussed, fragrances_suggested)"""
+        if not sessions:
+            return
+        with self.connections.transaction() as conn:
+            cursor = conn.cursor()
+
+            cursor.executemany('''
+                UPDATE conversation_sessions
+                SET end_time = CURRENT_TIMESTAMP,
+                    emotions_discussed = ?,
+                    fragrances_suggested = ?
+                WHERE session_id = ?
+            ''', [
+                (
+                    json.dumps(emotions_discussed) if emotions_discussed else None,
+                    json.dumps(fragrances_suggested) if fragrances_suggested else None,
+                    session_id
+                )
+                for session_id, emotions_discussed, fragrances_suggested in sessions
+            ])
+
+
     def get_user_stats(self, user_id: str) -> Dict:
         """Lấy thống kê của user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.connections.connection()
         cursor = conn.cursor()
         
         # Thống kê cơ bản
@@ -268,7 +316,6 @@ class UserDatabase:
         user = cursor.fetchone()
         
         if not user:
-            conn.close()
             return {}
         
         # Thống kê preferences
@@ -291,8 +338,6 @@ class UserDatabase:
         
         session_stats = cursor.fetchone()
         
-        conn.close()
-        
         return {
             'user_id': user_id,
             'first_interaction': user[2],
@@ -307,14 +352,21 @@ class UserDatabase:
     
     def get_personalized_suggestion(self, user_id: str, emotion: str) -> Optional[str]:
         """Lấy gợi ý cá nhân hóa dựa trên lịch sử"""
-        # Lấy nến thơm user đã dùng và thích cho cảm xúc này
-        preferences = self.get_user_preferences(user_id)
-        
-        for pref in preferences:
-            if pref['emotion'] == emotion and pref['rating'] >= 3:
-                return pref['fragrance_name']
-        
-        return None
+        # Nến thơm user đã dùng và thích cho cảm xúc này: một dòng qua index
+        if self.suggestion_cache is None:
+            return self._query_best_suggestion(self.connections.connection(), user_id, emotion)
+        return self.suggestion_cache.get_or_compute(
+            (user_id, emotion),
+            lambda: self._query_best_suggestion(self.connections.connection(), user_id, emotion)
+        )
+    
+    def _refresh_suggestion(self, user_id: str, emotion: str):
+        self.suggestion_cache.put((user_id, emotion),
+                                  self._query_best_suggestion(self.connections.connection(), user_id, emotion))
+
+    def _query_best_suggestion(self, conn: sqlite3.Connection, user_id: str, emotion: str) -> Optional[str]:
+        result = conn.execute(BEST_SUGGESTION, (user_id, emotion, MIN_SUGGESTION_RATING)).fetchone()
+        return result[0] if result else None
 
 # Test function
 def test_user_database():
@@ -1,5 +1,13 @@
-import re
-from typing import Dict, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+
+from utils.keyword_matching import KeywordLexicon, best_category
+from utils.lru_cache import LRUCache
+from utils.text_normalization import NormalizedMessage, accent_compatible
+
+# Tin nhắn thô hoặc đã chuẩn hóa sẵn (analyze_message chuẩn hóa một lần rồi truyền xuống)
+MessageInput = Union[str, NormalizedMessage]
 
 def simple_fuzzy_match(word: str, text: str, max_dist: int = 1) -> bool:
     """Fuzzy match đơn giản: cho phép sai lệch 1 ký tự cho từ ngắn, hoặc match đầu từ cho từ dài."""
@@ -24,7 +32,7 @@ def simple_fuzzy_match(word: str, text: str, max_dist: int = 1) -> bool:
     return False
 
 class ImprovedEmotionDetector:
-    def __init__(self):
+    def __init__(self, cache_size: int = 1024):
         # Từ khóa cảm xúc (cải thiện với nhiều biến thể hơn)
         self.emotion_keywords = {
             "positive": [
@@ -68,99 +76,124 @@ class ImprovedEmotionDetector:
                 "như thế nào", "nhu the nao", "làm thế nào", "lam the nao"
             ]
         }
+        
+        # Scorer bên ngoài: name -> callable(NormalizedMessage), kết quả trả về trong analyze_message
+        self.scorers: Dict[str, Callable[[NormalizedMessage], Any]] = {}
+        # Cache kết quả analyze_message theo tin nhắn đã chuẩn hóa (quick-reply lặp lại rất nhiều)
+        self.cache = LRUCache(cache_size)
+        
+        self.compile_lexicons()
+    
+    def register_scorer(self, name: str, scorer: Callable[[NormalizedMessage], Any]):
+        """Đăng ký scorer bên ngoài dùng chung NormalizedMessage với intent/emotion"""
+        self.scorers[name] = scorer
+    
+    def compile_lexicons(self):
+        """Biên dịch lexicon thành automaton (gọi lại sau khi sửa emotion_keywords/intent_keywords)"""
+        # Fuzzy (sai lệch 1 ký tự) chỉ áp dụng cho từ khóa >= 4 ký tự, giống simple_fuzzy_match.
+        # Từ khóa được bỏ dấu và gộp trùng ("buồn"/"buon") khi nạp
+        self._emotion_lexicon = KeywordLexicon(self.emotion_keywords, fuzzy_min_length=4, fold=True)
+        self._intent_lexicon = KeywordLexicon(self.intent_keywords, fuzzy_min_length=4, fold=True)
+        # Dùng cho analyze_batch: vị trí cột của từ khóa và ma trận từ khóa x category
+        self._emotion_columns = {word: i for i, word in enumerate(self._emotion_lexicon.owners)}
+        self._intent_columns = {word: i for i, word in enumerate(self._intent_lexicon.owners)}
+        self._emotion_incidence = self._incidence_matrix(self._emotion_lexicon)
+        self._intent_incidence = self._incidence_matrix(self._intent_lexicon)
+        # Lexicon đổi thì kết quả đã cache không còn đúng
+        self.cache.clear()
+    
+    @staticmethod
+    def _incidence_matrix(lexicon: KeywordLexicon) -> np.ndarray:
+        """Ma trận từ khóa x category dạng NumPy (giữ đúng số cột kể cả khi lexicon rỗng)"""
+        return np.array(lexicon.incidence(), dtype=np.int64).reshape(-1, len(lexicon.categories))
+    
+    def _score(self, lexicon: KeywordLexicon, normalized: NormalizedMessage, excluded=()) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Điểm mỗi category trên text đã bỏ dấu, kèm điểm khớp đúng cả dấu để phân xử khi hòa"""
+        hits, exact = lexicon.match_accents(normalized.clean, normalized.folded)
+        hits.difference_update(excluded)
+        exact.difference_update(excluded)
+        return lexicon.count(hits), lexicon.count(exact)
+    
+    def _excluded_intents(self, normalized: NormalizedMessage) -> Tuple[str, ...]:
+        """Loại trừ trường hợp "tôi" khớp với "thôi" (trừ câu bắt đầu bằng "tôi")"""
+        if not normalized.startswith("tôi") and normalized.contains("tôi"):
+            return ("thoi",)
+        return ()
     
-    def detect_intent(self, message: str) -> Tuple[str, float]:
+    def detect_intent(self, message: MessageInput) -> Tuple[str, float]:
         """Phát hiện intent của tin nhắn (tách riêng khỏi emotion)"""
-        message_lower = message.lower()
-        message_clean = re.sub(r'[^\w\s]', ' ', message_lower)
+        normalized = NormalizedMessage.of(message)
         
         # Xử lý trường hợp đặc biệt
-        if "không biết" in message_clean:
+        if normalized.contains("không biết"):
             return "none", 0.0  # Không phải intent, mà là neutral emotion
         
         # Xử lý "vậy" - ưu tiên question thay vì agreement
-        if message_clean.strip() == "vậy":
+        if normalized.equals("vậy"):
             return "question", 0.5
         
-        # Xử lý câu bắt đầu bằng "tôi" - không phải intent end
-        if message_clean.strip().startswith("tôi"):
-            # Kiểm tra xem có từ khóa intent khác không
-            intent_scores = {}
-            for intent_type, keywords in self.intent_keywords.items():
-                score = 0
-                for keyword in keywords:
-                    if simple_fuzzy_match(keyword, message_clean):
-                        score += 1
-                intent_scores[intent_type] = score
-            
-            max_score = max(intent_scores.values())
-            if max_score == 0:
-                return "none", 0.0
-            
-            detected_intent = max(intent_scores, key=intent_scores.get)
-            confidence = min(max_score / 2.0, 1.0)
-            return detected_intent, confidence
-        
-        intent_scores = {}
-        for intent_type, keywords in self.intent_keywords.items():
-            score = 0
-            for keyword in keywords:
-                if simple_fuzzy_match(keyword, message_clean):
-                    # Loại trừ trường hợp "tôi" khớp với "thôi"
-                    if keyword in ["thôi", "thoi"] and "tôi" in message_clean:
-                        continue
-                    score += 1
-            intent_scores[intent_type] = score
+        # Câu bắt đầu bằng "tôi" không loại trừ "thôi" (xem _excluded_intents)
+        intent_scores, exact_scores = self._score(self._intent_lexicon, normalized, self._excluded_intents(normalized))
         
         max_score = max(intent_scores.values())
         if max_score == 0:
             return "none", 0.0
         
-        detected_intent = max(intent_scores, key=intent_scores.get)
+        detected_intent = best_category(intent_scores, exact_scores)
         confidence = min(max_score / 2.0, 1.0)
         
         return detected_intent, confidence
     
-    def detect_emotion(self, message: str) -> Tuple[str, float]:
+    def detect_emotion(self, message: MessageInput) -> Tuple[str, float]:
         """Phát hiện cảm xúc từ tin nhắn (cải thiện)"""
-        message_lower = message.lower()
-        message_clean = re.sub(r'[^\w\s]', ' ', message_lower)
-        tokens = message_clean.split()
+        normalized = NormalizedMessage.of(message)
         
         # Xử lý trường hợp đặc biệt
-        if "stre" in message_clean or message_clean.startswith("stre"):
+        if normalized.contains("stre"):
             return "negative", 0.5  # "stre..." -> stress -> negative
         
         # Xử lý "không biết" - ưu tiên neutral
-        if "không biết" in message_clean:
+        if normalized.contains("không biết"):
             return "neutral", 0.5
         
         # Đếm từ khóa cho mỗi loại cảm xúc
-        emotion_scores = {"positive": 0, "negative": 0, "neutral": 0}
-        
-        for emotion_type, keywords in self.emotion_keywords.items():
-            for keyword in keywords:
-                if simple_fuzzy_match(keyword, message_clean):
-                    emotion_scores[emotion_type] += 1
+        emotion_scores, exact_scores = self._score(self._emotion_lexicon, normalized)
         
         # Xác định cảm xúc chính
         max_score = max(emotion_scores.values())
         if max_score == 0:
             return "neutral", 0.0
         
-        detected_emotion = max(emotion_scores, key=emotion_scores.get)
+        detected_emotion = best_category(emotion_scores, exact_scores)
         confidence = min(max_score / 3.0, 1.0)
         
         return detected_emotion, confidence
     
-    def analyze_message(self, message: str) -> Dict:
+    def analyze_message(self, message: MessageInput) -> Dict:
         """Phân tích toàn diện tin nhắn: intent + emotion"""
-        intent, intent_confidence = self.detect_intent(message)
-        emotion, emotion_confidence = self.detect_emotion(message)
-        
+        normalized = NormalizedMessage.of(message)
+        # Kết quả chỉ phụ thuộc vào normalized.lower; trả bản sao để caller sửa không ảnh hưởng cache
+        result = dict(self.cache.get_or_compute(normalized.lower, lambda: self._analyze(normalized)))
+        if self.scorers:
+            result["scores"] = {name: scorer(normalized) for name, scorer in self.scorers.items()}
+        return result
+    
+    def _analyze(self, normalized: NormalizedMessage) -> Dict:
+        """Phân tích không qua cache"""
+        intent, intent_confidence = self.detect_intent(normalized)
+        emotion, emotion_confidence = self.detect_emotion(normalized)
+        return self._combine(normalized, intent, intent_confidence, emotion, emotion_confidence)
+    
+    def cache_stats(self) -> Dict[str, int]:
+        """Thống kê cache của analyze_message (hits/misses/evictions/invalidations)"""
+        return self.cache.stats()
+    
+    def _combine(self, normalized: NormalizedMessage, intent: str, intent_confidence: float,
+                 emotion: str, emotion_confidence: float) -> Dict:
+        """Kết hợp intent và emotion theo thứ tự ưu tiên"""
         # Logic ưu tiên cải thiện
         # Ưu tiên emotion khi câu bắt đầu bằng "tôi" và có emotion rõ ràng
-        if message.lower().strip().startswith("tôi") and emotion_confidence > 0.3:
+        if accent_compatible(normalized.lower.strip()[:len("tôi")], "tôi") and emotion_confidence > 0.3:
             return {
                 "type": "emotion",
                 "emotion": emotion,
@@ -173,7 +206,7 @@ class ImprovedEmotionDetector:
         # Nếu có cả intent và emotion rõ ràng, ưu tiên intent cho các trường hợp đặc biệt
         if intent_confidence > 0.3 and intent in ["restart", "disagreement", "agreement"]:
             # Nếu câu có cả emotion rõ ràng và intent agreement, ưu tiên emotion
-            if intent == "agreement" and emotion_confidence > 0.3 and "vui" in message.lower():
+            if intent == "agreement" and emotion_confidence > 0.3 and normalized.contains("vui"):
                 return {
                     "type": "emotion",
                     "emotion": emotion,
@@ -228,4 +261,128 @@ class ImprovedEmotionDetector:
             "intent_confidence": intent_confidence,
             "emotion": emotion,
             "emotion_confidence": emotion_confidence
-        } 
\ No newline at end of file
+        }
+    
+    def analyze_batch(self, messages: Iterable[MessageInput]) -> List[Dict]:
+        """Phân tích nhiều tin nhắn một lần (kết quả giống hệt analyze_message cho từng tin nhắn)
+        
+        Tin nhắn trùng nhau chỉ được phân tích một lần. Từ khóa khớp được gom thành ma trận
+        thưa tin nhắn x từ khóa (dạng COO), điểm category, argmax và confidence tính bằng NumPy.
+        """
+        # Gộp tin nhắn trùng (quick-reply chiếm phần lớn backlog)
+        unique_rows: Dict[str, int] = {}
+        normalized_messages: List[NormalizedMessage] = []
+        inverse = []
+        for message in messages:
+            text = message.text if isinstance(message, NormalizedMessage) else message
+            row = unique_rows.get(text)
+            if row is None:
+                row = unique_rows[text] = len(normalized_messages)
+                normalized_messages.append(NormalizedMessage.of(message))
+            inverse.append(row)
+        
+        intents = self._batch_intents(normalized_messages)
+        emotions = self._batch_emotions(normalized_messages)
+        
+        results = []
+        for normalized, (intent, intent_confidence), (emotion, emotion_confidence) in zip(normalized_messages, intents, emotions):
+            result = self._combine(normalized, intent, intent_confidence, emotion, emotion_confidence)
+            if self.scorers:
+                result["scores"] = {name: scorer(normalized) for name, scorer in self.scorers.items()}
+            results.append(result)
+        
+        return [dict(results[row]) for row in inverse]
+    
+    def _batch_scores(self, lexicon: KeywordLexicon, columns: Dict[str, int], incidence: np.ndarray,
+                      normalized_messages: List[NormalizedMessage], excluded=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Điểm category cho mỗi tin nhắn: ma trận hit (COO) nhân với ma trận từ khóa x category
+        
+        Trả về (điểm, điểm khớp đúng cả dấu) giống _score.
+        """
+        rows, cols, exact_rows, exact_cols = [], [], [], []
+        for row, normalized in enumerate(normalized_messages):
+            hits, exact = lexicon.match_accents(normalized.clean, normalized.folded)
+            if excluded is not None:
+                skipped = excluded(normalized)
+                hits.difference_update(skipped)
+                exact.difference_update(skipped)
+            for word in hits:
+                rows.append(row)
+                cols.append(columns[word])
+            for word in exact:
+                exact_rows.append(row)
+                exact_cols.append(columns[word])
+        
+        shape = (len(normalized_messages), len(lexicon.categories))
+        return self._sparse_scores(shape, rows, cols, incidence), self._sparse_scores(shape, exact_rows, exact_cols, incidence)
+    
+    @staticmethod
+    def _sparse_scores(shape: Tuple[int, int], rows: List[int], cols: List[int], incidence: np.ndarray) -> np.ndarray:
+        scores = np.zeros(shape, dtype=np.int64)
+        if rows:
+            np.add.at(scores, np.array(rows, dtype=np.intp), incidence[np.array(cols, dtype=np.intp)])
+        return scores
+    
+    @staticmethod
+    def _batch_best(scores: np.ndarray, exact_scores: np.ndarray) -> np.ndarray:
+        """best_category dạng vector: argmax theo điểm, hòa thì theo điểm khớp đúng dấu, rồi theo thứ tự"""
+        return (scores * (exact_scores.max() + 1) + exact_scores).argmax(axis=1)
+    
+    def _batch_intents(self, normalized_messages: List[NormalizedMessage]) -> List[Tuple[str, float]]:
+        """detect_intent dạng vector hóa"""
+        if not normalized_messages:
+            return []
+        
+        scores, exact_scores = self._batch_scores(self._intent_lexicon, self._intent_columns, self._intent_incidence,
+                                                  normalized_messages, self._excluded_intents)
+        categories = np.array(self._intent_lexicon.categories + ["none", "question"], dtype=object)
+        none_index, question_index = len(categories) - 2, len(categories) - 1
+        
+        max_scores = scores.max(axis=1)
+        labels = self._batch_best(scores, exact_scores)
+        confidences = np.minimum(max_scores / 2.0, 1.0)
+        
+        # Không có từ khóa nào -> none
+        labels = np.where(max_scores == 0, none_index, labels)
+        confidences = np.where(max_scores == 0, 0.0, confidences)
+        
+        # Trường hợp đặc biệt: "vậy" -> question, "không biết" -> none (ưu tiên cao nhất)
+        only_vay = np.array([normalized.equals("vậy") for normalized in normalized_messages])
+        labels = np.where(only_vay, question_index, labels)
+        confidences = np.where(only_vay, 0.5, confidences)
+        
+        khong_biet = np.array([normalized.contains("không biết") for normalized in normalized_messages])
+        labels = np.where(khong_biet, none_index, labels)
+        confidences = np.where(khong_biet, 0.0, confidences)
+        
+        return list(zip(categories[labels].tolist(), confidences.tolist()))
+    
+    def _batch_emotions(self, normalized_messages: List[NormalizedMessage]) -> List[Tuple[str, float]]:
+        """detect_emotion dạng vector hóa"""
+        if not normalized_messages:
+            return []
+        
+        scores, exact_scores = self._batch_scores(self._emotion_lexicon, self._emotion_columns, self._emotion_incidence,
+                                                  normalized_messages)
+        categories = self._emotion_lexicon.categories
+        labels_table = np.array(categories, dtype=object)
+        
+        max_scores = scores.max(axis=1)
+        labels = self._batch_best(scores, exact_scores)
+        confidences = np.minimum(max_scores / 3.0, 1.0)
+        
+        # Không có từ khóa nào -> neutral
+        neutral_index = categories.index("neutral")
+        labels = np.where(max_scores == 0, neutral_index, labels)
+        confidences = np.where(max_scores == 0, 0.0, confidences)
+        
+        # Trường hợp đặc biệt: "không biết" -> neutral, "stre..." -> negative (ưu tiên cao nhất)
+        khong_biet = np.array([normalized.contains("không biết") for normalized in normalized_messages])
+        labels = np.where(khong_biet, neutral_index, labels)
+        confidences = np.where(khong_biet, 0.5, confidences)
+        
+        stre = np.array([normalized.contains("stre") for normalized in normalized_messages])
+        labels = np.where(stre, categories.index("negative"), labels)
+        confidences = np.where(stre, 0.5, confidences)
+        
+        return list(zip(labels_table[labels].tolist(), confidences.tolist()))
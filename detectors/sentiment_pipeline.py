@@ -0,0 +1,131 @@
+"""
+Sentiment Pipeline - Phân tích cảm xúc theo tầng, tầng rẻ chạy trước
+File này chứa SentimentPipeline: cảm xúc state machine đã xác định -> lexicon tiếng Việt
+(có cache) -> fallback polarity chỉ khi hai tầng trên không quyết định được,
+chạy ngay (lazy) hoặc ở luồng nền cho analytics (async). Ghi nhận tỉ lệ quyết định và
+độ trễ của từng tầng
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+sentiment_logger = logging.getLogger('emotionai.sentiment')
+
+TIERS = ('state_machine', 'lexicon', 'fallback')
+MODES = ('lazy', 'async')
+
+
+class SentimentResult:
+    """Kết quả cho response; pending là Future (sentiment, confidence) của fallback async"""
+
+    __slots__ = ('sentiment', 'confidence', 'tier', 'pending')
+
+    def __init__(self, sentiment: str, confidence: float, tier: str, pending: Optional[Future] = None):
+        self.sentiment = sentiment
+        self.confidence = confidence
+        self.tier = tier
+        self.pending = pending
+
+
+class SentimentPipeline:
+    """Chọn cảm xúc cho một tin nhắn qua các tầng state_machine -> lexicon -> fallback
+
+    mode='lazy': fallback chạy ngay trên luồng request, chỉ khi cần.
+    mode='async': response dùng kết quả lexicon (neutral), fallback chạy ở luồng nền và
+    kết quả đi qua result.pending (dùng cho dòng conversations của analytics).
+    """
+
+    def __init__(self, fallback: Callable[[str], Tuple[str, float]], mode: str = 'lazy',
+                 clock: Callable[[], float] = time.perf_counter):
+        if mode not in MODES:
+            raise ValueError(f"Sentiment fallback mode không hỗ trợ: {mode}")
+        self.fallback = fallback
+        self.mode = mode
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sentiment-fallback') \
+            if mode == 'async' else None
+
+        self.messages = 0
+        self.deferred = 0
+        self.fallback_errors = 0
+        self._calls = dict.fromkeys(TIERS, 0)
+        self._decided = dict.fromkeys(TIERS, 0)
+        self._total_seconds = dict.fromkeys(TIERS, 0.0)
+        self._max_seconds = dict.fromkeys(TIERS, 0.0)
+
+    def analyze(self, message: str, state_machine) -> SentimentResult:
+        """Cảm xúc của tin nhắn sau khi state_machine.process_message đã chạy"""
+        with self._lock:
+            self.messages += 1
+
+        # Tầng 1: state machine đã xác định cảm xúc (trong tin nhắn này hoặc trước đó)
+        start = self.clock()
+        emotion, confidence = state_machine.get_detected_emotion()
+        self._record('state_machine', start, decided=bool(emotion))
+        if emotion:
+            return SentimentResult(emotion, confidence, 'state_machine')
+
+        # Tầng 2: lexicon tiếng Việt (cache dùng chung với detect_emotion của state machine)
+        start = self.clock()
+        emotion, confidence = state_machine.detect_emotion(message)
+        self._record('lexicon', start, decided=confidence > 0)
+        if confidence > 0:
+            return SentimentResult(emotion, confidence, 'lexicon')
+
+        # Tầng 3: fallback đắt
+        if self._executor is not None:
+            with self._lock:
+                self.deferred += 1
+            return SentimentResult(emotion, confidence, 'lexicon', self._executor.submit(self._run_fallback, message))
+        sentiment, confidence = self._run_fallback(message)
+        return SentimentResult(sentiment, confidence, 'fallback')
+
+    def _run_fallback(self, message: str) -> Tuple[str, float]:
+        start = self.clock()
+        try:
+            result = self.fallback(message)
+        except Exception as e:
+            with self._lock:
+                self.fallback_errors += 1
+            sentiment_logger.error(f"❌ Lỗi sentiment fallback: {e}", exc_info=True)
+            result = ("neutral", 0.0)
+        self._record('fallback', start, decided=True)
+        return result
+
+    def _record(self, tier: str, start: float, decided: bool):
+        elapsed = self.clock() - start
+        with self._lock:
+            self._calls[tier] += 1
+            self._decided[tier] += decided
+            self._total_seconds[tier] += elapsed
+            self._max_seconds[tier] = max(self._max_seconds[tier], elapsed)
+
+    def close(self):
+        """Chờ các fallback async đang chạy (gọi khi worker tắt)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def stats(self) -> Dict:
+        """Số liệu: mỗi tầng chạy bao nhiêu lần, tỉ lệ quyết định trên tổng tin nhắn, độ trễ"""
+        with self._lock:
+            tiers = {
+                tier: {
+                    'calls': self._calls[tier],
+                    'decided': self._decided[tier],
+                    'hit_rate': round(self._decided[tier] / self.messages, 4) if self.messages else 0,
+                    'avg_ms': round(self._total_seconds[tier] / self._calls[tier] * 1000, 3) if self._calls[tier] else 0,
+                    'max_ms': round(self._max_seconds[tier] * 1000, 3),
+                }
+                for tier in TIERS
+            }
+            return {
+                'mode': self.mode,
+                'messages': self.messages,
+                'deferred': self.deferred,
+                'fallback_errors': self.fallback_errors,
+                'tiers': tiers,
+            }
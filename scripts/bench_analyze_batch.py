@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark Analyze Batch - Đo throughput analyze_batch so với analyze_message từng tin nhắn
+Backlog giả lập gồm quick-reply (phần lớn traffic) và câu tự do ghép từ lexicon
+
+Chạy từ thư mục gốc: python -m scripts.bench_analyze_batch [số tin nhắn]
+"""
+
+import random
+import sys
+import time
+
+from detectors.ImprovedEmotionDetector import ImprovedEmotionDetector
+
+QUICK_REPLIES = [
+    "Có", "Không", "😊 Tôi vui", "😔 Tôi buồn", "😰 Tôi stress", "🤔 Không biết",
+    "Tạm biệt", "Tiếp tục", "Bắt đầu lại",
+]
+FILLER = ["tôi", "mình", "hôm", "nay", "quá", "lắm", "thấy", "hơi", "và", "nhưng"]
+
+
+def build_backlog(count, quick_reply_ratio=0.6, seed=42):
+    """Sinh backlog: quick_reply_ratio là tỉ lệ tin nhắn quick-reply"""
+    rng = random.Random(seed)
+    detector = ImprovedEmotionDetector()
+    vocabulary = FILLER + [
+        word
+        for keywords in list(detector.emotion_keywords.values()) + list(detector.intent_keywords.values())
+        for word in keywords
+    ]
+    messages = []
+    for _ in range(count):
+        if rng.random() < quick_reply_ratio:
+            messages.append(rng.choice(QUICK_REPLIES))
+        else:
+            messages.append(" ".join(rng.choice(vocabulary) for _ in range(rng.randint(2, 8))))
+    return messages
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    detector = ImprovedEmotionDetector()
+
+    print(f"⏱️ analyze_batch benchmark ({count:,} tin nhắn)")
+    print("=" * 60)
+    for ratio in (0.0, 0.6):
+        messages = build_backlog(count, quick_reply_ratio=ratio)
+
+        start = time.perf_counter()
+        expected = [detector.analyze_message(message) for message in messages]
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = detector.analyze_batch(messages)
+        batch = time.perf_counter() - start
+
+        status = "✅" if results == expected else "❌"
+        print(f"quick-reply {ratio:.0%}: analyze_message {count / single:>10,.0f} msg/s | "
+              f"analyze_batch {count / batch:>10,.0f} msg/s | {single / batch:.1f}x | khớp kết quả {status}")
+
+
+if __name__ == "__main__":
+    main()
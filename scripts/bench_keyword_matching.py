@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark Keyword Matching - Đo độ trễ mỗi tin nhắn theo kích thước lexicon
+So sánh vòng lặp cũ (simple_fuzzy_match cho từng từ khóa) với automaton đã biên dịch
+
+Chạy từ thư mục gốc: python -m scripts.bench_keyword_matching
+"""
+
+import random
+import re
+import string
+import time
+
+from detectors.ImprovedEmotionDetector import ImprovedEmotionDetector, simple_fuzzy_match
+
+MESSAGES = [
+    "tôi vui", "tôi buồn", "tôi stress", "có", "không", "tạm biệt", "ok...",
+    "hôm nay mình thấy hơi mệt mỏi và lo lắng", "thế tôi dùng sao", "bình thường thôi",
+    "tôi vui và muốn tiếp tục", "không tôi không muốn", "bắt đầu lại", "😊 Tôi vui",
+]
+LEXICON_SIZES = [0, 200, 1000, 5000]
+ROUNDS = 20
+
+
+def legacy_emotion_scores(keywords, message_clean):
+    """Cách đếm cũ: quét tin nhắn một lần cho mỗi từ khóa"""
+    scores = {emotion_type: 0 for emotion_type in keywords}
+    for emotion_type, words in keywords.items():
+        for keyword in words:
+            if simple_fuzzy_match(keyword, message_clean):
+                scores[emotion_type] += 1
+    return scores
+
+
+def synthetic_keywords(count, rng):
+    """Sinh từ khóa giả (2 âm tiết) để mở rộng lexicon"""
+    letters = string.ascii_lowercase
+    return [
+        " ".join("".join(rng.choice(letters) for _ in range(rng.randint(3, 6))) for _ in range(2))
+        for _ in range(count)
+    ]
+
+
+def time_per_message(func):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for message in MESSAGES:
+            func(message)
+    return (time.perf_counter() - start) / (ROUNDS * len(MESSAGES)) * 1e6
+
+
+def main():
+    rng = random.Random(42)
+    print("⏱️ Keyword matching benchmark (µs / tin nhắn)")
+    print("=" * 60)
+    print(f"{'keywords':>10} {'exact loop':>12} {'exact AC':>12} {'legacy':>12} {'detector':>12} {'speedup':>10}")
+
+    for extra in LEXICON_SIZES:
+        detector = ImprovedEmotionDetector()
+        for words in detector.emotion_keywords.values():
+            words.extend(synthetic_keywords(extra // 3, rng))
+        detector.compile_lexicons()
+        total = sum(len(words) for words in detector.emotion_keywords.values())
+
+        keywords = list(detector._emotion_lexicon.owners)
+        exact_loop = time_per_message(lambda message: [keyword for keyword in keywords if keyword in message])
+        exact_automaton = time_per_message(detector._emotion_lexicon.find)
+        legacy = time_per_message(
+            lambda message: legacy_emotion_scores(
+                detector.emotion_keywords, re.sub(r'[^\w\s]', ' ', message.lower())
+            )
+        )
+        compiled = time_per_message(detector.detect_emotion)
+        print(
+            f"{total:>10} {exact_loop:>12.1f} {exact_automaton:>12.1f} "
+            f"{legacy:>12.1f} {compiled:>12.1f} {legacy / compiled:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark State Machine Memory - Đo bộ nhớ cho mỗi 10k cuộc hội thoại đang hoạt động
+Tạo state machine giống get_or_create_conversation (mỗi user một máy) và đo bằng tracemalloc,
+so sánh entry dict cũ của active_conversations với ConversationRecord
+
+Chạy từ thư mục gốc: python -m scripts.bench_state_machine_memory [số cuộc hội thoại]
+"""
+
+import sys
+import tracemalloc
+import uuid
+
+from state_machine.conversation_record import ConversationRecord
+from state_machine.conversation_state_machine import ConversationStateMachine
+
+# Một phiên điển hình: vài cảm xúc đã trao đổi và một nến thơm đã gợi ý
+EMOTIONS_DISCUSSED = ["negative", "negative", "neutral"]
+FRAGRANCE = {"id": 7, "name": "Lavender Dream"}
+
+
+def state_machine_only(user_id):
+    machine = ConversationStateMachine()
+    machine.reset_conversation(user_id)
+    return machine
+
+
+def legacy_entry(user_id):
+    """Entry dict cũ: state machine + session id + hai list tăng dần"""
+    return {
+        'session_id': str(uuid.uuid4()),
+        'state_machine': state_machine_only(user_id),
+        'emotions_discussed': list(EMOTIONS_DISCUSSED),
+        'fragrances_suggested': [FRAGRANCE["name"]],
+    }
+
+
+def record_entry(user_id):
+    """ConversationRecord cùng nội dung"""
+    record = ConversationRecord(user_id, str(uuid.uuid4()))
+    for emotion in EMOTIONS_DISCUSSED:
+        record.add_emotion(emotion)
+    record.add_fragrance(FRAGRANCE["id"])
+    return record
+
+
+def measure(factory, count):
+    """Số byte được cấp phát thêm khi giữ count cuộc hội thoại trong bộ nhớ"""
+    # Khởi tạo trước phần dùng chung (module, lexicon) để chỉ đo phần riêng của mỗi hội thoại
+    factory("warmup")
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    conversations = {}
+    for i in range(count):
+        user_id = f"user_{i}"
+        conversations[user_id] = factory(user_id)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Gồm cả dict và chuỗi user_id, giống active_conversations trong api/app.py
+    return after - before
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    print(f"🧠 Conversation memory ({count:,} cuộc hội thoại)")
+    print("=" * 60)
+    for name, factory in [("state machine", state_machine_only),
+                          ("entry dict cũ", legacy_entry),
+                          ("ConversationRecord", record_entry)]:
+        total = measure(factory, count)
+        print(f"{name:<20} {total / count:>8,.0f} bytes/hội thoại | "
+              f"{total / count * 10_000 / 1024 / 1024:>7.2f} MiB / 10k")
+    print(f"Bản ghi nhị phân: {len(record_entry('user_1').to_bytes())} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark Unit of Work - Đếm số lần commit SQLite cho mỗi lượt chat
+Lặp lại các lệnh database của process_chat_message (lượt chào, lượt gợi ý nến thơm,
+lượt trò chuyện thường) với ConversationWriter chế độ sync, so sánh mỗi lệnh tự commit
+với một transaction (unit of work) bao các lệnh ghi của lượt như process_chat_message
+
+Chạy từ thư mục gốc: python -m scripts.bench_unit_of_work [số lượt mỗi loại]
+"""
+
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import nullcontext
+
+from db.conversation_writer import ConversationWriter
+from db.schema import create_app_db
+from db.user_database import UserDatabase
+
+FRAGRANCE_NAME = "Lavender Dream"
+
+
+def conversation_row(user_id, session_id, state):
+    return (user_id, session_id, "tin nhắn", "phản hồi", "negative", 0.8, None, state)
+
+
+def greeting_turn(user_db, writer, user_id, scope):
+    """Tin nhắn đầu tiên: tạo session (commit riêng), lưu conversation, lấy/tạo user"""
+    session_id = str(uuid.uuid4())
+    user_db.create_session(user_id, session_id)
+    with scope():
+        writer.write(conversation_row(user_id, session_id, "greeting"))
+        user_db.get_or_create_user(user_id)
+    return session_id
+
+
+def suggestion_turn(user_db, writer, user_id, session_id, scope):
+    """User đồng ý nhận gợi ý: gợi ý cá nhân hóa (đọc), lưu preference, lưu conversation"""
+    user_db.get_personalized_suggestion(user_id, "negative")
+    with scope():
+        user_db.save_user_preference(user_id, "negative", FRAGRANCE_NAME)
+        writer.write(conversation_row(user_id, session_id, "suggest_fragrance"))
+
+
+def small_talk_turn(user_db, writer, user_id, session_id, scope):
+    """Tin nhắn thường: chỉ lưu conversation"""
+    with scope():
+        writer.write(conversation_row(user_id, session_id, "small_talk"))
+
+
+def run(turns, unit_of_work):
+    """Trả về {loại lượt: (commit mỗi lượt, ms mỗi lượt)}"""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        connections = create_app_db(directory)
+        user_db = UserDatabase(connections=connections)
+        writer = ConversationWriter(synchronous=True, connections=connections)
+
+        def scope():
+            return connections.transaction(immediate=True) if unit_of_work else nullcontext()
+
+        sessions = {}
+        for name in ("greeting", "suggest_fragrance", "small_talk"):
+            commits_before = connections.stats()['transactions']
+            start = time.perf_counter()
+            for i in range(turns):
+                user_id = f"user_{i}"
+                if name == "greeting":
+                    sessions[user_id] = greeting_turn(user_db, writer, user_id, scope)
+                elif name == "suggest_fragrance":
+                    suggestion_turn(user_db, writer, user_id, sessions[user_id], scope)
+                else:
+                    small_talk_turn(user_db, writer, user_id, sessions[user_id], scope)
+            elapsed = time.perf_counter() - start
+            commits = connections.stats()['transactions'] - commits_before
+            results[name] = (commits / turns, elapsed / turns * 1000)
+
+        writer.close()
+        connections.close()
+    return results
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    per_call = run(turns, unit_of_work=False)
+    per_turn = run(turns, unit_of_work=True)
+
+    print(f"🧾 SQLite commits mỗi lượt chat ({turns:,} lượt mỗi loại, writer sync)")
+    print("=" * 72)
+    print(f"{'Lượt':<20} {'commit/lệnh':>12} {'unit of work':>13} {'tiết kiệm':>10} {'ms trước':>9} {'ms sau':>7}")
+    for name in per_call:
+        before_commits, before_ms = per_call[name]
+        after_commits, after_ms = per_turn[name]
+        print(f"{name:<20} {before_commits:>12.1f} {after_commits:>13.1f} "
+              f"{before_commits - after_commits:>10.1f} {before_ms:>9.3f} {after_ms:>7.3f}")
+    print("Writer async (mặc định) gom conversation theo lô: bớt thêm một commit mỗi lượt")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Build Polarity Lexicon - Biên dịch lexicon polarity cho utils/polarity.py
+Gộp lexicon tiếng Anh của TextBlob (pattern en-sentiment.xml, đã lấy trung bình các nghĩa và
+thêm dạng trạng từ "-ly") với lexicon tiếng Việt bên dưới thành utils/polarity_lexicon.json.
+Chỉ cần TextBlob khi build; worker chỉ đọc file JSON
+
+Chạy từ thư mục gốc: python -m scripts.build_polarity_lexicon [đường dẫn output]
+"""
+
+import json
+import sys
+
+from utils.polarity import DEFAULT_LEXICON_PATH, LEXICON_FORMAT, PolarityLexicon, PolarityScorer
+from utils.text_normalization import fold_diacritics
+
+# Từ/cụm từ tiếng Việt -> polarity (cùng thang với pattern: -1..1)
+VIETNAMESE_POLARITY = {
+    # Tích cực
+    "vui": 0.6, "vui vẻ": 0.6, "vui mừng": 0.7, "hạnh phúc": 0.8, "tuyệt": 0.8, "tuyệt vời": 1.0,
+    "thích": 0.5, "yêu": 0.6, "yêu thích": 0.6, "hào hứng": 0.6, "phấn khởi": 0.6, "hứng khởi": 0.6,
+    "tốt": 0.5, "ổn": 0.3, "thoải mái": 0.5, "thư giãn": 0.4, "bình yên": 0.5, "dễ chịu": 0.5,
+    "sảng khoái": 0.6, "hài lòng": 0.5, "may mắn": 0.5, "tự hào": 0.6, "biết ơn": 0.6, "cảm ơn": 0.3,
+    "đẹp": 0.6, "ấm áp": 0.4, "sướng": 0.6, "nhẹ nhõm": 0.4, "thơm": 0.4,
+    # Tiêu cực
+    "buồn": -0.6, "buồn bã": -0.7, "chán": -0.5, "chán nản": -0.6, "mệt": -0.4, "mệt mỏi": -0.5,
+    "lo lắng": -0.5, "lo âu": -0.5, "sợ": -0.5, "sợ hãi": -0.6, "tức": -0.5, "tức giận": -0.7,
+    "giận": -0.6, "bực": -0.5, "bực bội": -0.6, "khó chịu": -0.5, "căng thẳng": -0.5, "stress": -0.5,
+    "áp lực": -0.4, "cô đơn": -0.6, "thất vọng": -0.7, "tệ": -0.7, "tồi tệ": -0.8, "ghét": -0.7,
+    "đau": -0.5, "đau khổ": -0.8, "khóc": -0.5, "tuyệt vọng": -0.9, "bế tắc": -0.6, "mất ngủ": -0.4,
+    "kiệt sức": -0.6, "nặng nề": -0.4, "u sầu": -0.7, "tủi thân": -0.6, "hoảng": -0.6, "xấu": -0.5,
+}
+
+# Modifier đứng trước từ cảm xúc -> intensity ("rất vui")
+VIETNAMESE_MODIFIERS = {
+    "rất": 1.3, "cực kỳ": 1.5, "vô cùng": 1.5, "siêu": 1.4, "khá": 1.1, "hơi": 0.7,
+}
+
+NEGATIONS = ["no", "not", "n't", "never", "không", "chẳng", "chả", "chưa", "đâu có", "không hề"]
+
+# Token đứng sau tăng cường đánh giá liền trước ("vui quá", "good!")
+BOOSTERS = {"!": 1.25, "quá": 1.3, "lắm": 1.3, "ghê": 1.2}
+
+# Emoji của quick-reply trên giao diện chat
+EMOJI = {"😊": 0.5, "😄": 0.8, "❤": 1.0, "😔": -0.5, "😢": -0.75, "😭": -1.0, "😰": -0.5, "😡": -0.75}
+
+# Dạng bỏ dấu ngắn hơn thế này dễ trùng từ khác ("tot", "so"), chỉ giữ dạng có dấu
+MIN_FOLDED_LENGTH = 4
+
+
+def english_entries():
+    """Lexicon tiếng Anh đúng như TextBlob dùng khi chấm điểm chuỗi (pos=None)"""
+    from textblob.en import sentiment
+    from textblob._text import EMOTICONS
+
+    sentiment.load()
+    words = {}
+    for word in dict.keys(sentiment):
+        polarity, _, intensity = dict.__getitem__(sentiment, word)[None]
+        words[word] = [round(polarity, 4), round(intensity, 4), int("RB" in dict.__getitem__(sentiment, word))]
+    emoticons = {}
+    for (_, polarity), faces in EMOTICONS.items():
+        for face in faces:
+            # pattern bỏ qua token toàn chữ cái ("xD") khi tìm emoticon
+            if not face.isalpha():
+                emoticons.setdefault(face.lower(), polarity)
+    return words, emoticons
+
+
+def vietnamese_entries(english):
+    words = {word: [polarity, 1.0, 0] for word, polarity in VIETNAMESE_POLARITY.items()}
+    words.update({word: [0.0, intensity, 1] for word, intensity in VIETNAMESE_MODIFIERS.items()})
+    negations = list(NEGATIONS)
+    boosters = dict(BOOSTERS)
+    # Dạng không dấu ("buon", "khong vui") cho người gõ không dấu, trừ khi trùng từ đã có
+    taken = set(english) | set(words) | set(negations) | set(boosters)
+    for word, entry in list(words.items()):
+        folded = fold_diacritics(word)
+        if folded not in taken and len(folded) >= MIN_FOLDED_LENGTH:
+            words[folded] = entry
+            taken.add(folded)
+    for negation in NEGATIONS:
+        folded = fold_diacritics(negation)
+        if folded not in taken and len(folded) >= MIN_FOLDED_LENGTH:
+            negations.append(folded)
+            taken.add(folded)
+    return words, negations, boosters
+
+
+def write_lexicon(path, words, negations, boosters, emoticons, source):
+    """Mỗi từ một dòng để diff artifact dễ đọc"""
+    lines = [
+        "{",
+        f'"format": {LEXICON_FORMAT},',
+        f'"source": {json.dumps(source)},',
+        f'"negations": {json.dumps(sorted(negations), ensure_ascii=False)},',
+        f'"boosters": {json.dumps(boosters, ensure_ascii=False, sort_keys=True)},',
+        f'"emoticons": {json.dumps(emoticons, ensure_ascii=False, sort_keys=True)},',
+        '"words": {',
+        ",\n".join(f"{json.dumps(word, ensure_ascii=False)}: {json.dumps(entry)}"
+                   for word, entry in sorted(words.items())),
+        "}",
+        "}",
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LEXICON_PATH
+    english, emoticons = english_entries()
+    vietnamese, negations, boosters = vietnamese_entries(english)
+    emoticons.update(EMOJI)
+    words = dict(english)
+    words.update(vietnamese)
+
+    write_lexicon(path, words, negations, boosters, emoticons,
+                  "textblob en-sentiment.xml + scripts/build_polarity_lexicon.py")
+    scorer = PolarityScorer(PolarityLexicon.load(path))
+    print(f"✅ {path}: {len(english):,} từ tiếng Anh, {len(vietnamese):,} từ/cụm từ tiếng Việt, "
+          f"{len(emoticons)} emoticon")
+    for text in ("very good!", "tôi rất vui", "khong vui lam", "not bad :)"):
+        print(f"  {text!r:<18} -> {scorer.analyze(text)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Compare Polarity vs TextBlob - Đối chiếu PolarityScorer (lexicon biên dịch sẵn) với TextBlob
+Báo cáo thời gian nạp, tỉ lệ cùng nhãn (positive/negative/neutral) theo ngôn ngữ, chênh lệch
+polarity, tốc độ mỗi tin nhắn và các câu lệch nhãn. Corpus: cột message của bảng conversations
+(nếu truyền đường dẫn database) hoặc bộ tin nhắn mẫu bên dưới
+
+Chạy từ thư mục gốc: python -m scripts.compare_polarity_textblob [đường dẫn database]
+"""
+
+import sqlite3
+import sys
+import time
+
+from utils.polarity import PolarityLexicon, PolarityScorer, polarity_label
+from utils.text_normalization import fold_diacritics
+
+SAMPLE_MESSAGES = [
+    # Tin nhắn tiếng Việt thường gặp (quick-reply và câu tự do)
+    "Có", "Không", "😊 Tôi vui", "😔 Tôi buồn", "😰 Tôi stress", "🤔 Không biết", "Tạm biệt", "Tiếp tục",
+    "Bắt đầu lại", "xin chào", "tôi buồn quá", "hôm nay mình thấy hơi mệt mỏi và lo lắng",
+    "thế tôi dùng sao", "bình thường thôi", "tôi vui và muốn tiếp tục", "không tôi không muốn",
+    "toi buon lam", "tôi rất hạnh phúc", "công việc áp lực quá", "tôi không vui", "cảm ơn bạn nhiều",
+    "mùi này thơm quá", "chán quá đi", "tôi thấy cô đơn", "ok...", "hôm nay trời đẹp",
+    # Tin nhắn tiếng Anh
+    "hello", "I am happy today", "I feel sad and tired", "this is not good", "this isn't good",
+    "very good!", "not bad at all", "I love this candle :)", "terrible day :(", "what do you suggest?",
+    "I'm really stressed out", "thanks, that was really helpful", "meh", "I am so angry right now",
+    "the scent is nice but a bit strong", "can you recommend something relaxing?", "awful, just awful",
+    "great, thank you!", "I'm not sure", "it was an ok experience", "I hate mondays", "best day ever :D",
+]
+ROUNDS = 200
+
+
+def load_corpus(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT message FROM conversations WHERE message IS NOT NULL AND message != ''").fetchall()
+    finally:
+        conn.close()
+    return [row[0] for row in rows]
+
+
+def is_vietnamese(text):
+    """Có chữ cái tiếng Việt có dấu (tin nhắn không dấu được tính là tiếng Anh)"""
+    return fold_diacritics(text) != text
+
+
+def time_per_message(func, messages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            func(message)
+    return (time.perf_counter() - start) / (rounds * len(messages)) * 1e6
+
+
+def main():
+    messages = load_corpus(sys.argv[1]) if len(sys.argv) > 1 else SAMPLE_MESSAGES
+    if not messages:
+        print("❌ Corpus rỗng")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    scorer = PolarityScorer(PolarityLexicon.load())
+    lexicon_load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    from textblob import TextBlob
+    TextBlob("warm up").sentiment
+    textblob_load = time.perf_counter() - start
+
+    def textblob_polarity(text):
+        return TextBlob(text).sentiment.polarity
+
+    print(f"🔍 PolarityScorer vs TextBlob ({len(messages):,} tin nhắn)")
+    print("=" * 60)
+    print(f"nạp: lexicon {lexicon_load * 1000:.1f}ms | import TextBlob + lần gọi đầu {textblob_load * 1000:.1f}ms")
+
+    groups = {'vi': [0, 0], 'en': [0, 0]}
+    diff_total = 0.0
+    mismatches = []
+    for message in messages:
+        ours, theirs = scorer.polarity(message), textblob_polarity(message)
+        same = polarity_label(ours)[0] == polarity_label(theirs)[0]
+        group = groups['vi' if is_vietnamese(message) else 'en']
+        group[0] += same
+        group[1] += 1
+        diff_total += abs(ours - theirs)
+        if not same:
+            mismatches.append((is_vietnamese(message), message, ours, theirs))
+
+    agreed = sum(group[0] for group in groups.values())
+    print(f"cùng nhãn: {agreed / len(messages):.1%} | chênh polarity TB {diff_total / len(messages):.3f}")
+    for language, (same, total) in groups.items():
+        if total:
+            print(f"  {language}: {same / total:.1%} ({same}/{total})")
+
+    rounds = max(1, ROUNDS * len(SAMPLE_MESSAGES) // len(messages))
+    ours_us = time_per_message(scorer.polarity, messages, rounds)
+    theirs_us = time_per_message(textblob_polarity, messages, rounds)
+    print(f"tốc độ: lexicon {ours_us:.1f}µs | TextBlob {theirs_us:.1f}µs | {theirs_us / ours_us:.1f}x")
+
+    if mismatches:
+        # TextBlob không hiểu tiếng Việt (polarity 0): lệch nhãn ở nhóm vi phần lớn là lexicon nhận ra cảm xúc
+        blind = sum(1 for _, _, _, theirs in mismatches if theirs == 0)
+        print(f"\nLệch nhãn ({len(mismatches)}, trong đó {blind} câu TextBlob trả về polarity 0):")
+        for _, message, ours, theirs in sorted(mismatches, key=lambda item: item[0])[:15]:
+            print(f"  {message[:40]!r:<44} lexicon {ours:+.3f} | TextBlob {theirs:+.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Import Fragrances - Nhập danh mục nến thơm của nhà cung cấp từ file CSV hoặc NDJSON
+Toàn bộ file vào database trong một transaction (Postgres: COPY vào bảng tạm rồi một câu INSERT),
+phiên bản danh mục chỉ đổi một lần nên các worker làm mới cache một lần. CSV cần dòng tiêu đề
+name,description,emotion,image_url; NDJSON mỗi dòng một object với các khóa đó
+
+Chạy từ thư mục gốc: python -m scripts.import_fragrances catalog.csv [--format ndjson] [--dedupe] [--skip-invalid]
+Backend theo FRAGRANCE_BACKEND/DATABASE_URL như api/app.py
+"""
+
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from db.fragrance_import import FORMATS, FragranceImportError, detect_format, import_fragrances
+from db.fragrance_store import create_fragrance_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import danh mục nến thơm hàng loạt")
+    parser.add_argument('path', help="file CSV/NDJSON, '-' để đọc stdin")
+    parser.add_argument('--format', choices=FORMATS, help="mặc định đoán theo phần mở rộng")
+    parser.add_argument('--dedupe', action='store_true', help="bỏ dòng trùng tên + cảm xúc (trong file và database)")
+    parser.add_argument('--skip-invalid', action='store_true', help="bỏ qua dòng lỗi thay vì hủy cả file")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    load_dotenv()
+    store = create_fragrance_store(
+        os.getenv('FRAGRANCE_BACKEND', 'postgres' if os.getenv('DATABASE_URL') else 'sqlite'))
+    fmt = args.format or detect_format(args.path)
+    try:
+        if args.path == '-':
+            report = import_fragrances(store, sys.stdin, fmt, args.dedupe, args.skip_invalid, args.batch_size)
+        else:
+            with open(args.path, encoding='utf-8-sig', newline='') as stream:
+                report = import_fragrances(store, stream, fmt, args.dedupe, args.skip_invalid, args.batch_size)
+    except FragranceImportError as e:
+        print(f"❌ {e}")
+        for error in e.errors:
+            print(f"   dòng {error['line']}: {error['error']}")
+        print("Không dòng nào được ghi")
+        sys.exit(1)
+    finally:
+        store.close()
+
+    print(f"✅ Đã thêm {report['inserted']}/{report['received']} nến thơm ({store.backend}) "
+          f"trong {report['seconds'] * 1000:.1f}ms")
+    print(f"   Trùng: {report['duplicates']}, dòng lỗi bỏ qua: {report['invalid']}")
+    for error in report['errors']:
+        print(f"   dòng {error['line']}: {error['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Rebuild Analytics Rollups - Dựng lại bảng rollup cảm xúc từ các dòng conversations gốc
+Dùng sau khi sửa/xóa dữ liệu conversations bằng tay hoặc khi nghi rollup bị lệch
+
+Chạy từ thư mục gốc: python -m scripts.rebuild_analytics_rollups [đường dẫn database]
+"""
+
+import sys
+import time
+
+from db.analytics import rebuild_rollups, sentiment_summary
+from db.connection import SQLiteConnectionManager
+from db.migrations import apply_migrations
+
+
+def main():
+    db_path = sys.argv[1] if len(sys.argv) > 1 else 'chatbot.db'
+    connections = SQLiteConnectionManager(db_path)
+    # Database cũ chưa có bảng rollup: migration tạo bảng và điền luôn
+    apply_migrations(connections)
+    has_rollups = connections.connection().execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversation_rollups'").fetchone()
+    if not has_rollups:
+        print(f"❌ {db_path} chưa có bảng conversations")
+        connections.close()
+        sys.exit(1)
+
+    start = time.perf_counter()
+    buckets = rebuild_rollups(connections)
+    elapsed = time.perf_counter() - start
+
+    total_messages, sentiment_stats = sentiment_summary(connections.connection())
+    print(f"📊 Dựng lại {buckets:,} bucket theo giờ từ {total_messages:,} tin nhắn trong {elapsed * 1000:.1f}ms")
+    for sentiment, count, avg_confidence in sentiment_stats:
+        average = f"{avg_confidence:.3f}" if avg_confidence is not None else "-"
+        print(f"  {str(sentiment):<10} {count:>10,} tin nhắn | confidence TB {average}")
+    connections.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Conversation Record - Bản ghi hội thoại gọn nhẹ cho active_conversations
+File này chứa ConversationRecord: state dạng IntEnum, lịch sử cảm xúc/nến thơm dạng mảng id
+có giới hạn, tuần tự hóa nhị phân vài chục byte để lưu ra store bên ngoài
+"""
+
+import struct
+import uuid
+from enum import IntEnum
+from typing import List, Optional
+
+from state_machine.conversation_state_machine import ConversationState, ConversationStateMachine
+
+# Mã state (1 byte), cùng thứ tự khai báo với ConversationState
+StateCode = IntEnum('StateCode', [state.name for state in ConversationState], start=0)
+
+# Mã cảm xúc: 0 là chưa có cảm xúc, thứ tự cố định để bản ghi đã lưu vẫn đọc được
+EMOTIONS = (None, "positive", "negative", "neutral")
+EMOTION_CODES = {emotion: code for code, emotion in enumerate(EMOTIONS)}
+
+# Định dạng nhị phân: version, state, emotion, confidence (float64), session id (uuid 16 byte),
+# độ dài user id (uint16), số cảm xúc, số nến thơm; sau đó là user id (utf-8), mã cảm xúc (1 byte)
+# và id nến thơm (uint32)
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<BBBd16sHBB')
+MAX_USER_ID_BYTES = 0xFFFF
+_FRAGRANCE_ID = struct.Struct('<I')
+
+
+class ConversationRecord:
+    """Trạng thái một cuộc hội thoại đang hoạt động, thay cho dict chứa cả state machine và list"""
+
+    __slots__ = ('user_id', '_session', 'state', 'emotion', 'confidence', 'emotions', 'fragrances')
+
+    # Chỉ giữ lịch sử gần nhất, đủ cho end_session mà không phình theo độ dài hội thoại
+    MAX_EMOTIONS = 32
+    MAX_FRAGRANCES = 16
+
+    def __init__(self, user_id: str, session_id: str):
+        self.user_id = user_id
+        self._session = uuid.UUID(session_id).bytes
+        self.state = StateCode.GREETING
+        self.emotion = 0
+        self.confidence = 0.0
+        # Mảng id đóng gói sẵn: mã cảm xúc 1 byte, id nến thơm uint32 little-endian
+        self.emotions = b''
+        self.fragrances = b''
+
+    @property
+    def session_id(self) -> str:
+        return str(uuid.UUID(bytes=self._session))
+
+    @property
+    def detected_emotion(self) -> Optional[str]:
+        return EMOTIONS[self.emotion]
+
+    @property
+    def emotions_discussed(self) -> List[Optional[str]]:
+        """Các cảm xúc đã trao đổi (dạng chuỗi, dùng cho end_session)"""
+        return [EMOTIONS[code] for code in self.emotions]
+
+    @property
+    def fragrance_ids(self) -> List[int]:
+        """Id các nến thơm đã gợi ý"""
+        return [fragrance_id for fragrance_id, in _FRAGRANCE_ID.iter_unpack(self.fragrances)]
+
+    def state_machine(self) -> ConversationStateMachine:
+        """Dựng state machine tạm thời từ bản ghi để xử lý một tin nhắn"""
+        machine = ConversationStateMachine()
+        machine.current_state = ConversationState[self.state.name]
+        machine.user_id = self.user_id
+        machine.detected_emotion = self.detected_emotion
+        machine.confidence = self.confidence
+        return machine
+
+    def update_from(self, machine: ConversationStateMachine):
+        """Ghi lại state sau khi state machine xử lý tin nhắn"""
+        self.state = StateCode[machine.current_state.name]
+        self.emotion = EMOTION_CODES[machine.detected_emotion]
+        self.confidence = machine.confidence
+
+    def add_emotion(self, emotion: Optional[str]):
+        """Thêm cảm xúc vào lịch sử (bỏ mục cũ nhất khi đầy)"""
+        self.emotions = (self.emotions + bytes((EMOTION_CODES[emotion],)))[-self.MAX_EMOTIONS:]
+
+    def add_fragrance(self, fragrance_id: int):
+        """Thêm id nến thơm đã gợi ý (bỏ mục cũ nhất khi đầy)"""
+        self.fragrances = (self.fragrances + _FRAGRANCE_ID.pack(fragrance_id))[-self.MAX_FRAGRANCES * 4:]
+
+    def to_bytes(self) -> bytes:
+        """Tuần tự hóa nhị phân"""
+        user_id = self.user_id.encode('utf-8')
+        if len(user_id) > MAX_USER_ID_BYTES:
+            raise ValueError(f"user_id dài {len(user_id)} byte, tối đa {MAX_USER_ID_BYTES}")
+        header = _HEADER.pack(FORMAT_VERSION, self.state, self.emotion, self.confidence, self._session,
+                              len(user_id), len(self.emotions), len(self.fragrances) // 4)
+        return header + user_id + self.emotions + self.fragrances
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'ConversationRecord':
+        """Khôi phục bản ghi từ to_bytes()"""
+        version, state, emotion, confidence, session, user_length, emotion_count, fragrance_count = \
+            _HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Không hỗ trợ phiên bản bản ghi: {version}")
+
+        offset = _HEADER.size
+        record = cls.__new__(cls)
+        record.user_id = data[offset:offset + user_length].decode('utf-8')
+        offset += user_length
+        record._session = session
+        record.state = StateCode(state)
+        record.emotion = emotion
+        record.confidence = confidence
+        record.emotions = bytes(data[offset:offset + emotion_count])
+        offset += emotion_count
+        record.fragrances = bytes(data[offset:offset + fragrance_count * 4])
+        return record
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ConversationRecord):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self) -> str:
+        return f"ConversationRecord(user_id={self.user_id!r}, state={self.state.name}, emotion={self.detected_emotion!r})"
@@ -3,10 +3,17 @@ Conversation State Machine - Quản lý luồng hội thoại chatbot
 File này chứa logic chuyển đổi giữa các trạng thái hội thoại
 """
 
-import re
 import logging
 from enum import Enum
-from typing import Dict, List, Tuple, Optional
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Tuple, Optional, Union
+
+from utils.keyword_matching import KeywordLexicon, best_category
+from utils.lru_cache import LRUCache
+from utils.text_normalization import NormalizedMessage
+
+# Tin nhắn thô hoặc đã chuẩn hóa sẵn (process_message chuẩn hóa một lần rồi truyền xuống)
+MessageInput = Union[str, NormalizedMessage]
 
 # Setup logger cho state machine
 state_logger = logging.getLogger('emotionai.state_machine')
@@ -21,42 +28,103 @@ class ConversationState(Enum):
     SUGGEST_FRAGRANCE = "suggest_fragrance"
     END_SESSION = "end_session"
 
+# Từ khóa cảm xúc (có dấu và không dấu)
+EMOTION_KEYWORDS = MappingProxyType({
+    "positive": (
+        "vui", "vui ve", "vui lắm", "vui lam", "hanh phuc", "hạnh phúc", "phấn khích", "phan khich", 
+        "tự hào", "tu hao", "biết ơn", "biet on", "yêu đời", "yeu doi",
+        "năng động", "nang dong", "tuyệt vời", "tuyet voi", "thích", "thich",
+        "rất vui", "rat vui", "cực vui", "cuc vui", "siêu vui", "sieu vui"
+    ),
+    "negative": (
+        "buồn", "buon", "buồn lắm", "buon lam", "mệt", "met", "chán", "chan", "lo lắng", "lo lang",
+        "tức", "tuc", "hờn", "hon", "stress", "căng thẳng", "cang thang",
+        "sợ hãi", "so hai", "cô đơn", "co don", "tuyệt vọng", "tuyet vong",
+        "khó khăn", "kho khan", "mất mát", "mat mat", "rất buồn", "rat buon"
+    ),
+    "neutral": (
+        "bình thường", "binh thuong", "ổn định", "on dinh", 
+        "không biết", "khong biet", "không chắc", "khong chac",
+        "bình yên", "binh yen", "tĩnh lặng", "tinh lang", "ok", "ổn", "on"
+    )
+})
+
+# Từ khóa đồng ý/từ chối
+AGREEMENT_KEYWORDS = ("có", "co", "ok", "okay", "muốn", "muon", "thích", "thich", "được", "duoc", "yes", "y", "tiếp tục", "tiep tuc")
+DISAGREEMENT_KEYWORDS = ("không", "khong", "no", "không muốn", "khong muon", "không thích", "khong thich")
+
+# Từ khóa kết thúc
+END_KEYWORDS = ("tạm biệt", "tam biet", "bye", "goodbye", "kết thúc", "ket thuc", "thôi", "thoi")
+
+# Từ khóa bắt đầu lại
+RESTART_KEYWORDS = ("bắt đầu lại", "restart", "bắt đầu", "mới", "lại từ đầu")
+
+
+class StateMachineLexicon:
+    """Từ khóa và bộ so khớp đã biên dịch - bất biến, một bản dùng chung cho mọi state machine"""
+
+    __slots__ = ('emotion_keywords', 'agreement_keywords', 'disagreement_keywords', 'end_keywords',
+                 'restart_keywords', 'emotion', 'agreement', 'disagreement', 'end', 'restart')
+
+    def __init__(self, emotion_keywords: Dict[str, Iterable[str]], agreement_keywords: Iterable[str],
+                 disagreement_keywords: Iterable[str], end_keywords: Iterable[str], restart_keywords: Iterable[str]):
+        emotion_keywords = MappingProxyType({emotion: tuple(words) for emotion, words in emotion_keywords.items()})
+        fields = {
+            'emotion_keywords': emotion_keywords,
+            'agreement_keywords': tuple(agreement_keywords),
+            'disagreement_keywords': tuple(disagreement_keywords),
+            'end_keywords': tuple(end_keywords),
+            'restart_keywords': tuple(restart_keywords),
+        }
+        # Biên dịch một lần: bỏ dấu + gộp trùng ("buồn"/"buon"), so khớp lại có phân biệt dấu
+        fields['emotion'] = KeywordLexicon(emotion_keywords, fold=True, whole_words=True)
+        fields['agreement'] = KeywordLexicon({"agreement": fields['agreement_keywords']}, fold=True)
+        fields['disagreement'] = KeywordLexicon({"disagreement": fields['disagreement_keywords']}, fold=True)
+        fields['end'] = KeywordLexicon({"end": fields['end_keywords']}, fold=True)
+        fields['restart'] = KeywordLexicon({"restart": fields['restart_keywords']}, fold=True)
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("StateMachineLexicon là bất biến, hãy tạo bản mới bằng replace()")
+
+    def replace(self, **changes) -> 'StateMachineLexicon':
+        """Tạo lexicon mới với một số danh sách từ khóa được thay thế"""
+        keywords = {name: getattr(self, name) for name in self.__slots__ if name.endswith('_keywords')}
+        keywords.update(changes)
+        return StateMachineLexicon(**keywords)
+
+
+# Lexicon mặc định, dùng chung cho mọi cuộc hội thoại
+DEFAULT_LEXICON = StateMachineLexicon(
+    emotion_keywords=EMOTION_KEYWORDS,
+    agreement_keywords=AGREEMENT_KEYWORDS,
+    disagreement_keywords=DISAGREEMENT_KEYWORDS,
+    end_keywords=END_KEYWORDS,
+    restart_keywords=RESTART_KEYWORDS,
+)
+
 class ConversationStateMachine:
+    # Mỗi hội thoại chỉ giữ state; lexicon và cache là thuộc tính class dùng chung
+    # (lexicon riêng: tạo subclass với lexicon = DEFAULT_LEXICON.replace(...))
+    __slots__ = ('current_state', 'user_id', 'detected_emotion', 'confidence')
+    
+    lexicon = DEFAULT_LEXICON
+    # Cache detect_emotion dùng chung cho mọi cuộc hội thoại (mỗi user một state machine)
+    emotion_cache = LRUCache(4096)
+    
     def __init__(self):
-        # Từ khóa cảm xúc (có dấu và không dấu)
-        self.emotion_keywords = {
-            "positive": [
-                "vui", "vui ve", "vui lắm", "vui lam", "hanh phuc", "hạnh phúc", "phấn khích", "phan khich", 
-                "tự hào", "tu hao", "biết ơn", "biet on", "yêu đời", "yeu doi",
-                "năng động", "nang dong", "tuyệt vời", "tuyet voi", "thích", "thich",
-                "rất vui", "rat vui", "cực vui", "cuc vui", "siêu vui", "sieu vui"
-            ],
-            "negative": [
-                "buồn", "buon", "buồn lắm", "buon lam", "mệt", "met", "chán", "chan", "lo lắng", "lo lang",
-                "tức", "tuc", "hờn", "hon", "stress", "căng thẳng", "cang thang",
-                "sợ hãi", "so hai", "cô đơn", "co don", "tuyệt vọng", "tuyet vong",
-                "khó khăn", "kho khan", "mất mát", "mat mat", "rất buồn", "rat buon"
-            ],
-            "neutral": [
-                "bình thường", "binh thuong", "ổn định", "on dinh", 
-                "không biết", "khong biet", "không chắc", "khong chac",
-                "bình yên", "binh yen", "tĩnh lặng", "tinh lang", "ok", "ổn", "on"
-            ]
-        }
-        
-        # Từ khóa đồng ý/từ chối
-        self.agreement_keywords = ["có", "co", "ok", "okay", "muốn", "muon", "thích", "thich", "được", "duoc", "yes", "y", "tiếp tục", "tiep tuc"]
-        self.disagreement_keywords = ["không", "khong", "no", "không muốn", "khong muon", "không thích", "khong thich"]
-        
-        # Từ khóa kết thúc
-        self.end_keywords = ["tạm biệt", "tam biet", "bye", "goodbye", "kết thúc", "ket thuc", "thôi", "thoi"]
-        
         # Khởi tạo state
         self.current_state = ConversationState.GREETING
         self.user_id = None
         self.detected_emotion = None
         self.confidence = 0.0
         
+    @classmethod
+    def cache_stats(cls) -> Dict[str, int]:
+        """Thống kê cache detect_emotion (hits/misses/evictions/invalidations)"""
+        return cls.emotion_cache.stats()
+    
     def reset_conversation(self, user_id: str):
         """Reset cuộc trò chuyện cho user mới"""
         self.current_state = ConversationState.GREETING
@@ -64,92 +132,91 @@ class ConversationStateMachine:
         self.detected_emotion = None
         self.confidence = 0.0
     
-    def detect_emotion(self, message: str) -> Tuple[str, float]:
+    def detect_emotion(self, message: MessageInput) -> Tuple[str, float]:
         """Phát hiện cảm xúc từ tin nhắn (tokenize, loại bỏ dấu câu, so khớp từ)"""
-        message_lower = message.lower()
-        # Loại bỏ dấu câu
-        message_clean = re.sub(r'[^\w\s]', ' ', message_lower)
-        tokens = message_clean.split()
+        normalized = NormalizedMessage.of(message)
+        message = normalized.text
         
-        # Đếm từ khóa cho mỗi loại cảm xúc
-        emotion_scores = {"positive": 0, "negative": 0, "neutral": 0}
-        for emotion_type, keywords in self.emotion_keywords.items():
-            for keyword in keywords:
-                # So khớp từng từ hoặc cụm từ
-                keyword_tokens = keyword.split()
-                if len(keyword_tokens) == 1:
-                    if keyword in tokens:
-                        emotion_scores[emotion_type] += 1
-                else:
-                    # So khớp cụm từ
-                    if keyword in message_clean:
-                        emotion_scores[emotion_type] += 1
+        detected_emotion, confidence = self.emotion_cache.get_or_compute(
+            (self.lexicon, normalized.stripped), lambda: self._score_emotion(normalized))
+        if confidence == 0.0:
+            state_logger.debug(f"🔍 No emotion detected in: '{message[:50]}...'")
+            return detected_emotion, confidence
+        
+        state_logger.info(f"🎯 Emotion detected: '{message[:50]}...' -> {detected_emotion} (confidence: {confidence:.3f})")
+        return detected_emotion, confidence
+    
+    def _score_emotion(self, normalized: NormalizedMessage) -> Tuple[str, float]:
+        """Chấm điểm cảm xúc (không qua cache)"""
+        # Đếm từ khóa cho mỗi loại cảm xúc (từ đơn khớp nguyên token, cụm từ khớp chuỗi con)
+        hits, exact = self.lexicon.emotion.match_accents(normalized.clean, normalized.folded)
+        emotion_scores = self.lexicon.emotion.count(hits)
+        exact_scores = self.lexicon.emotion.count(exact)
         
         # Xác định cảm xúc chính
         max_score = max(emotion_scores.values())
         if max_score == 0:
-            state_logger.debug(f"🔍 No emotion detected in: '{message[:50]}...'")
             return "neutral", 0.0
         
-        # Tìm cảm xúc có điểm cao nhất
-        detected_emotion = max(emotion_scores, key=emotion_scores.get)
+        # Tìm cảm xúc có điểm cao nhất (hòa điểm thì ưu tiên khớp đúng dấu)
+        detected_emotion = best_category(emotion_scores, exact_scores)
         confidence = min(max_score / 3.0, 1.0)  # Normalize confidence
-        
-        state_logger.info(f"🎯 Emotion detected: '{message[:50]}...' -> {detected_emotion} (confidence: {confidence:.3f})")
         return detected_emotion, confidence
     
-    def detect_agreement(self, message: str) -> bool:
+    def detect_agreement(self, message: MessageInput) -> bool:
         """Phát hiện user có đồng ý không"""
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in self.agreement_keywords)
+        return self._has_keyword(self.lexicon.agreement, message)
     
-    def detect_disagreement(self, message: str) -> bool:
+    def detect_disagreement(self, message: MessageInput) -> bool:
         """Phát hiện user có từ chối không"""
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in self.disagreement_keywords)
+        return self._has_keyword(self.lexicon.disagreement, message)
     
-    def detect_end_intent(self, message: str) -> bool:
+    def detect_end_intent(self, message: MessageInput) -> bool:
         """Phát hiện user muốn kết thúc"""
-        message_lower = message.lower()
-        return any(keyword in message_lower for keyword in self.end_keywords)
+        return self._has_keyword(self.lexicon.end, message)
     
-    def detect_restart_intent(self, message: str) -> bool:
+    def detect_restart_intent(self, message: MessageInput) -> bool:
         """Phát hiện user muốn bắt đầu lại"""
-        message_lower = message.lower()
-        restart_keywords = ["bắt đầu lại", "restart", "bắt đầu", "mới", "lại từ đầu"]
-        return any(keyword in message_lower for keyword in restart_keywords)
+        return self._has_keyword(self.lexicon.restart, message)
+    
+    def _has_keyword(self, lexicon: KeywordLexicon, message: MessageInput) -> bool:
+        """Tin nhắn có chứa ít nhất một từ khóa của lexicon không"""
+        normalized = NormalizedMessage.of(message)
+        return bool(lexicon.match(normalized.clean, normalized.folded))
     
     def process_message(self, message: str) -> Dict:
         """Xử lý tin nhắn và trả về phản hồi phù hợp"""
+        # Chuẩn hóa một lần, các bước detect bên dưới dùng chung
+        normalized = NormalizedMessage(message)
         
         previous_state = self.current_state.value
         state_logger.debug(f"🔄 Processing message: '{message[:50]}...' in state: {previous_state}")
         
         # Kiểm tra intent bắt đầu lại
-        if self.detect_restart_intent(message):
+        if self.detect_restart_intent(normalized):
             state_logger.info(f"🔄 Restart intent detected, resetting conversation for user: {self.user_id}")
             self.reset_conversation(self.user_id)
-            return self._handle_greeting_state(message)
+            return self._handle_greeting_state(normalized)
         
         # Kiểm tra intent kết thúc
-        if self.detect_end_intent(message):
+        if self.detect_end_intent(normalized):
             state_logger.info(f"🔄 End intent detected, ending session for user: {self.user_id}")
             self.current_state = ConversationState.END_SESSION
             return self._get_end_response()
         
         # Xử lý theo state hiện tại
         if self.current_state == ConversationState.GREETING:
-            result = self._handle_greeting_state(message)
+            result = self._handle_greeting_state(normalized)
         elif self.current_state == ConversationState.SMALL_TALK:
-            result = self._handle_small_talk_state(message)
+            result = self._handle_small_talk_state(normalized)
         elif self.current_state == ConversationState.EMOTION_DETECTED:
-            result = self._handle_emotion_detected_state(message)
+            result = self._handle_emotion_detected_state(normalized)
         elif self.current_state == ConversationState.UNKNOWN_CONTEXT:
-            result = self._handle_unknown_context_state(message)
+            result = self._handle_unknown_context_state(normalized)
         elif self.current_state == ConversationState.ASK_FEELING:
-            result = self._handle_ask_feeling_state(message)
+            result = self._handle_ask_feeling_state(normalized)
         elif self.current_state == ConversationState.SUGGEST_FRAGRANCE:
-            result = self._handle_suggest_fragrance_state(message)
+            result = self._handle_suggest_fragrance_state(normalized)
         else:  # END_SESSION
             result = self._get_end_response()
         
@@ -159,7 +226,7 @@ class ConversationStateMachine:
         
         return result
     
-    def _handle_greeting_state(self, message: str) -> Dict:
+    def _handle_greeting_state(self, message: MessageInput) -> Dict:
         """Xử lý state GREETING"""
         self.current_state = ConversationState.SMALL_TALK
         return {
@@ -168,7 +235,7 @@ class ConversationStateMachine:
             "suggestions": ["😊 Tôi vui", "😔 Tôi buồn", "😰 Tôi stress", "🤔 Không biết"]
         }
     
-    def _handle_small_talk_state(self, message: str) -> Dict:
+    def _handle_small_talk_state(self, message: MessageInput) -> Dict:
         """Xử lý state SMALL_TALK"""
         # Phát hiện cảm xúc
         emotion, confidence = self.detect_emotion(message)
@@ -187,7 +254,7 @@ class ConversationStateMachine:
                 "suggestions": ["Có", "Không", "🤔 Không biết"]
             }
     
-    def _handle_emotion_detected_state(self, message: str) -> Dict:
+    def _handle_emotion_detected_state(self, message: MessageInput) -> Dict:
         """Xử lý state EMOTION_DETECTED"""
         if self.detect_agreement(message):
             self.current_state = ConversationState.SUGGEST_FRAGRANCE
@@ -200,7 +267,7 @@ class ConversationStateMachine:
                 "suggestions": ["😊 Tôi vui", "😔 Tôi buồn", "😰 Tôi stress"]
             }
     
-    def _handle_unknown_context_state(self, message: str) -> Dict:
+    def _handle_unknown_context_state(self, message: MessageInput) -> Dict:
         """Xử lý state UNKNOWN_CONTEXT"""
         if self.detect_agreement(message):
             self.current_state = ConversationState.ASK_FEELING
@@ -217,7 +284,7 @@ class ConversationStateMachine:
                 "suggestions": ["😊 Tôi vui", "😔 Tôi buồn", "😰 Tôi stress"]
             }
     
-    def _handle_ask_feeling_state(self, message: str) -> Dict:
+    def _handle_ask_feeling_state(self, message: MessageInput) -> Dict:
         """Xử lý state ASK_FEELING"""
         # Phát hiện cảm xúc
         emotion, confidence = self.detect_emotion(message)
@@ -235,7 +302,7 @@ class ConversationStateMachine:
                 "suggestions": ["😊 Tôi vui", "😔 Tôi buồn", "😰 Tôi stress"]
             }
     
-    def _handle_suggest_fragrance_state(self, message: str) -> Dict:
+    def _handle_suggest_fragrance_state(self, message: MessageInput) -> Dict:
         """Xử lý state SUGGEST_FRAGRANCE"""
         if self.detect_agreement(message):
             self.current_state = ConversationState.ASK_FEELING
@@ -4,7 +4,7 @@ Debug Emotion Detection
 Kiểm tra chi tiết các trường hợp bị sai
 """
 
-from ImprovedEmotionDetector import ImprovedEmotionDetector
+from detectors.ImprovedEmotionDetector import ImprovedEmotionDetector
 
 def debug_specific_cases():
     """Debug các trường hợp cụ thể bị sai"""
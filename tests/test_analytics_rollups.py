@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test Analytics Rollups
+Kiểm tra rollup cảm xúc: trigger cập nhật theo từng lô ghi, khớp với GROUP BY trên dữ liệu gốc,
+migration điền rollup cho database cũ và dựng lại sau khi sửa dữ liệu bằng tay
+"""
+
+import random
+import tempfile
+
+from db.analytics import rebuild_rollups, sentiment_summary
+from db.conversation_writer import ConversationWriter
+from db.migrations import apply_migrations
+from db.schema import create_app_db
+
+
+def raw_summary(conn):
+    """Cách tính cũ của /api/analytics trên toàn bảng conversations"""
+    total = conn.execute('SELECT COUNT(*) FROM conversations').fetchone()[0]
+    rows = conn.execute('''
+        SELECT sentiment, COUNT(*) as count, AVG(confidence) as avg_confidence
+        FROM conversations
+        GROUP BY sentiment
+    ''').fetchall()
+    return total, rows
+
+
+def assert_same_summary(conn):
+    total, rows = sentiment_summary(conn)
+    expected_total, expected_rows = raw_summary(conn)
+    assert total == expected_total
+    assert [(row[0], row[1]) for row in rows] == [(row[0], row[1]) for row in expected_rows]
+    for row, expected in zip(rows, expected_rows):
+        assert abs(row[2] - expected[2]) < 1e-9
+
+
+def insert_rows(writer, rng, count):
+    for i in range(count):
+        writer.write(("u1", "s1", f"tin nhắn {i}", "phản hồi", rng.choice(["positive", "negative", "neutral"]),
+                      rng.random(), None, "small_talk"))
+
+
+def test_writer_batches_update_rollups():
+    """Lô ghi của ConversationWriter cập nhật rollup trong cùng transaction"""
+    rng = random.Random(3)
+    with tempfile.TemporaryDirectory() as directory:
+        manager = create_app_db(directory)
+        writer = ConversationWriter(connections=manager, batch_size=50)
+        insert_rows(writer, rng, 500)
+        writer.close()
+        assert_same_summary(manager.connection())
+        manager.close()
+
+
+def test_migration_backfills_existing_rows():
+    """Database đã có conversations trước khi có rollup được điền khi migrate"""
+    rng = random.Random(5)
+    with tempfile.TemporaryDirectory() as directory:
+        manager = create_app_db(directory, migrate=False)
+        writer = ConversationWriter(connections=manager, synchronous=True)
+        insert_rows(writer, rng, 120)
+        with manager.transaction() as conn:
+            conn.execute("INSERT INTO conversations (message, sentiment, confidence, timestamp) "
+                         "VALUES ('cũ', 'negative', 0.9, '2024-01-01 08:30:00')")
+        apply_migrations(manager)
+        conn = manager.connection()
+        assert_same_summary(conn)
+        assert conn.execute("SELECT message_count FROM conversation_rollups WHERE bucket = '2024-01-01 08:00:00'"
+                            ).fetchone()[0] == 1
+        writer.close()
+        manager.close()
+
+
+def test_rebuild_after_manual_edit():
+    """Sửa dữ liệu gốc không qua INSERT làm rollup lệch; rebuild_rollups đưa về đúng"""
+    rng = random.Random(9)
+    with tempfile.TemporaryDirectory() as directory:
+        manager = create_app_db(directory)
+        writer = ConversationWriter(connections=manager, synchronous=True)
+        insert_rows(writer, rng, 200)
+        with manager.transaction() as conn:
+            conn.execute("DELETE FROM conversations WHERE sentiment = 'neutral'")
+        conn = manager.connection()
+        assert sentiment_summary(conn)[0] == 200  # DELETE không qua trigger
+        assert rebuild_rollups(manager) > 0
+        assert_same_summary(conn)
+        writer.close()
+        manager.close()
+
+
+def test_summary_reads_constant_rows():
+    """Bảng tổng chỉ có một dòng mỗi sentiment, không phụ thuộc số tin nhắn"""
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as directory:
+        manager = create_app_db(directory)
+        writer = ConversationWriter(connections=manager, batch_size=500)
+        insert_rows(writer, rng, 3000)
+        writer.close()
+        conn = manager.connection()
+        assert conn.execute("SELECT COUNT(*) FROM conversation_totals").fetchone()[0] == 3
+        total, rows = sentiment_summary(conn)
+        assert total == 3000 and len(rows) == 3
+        manager.close()
+
+
+if __name__ == "__main__":
+    test_writer_batches_update_rollups()
+    test_migration_backfills_existing_rows()
+    test_rebuild_after_manual_edit()
+    test_summary_reads_constant_rows()
+    print("✅ Analytics rollup tests passed!")
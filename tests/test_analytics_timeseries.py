@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Test Analytics Timeseries
+Kiểm tra chuỗi thời gian cảm xúc từ rollup theo giờ: chọn độ rộng bucket theo số điểm tối đa,
+gộp đúng số tin nhắn/confidence/gợi ý nến thơm, bucket rỗng và range scan trên khóa chính
+"""
+
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+from db.analytics import choose_bucket_hours, sentiment_timeseries
+from db.schema import create_app_db
+
+YEAR_START = datetime(2024, 1, 1)
+
+
+def create_year_db(directory, rows=5000):
+    """Một năm tin nhắn với thời điểm ngẫu nhiên; trả về manager và danh sách dòng đã ghi"""
+    rng = random.Random(13)
+    manager = create_app_db(directory)
+    data = []
+    for _ in range(rows):
+        timestamp = YEAR_START + timedelta(seconds=rng.randrange(366 * 24 * 3600))
+        data.append((rng.choice(["positive", "negative", "neutral"]), rng.random(),
+                     '{"fragrance": {"name": "Lavender"}}' if rng.random() < 0.3 else None,
+                     timestamp.strftime('%Y-%m-%d %H:%M:%S')))
+    with manager.transaction() as conn:
+        conn.executemany('''
+            INSERT INTO conversations (sentiment, confidence, fragrance_recommendation, timestamp)
+            VALUES (?, ?, ?, ?)
+        ''', data)
+    return manager, data
+
+
+def downsampled_points(start, end, max_points):
+    with tempfile.TemporaryDirectory() as directory:
+        manager, _ = create_year_db(directory, rows=0)
+        bucket_hours = choose_bucket_hours(start, end, max_points=max_points)
+        points = sentiment_timeseries(manager.connection(), start, end, bucket_hours)
+        manager.close()
+    return points
+
+
+def test_choose_bucket_hours():
+    """Bucket nhỏ nhất (không nhỏ hơn yêu cầu) cho ra tối đa max_points điểm"""
+    start = datetime(2024, 1, 1)
+    assert choose_bucket_hours(start, start + timedelta(days=1)) == 1
+    assert choose_bucket_hours(start, start + timedelta(days=365)) == 24
+    assert choose_bucket_hours(start, start + timedelta(days=365), 'week') == 168
+    assert choose_bucket_hours(start, start + timedelta(days=30), 'hour', max_points=100) == 12
+    assert choose_bucket_hours(start, start + timedelta(days=3650), max_points=10) == 8760
+    for days, points in [(7, 48), (30, 7), (400, 31)]:
+        end = start + timedelta(days=days, hours=5)
+        assert len(downsampled_points(start + timedelta(hours=13), end, points)) <= points
+    try:
+        choose_bucket_hours(start, start + timedelta(days=1), 'minute')
+        assert False, "bucket không hợp lệ phải báo lỗi"
+    except ValueError:
+        pass
+
+
+def test_year_downsampled_matches_raw_rows():
+    """Một năm dữ liệu gộp thành <= 500 điểm, tổng khớp với các dòng gốc"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager, data = create_year_db(directory)
+        end = YEAR_START + timedelta(days=366)
+        bucket_hours = choose_bucket_hours(YEAR_START, end, max_points=500)
+        points = sentiment_timeseries(manager.connection(), YEAR_START, end, bucket_hours)
+        assert bucket_hours == 24 and len(points) == 366
+
+        assert sum(point['total'] for point in points) == len(data)
+        assert sum(point['fragrance_suggestions'] for point in points) == sum(1 for row in data if row[2])
+
+        day = datetime(2024, 6, 15)
+        expected = [row for row in data if row[3].startswith(day.strftime('%Y-%m-%d'))]
+        point = points[(day - YEAR_START).days]
+        assert point['start'] == '2024-06-15 00:00:00' and point['total'] == len(expected)
+        negatives = [row[1] for row in expected if row[0] == "negative"]
+        if negatives:
+            assert point['sentiments']['negative']['count'] == len(negatives)
+            assert point['sentiments']['negative']['avg_confidence'] == round(sum(negatives) / len(negatives), 3)
+        manager.close()
+
+
+def test_partial_range_and_empty_buckets():
+    """Khoảng ngoài dữ liệu trả về bucket rỗng; start được làm tròn xuống đầu giờ"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager, _ = create_year_db(directory, rows=200)
+        start = datetime(2026, 3, 1, 10, 45)
+        points = sentiment_timeseries(manager.connection(), start, start + timedelta(hours=6), 2)
+        assert [point['start'] for point in points] == [
+            '2026-03-01 10:00:00', '2026-03-01 12:00:00', '2026-03-01 14:00:00', '2026-03-01 16:00:00']
+        assert all(point['total'] == 0 and point['sentiments'] == {} for point in points)
+        manager.close()
+
+
+def test_timeseries_uses_rollup_range_scan():
+    """Truy vấn đọc rollup bằng range scan trên khóa chính, không đọc conversations"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager, _ = create_year_db(directory, rows=10)
+        plan = [row[3] for row in manager.connection().execute('''
+            EXPLAIN QUERY PLAN
+            SELECT bucket, sentiment, message_count FROM conversation_rollups WHERE bucket >= ? AND bucket < ?
+        ''', ('2024-01-01 00:00:00', '2024-02-01 00:00:00'))]
+        assert any('SEARCH conversation_rollups' in step and 'bucket>?' in step for step in plan), plan
+        manager.close()
+
+
+if __name__ == "__main__":
+    test_choose_bucket_hours()
+    test_year_downsampled_matches_raw_rows()
+    test_partial_range_and_empty_buckets()
+    test_timeseries_uses_rollup_range_scan()
+    print("✅ Analytics timeseries tests passed!")
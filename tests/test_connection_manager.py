@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Test Connection Manager
+Kiểm tra SQLiteConnectionManager: cấu hình WAL, kết nối theo luồng, rollback khi lỗi,
+transaction lồng (unit of work), reader không bị chặn sau writer và UserDatabase dùng chung manager
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from db.connection import SQLiteConnectionManager
+from db.user_database import UserDatabase
+
+
+def test_connection_configured_once():
+    """Kết nối mở một lần cho mỗi luồng, với WAL và busy timeout"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = SQLiteConnectionManager(os.path.join(directory, "test.db"), busy_timeout_ms=1234)
+        conn = manager.connection()
+        assert manager.connection() is conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(manager.connection()))
+        thread.start()
+        thread.join()
+        assert other[0] is not conn
+        assert manager.stats()['connections_opened'] == 2
+        manager.close()
+        assert manager.stats()['open_connections'] == 0
+
+
+def test_transaction_rollback():
+    """transaction() commit khi thành công, rollback khi có lỗi"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = SQLiteConnectionManager(os.path.join(directory, "test.db"))
+        with manager.transaction() as conn:
+            conn.execute("CREATE TABLE items (name TEXT)")
+            conn.execute("INSERT INTO items VALUES ('a')")
+        try:
+            with manager.transaction() as conn:
+                conn.execute("INSERT INTO items VALUES ('b')")
+                raise RuntimeError("lỗi giữa transaction")
+        except RuntimeError:
+            pass
+        names = [name for name, in manager.connection().execute("SELECT name FROM items")]
+        assert names == ["a"]
+        stats = manager.stats()
+        assert stats['transactions'] == 1 and stats['rollbacks'] == 1
+        manager.close()
+
+
+def test_nested_transaction_is_one_unit_of_work():
+    """Transaction lồng chỉ commit một lần; lỗi bên trong chỉ hoàn tác phần của nó"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = SQLiteConnectionManager(os.path.join(directory, "test.db"))
+        db = UserDatabase(connections=manager)
+        commits = manager.stats()['transactions']
+        with manager.transaction():
+            db.create_session("u1", "s1")
+            db.get_or_create_user("u1")
+            try:
+                with manager.transaction() as conn:
+                    conn.execute("INSERT INTO users (user_id) VALUES ('u2')")
+                    raise RuntimeError("lỗi trong lệnh con")
+            except RuntimeError:
+                pass
+            db.save_user_preference("u1", "negative", "Lavender Dream")
+        assert manager.stats()['transactions'] == commits + 1
+
+        conn = manager.connection()
+        assert [user for user, in conn.execute("SELECT user_id FROM users")] == ["u1"]
+        assert conn.execute("SELECT COUNT(*) FROM user_preferences").fetchone()[0] == 1
+
+        try:
+            with manager.transaction():
+                db.create_session("u1", "s2")
+                raise RuntimeError("lỗi cuối lượt chat")
+        except RuntimeError:
+            pass
+        assert conn.execute("SELECT COUNT(*) FROM conversation_sessions").fetchone()[0] == 1
+        manager.close()
+
+
+
+def test_after_commit_runs_once_outermost_commits():
+    """Callback chạy sau commit ngoài cùng; SAVEPOINT hoặc transaction rollback thì bị bỏ"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = SQLiteConnectionManager(os.path.join(directory, "test.db"))
+        ran = []
+        manager.after_commit(lambda: ran.append("ngay"))
+        with manager.transaction():
+            manager.after_commit(lambda: ran.append("ngoài"))
+            try:
+                with manager.transaction():
+                    manager.after_commit(lambda: ran.append("savepoint lỗi"))
+                    raise RuntimeError("lỗi trong lệnh con")
+            except RuntimeError:
+                pass
+            with manager.transaction():
+                manager.after_commit(lambda: ran.append("savepoint"))
+            assert ran == ["ngay"]
+        assert ran == ["ngay", "ngoài", "savepoint"]
+
+        try:
+            with manager.transaction():
+                manager.after_commit(lambda: ran.append("rollback"))
+                raise RuntimeError("lỗi")
+        except RuntimeError:
+            pass
+        with manager.transaction():
+            pass
+        assert ran == ["ngay", "ngoài", "savepoint"]
+        manager.close()
+
+def test_reader_not_blocked_by_writer():
+    """Trong khi một luồng giữ transaction ghi, luồng khác vẫn đọc được ngay (snapshot đã commit)"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = SQLiteConnectionManager(os.path.join(directory, "test.db"), busy_timeout_ms=100)
+        with manager.transaction() as conn:
+            conn.execute("CREATE TABLE items (name TEXT)")
+            conn.execute("INSERT INTO items VALUES ('a')")
+
+        writing, release = threading.Event(), threading.Event()
+
+        def writer():
+            with manager.transaction() as conn:
+                conn.execute("INSERT INTO items VALUES ('b')")
+                writing.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        assert writing.wait(5)
+        count = manager.connection().execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        release.set()
+        thread.join()
+        assert count == 1
+        assert manager.connection().execute("SELECT COUNT(*) FROM items").fetchone()[0] == 2
+        manager.close()
+
+
+def test_immediate_transaction_survives_concurrent_commit():
+    """Đọc rồi ghi trong một lượt: worker khác commit xen giữa làm BEGIN thường lỗi ngay,
+    BEGIN IMMEDIATE giữ khóa ghi từ đầu nên worker kia chờ và cả hai đều ghi được"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.db")
+        manager = SQLiteConnectionManager(path)
+        db = UserDatabase(connections=manager)
+        other_worker = SQLiteConnectionManager(path, busy_timeout_ms=5000)
+
+        def commit_from_other_worker(user_id):
+            with other_worker.transaction() as conn:
+                conn.execute("INSERT INTO users (user_id) VALUES (?)", (user_id,))
+
+        # BEGIN thường: snapshot đọc đã cũ, busy timeout không cứu được
+        try:
+            with manager.transaction():
+                db.get_personalized_suggestion("u1", "negative")
+                commit_from_other_worker("other_1")
+                db.save_user_preference("u1", "negative", "Lavender Dream")
+            assert False, "BEGIN thường phải lỗi khi writer khác commit xen giữa"
+        except sqlite3.OperationalError as e:
+            assert "locked" in str(e)
+
+        with manager.transaction(immediate=True):
+            db.get_personalized_suggestion("u1", "negative")
+            thread = threading.Thread(target=commit_from_other_worker, args=("other_2",))
+            thread.start()
+            time.sleep(0.05)  # worker kia đang chờ khóa ghi
+            db.save_user_preference("u1", "negative", "Lavender Dream")
+        thread.join()
+
+        conn = manager.connection()
+        assert conn.execute("SELECT COUNT(*) FROM user_preferences").fetchone()[0] == 1
+        users = {user for user, in conn.execute("SELECT user_id FROM users")}
+        assert users == {"other_1", "other_2"}
+        other_worker.close()
+        manager.close()
+
+
+def test_user_database_shares_manager():
+    """UserDatabase ghi/đọc qua manager chung, không mở kết nối mới cho mỗi lệnh"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = SQLiteConnectionManager(os.path.join(directory, "test.db"))
+        db = UserDatabase(connections=manager)
+        db.get_or_create_user("u1")
+        db.save_user_preference("u1", "positive", "Nến Hương Cam Quýt", 4)
+        db.save_user_preference("u1", "positive", "Nến Hương Cam Quýt", 4)
+        assert db.get_favorite_fragrance("u1", "positive") == "Nến Hương Cam Quýt"
+        assert db.get_user_preferences("u1")[0]['used_count'] == 2
+        assert manager.stats()['connections_opened'] == 1
+        manager.close()
+
+
+if __name__ == "__main__":
+    test_connection_configured_once()
+    test_transaction_rollback()
+    test_nested_transaction_is_one_unit_of_work()
+    test_after_commit_runs_once_outermost_commits()
+    test_reader_not_blocked_by_writer()
+    test_immediate_transaction_survives_concurrent_commit()
+    test_user_database_shares_manager()
+    print("✅ Connection manager tests passed!")
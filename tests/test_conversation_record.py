@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test Conversation Record
+Kiểm tra bản ghi hội thoại gọn: dựng lại state machine, lịch sử có giới hạn
+và tuần tự hóa nhị phân vài chục byte
+"""
+
+import uuid
+
+from state_machine.conversation_record import MAX_USER_ID_BYTES, ConversationRecord, StateCode
+from state_machine.conversation_state_machine import ConversationState
+
+
+def new_record(user_id="user_1"):
+    return ConversationRecord(user_id, str(uuid.uuid4()))
+
+
+def test_state_machine_round_trip():
+    """State machine dựng từ bản ghi tiếp tục đúng luồng hội thoại"""
+    record = new_record()
+    for message in ["xin chào", "tôi buồn", "có"]:
+        machine = record.state_machine()
+        machine.process_message(message)
+        record.update_from(machine)
+    assert record.state == StateCode.SUGGEST_FRAGRANCE
+    assert record.detected_emotion == "negative"
+
+    machine = record.state_machine()
+    assert machine.current_state == ConversationState.SUGGEST_FRAGRANCE
+    assert machine.get_detected_emotion() == ("negative", record.confidence)
+    assert machine.user_id == "user_1"
+
+
+def test_history_is_bounded():
+    """Lịch sử cảm xúc và nến thơm chỉ giữ các mục gần nhất"""
+    record = new_record()
+    for i in range(ConversationRecord.MAX_EMOTIONS + 5):
+        record.add_emotion("positive" if i % 2 else None)
+    for fragrance_id in range(ConversationRecord.MAX_FRAGRANCES + 3):
+        record.add_fragrance(fragrance_id)
+    assert len(record.emotions_discussed) == ConversationRecord.MAX_EMOTIONS
+    assert record.emotions_discussed[-2:] == ["positive", None]
+    assert record.fragrance_ids == list(range(3, ConversationRecord.MAX_FRAGRANCES + 3))
+
+
+def test_binary_round_trip():
+    """to_bytes/from_bytes giữ nguyên bản ghi và chỉ tốn vài chục byte"""
+    record = new_record("người_dùng_1")
+    machine = record.state_machine()
+    machine.process_message("xin chào")
+    machine.process_message("tôi buồn")
+    record.update_from(machine)
+    record.add_emotion("negative")
+    record.add_fragrance(70000)
+
+    data = record.to_bytes()
+    assert len(data) < 64
+    restored = ConversationRecord.from_bytes(data)
+    assert restored == record
+    assert restored.session_id == record.session_id
+    assert restored.fragrance_ids == [70000]
+    assert restored.emotions_discussed == ["negative"]
+
+
+def test_user_id_length_limit():
+    """user_id tới MAX_USER_ID_BYTES byte vẫn lưu được; dài hơn thì ValueError rõ ràng thay vì struct.error"""
+    longest = new_record("a" * MAX_USER_ID_BYTES)
+    assert ConversationRecord.from_bytes(longest.to_bytes()) == longest
+    try:
+        new_record("ư" * MAX_USER_ID_BYTES).to_bytes()
+        assert False, "user_id quá dài phải báo lỗi"
+    except ValueError as e:
+        assert "user_id" in str(e)
+
+
+if __name__ == "__main__":
+    test_state_machine_round_trip()
+    test_history_is_bounded()
+    test_binary_round_trip()
+    test_user_id_length_limit()
+    print("✅ Conversation record tests passed!")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test Conversation Writer
+Kiểm tra hàng đợi ghi conversations theo lô: chế độ đồng bộ, gom lô theo kích thước
+và thời gian, ghi nốt khi đóng và số liệu
+"""
+
+import os
+import sqlite3
+import tempfile
+import time
+
+from db.conversation_writer import ConversationWriter
+
+
+def create_db(directory):
+    path = os.path.join(directory, "chatbot.db")
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT, session_id TEXT, message TEXT, response TEXT, sentiment TEXT,
+            confidence REAL, fragrance_recommendation TEXT, conversation_state TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.close()
+    return path
+
+
+def row(i):
+    return ("user_1", "session_1", f"tin nhắn {i}", "phản hồi", "neutral", 0.5, None, "small_talk")
+
+
+def count_rows(path):
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_synchronous_mode():
+    """Chế độ đồng bộ ghi ngay khi gọi write()"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = create_db(directory)
+        writer = ConversationWriter(path, synchronous=True)
+        writer.write(row(1))
+        assert count_rows(path) == 1
+        writer.close()
+        assert writer.stats()['rows_written'] == 1
+
+
+def test_batches_by_size():
+    """Dòng được gom thành lô tối đa batch_size, giữ đúng thứ tự"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = create_db(directory)
+        writer = ConversationWriter(path, batch_size=100, flush_interval_ms=1000)
+        for i in range(250):
+            writer.write(row(i))
+        writer.flush()
+        stats = writer.stats()
+        assert count_rows(path) == 250
+        assert stats['queue_depth'] == 0 and stats['rows_written'] == 250
+        assert 3 <= stats['batches'] < 250
+        conn = sqlite3.connect(path)
+        messages = [message for message, in conn.execute("SELECT message FROM conversations ORDER BY id")]
+        conn.close()
+        assert messages == [f"tin nhắn {i}" for i in range(250)]
+        writer.close()
+
+
+def test_flushes_by_interval():
+    """Lô chưa đầy vẫn được ghi sau flush_interval_ms"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = create_db(directory)
+        writer = ConversationWriter(path, batch_size=1000, flush_interval_ms=20)
+        writer.write(row(1))
+        deadline = time.monotonic() + 2
+        while count_rows(path) == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert count_rows(path) == 1
+        writer.close()
+
+
+def test_close_flushes_queue():
+    """close() ghi nốt hàng đợi; dòng đến sau khi đóng được ghi trực tiếp"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = create_db(directory)
+        writer = ConversationWriter(path, batch_size=50, flush_interval_ms=10000)
+        for i in range(30):
+            writer.write(row(i))
+        writer.close()
+        assert count_rows(path) == 30
+        writer.write(row(30))
+        assert count_rows(path) == 31
+
+
+def test_failed_batch_is_counted():
+    """Lỗi ghi (ví dụ thiếu bảng) được ghi nhận, không làm chết luồng ghi"""
+    with tempfile.TemporaryDirectory() as directory:
+        writer = ConversationWriter(os.path.join(directory, "empty.db"), flush_interval_ms=5)
+        writer.write(row(1))
+        writer.flush()
+        writer.write(row(2))
+        writer.flush()
+        assert writer.stats()['rows_failed'] == 2
+        writer.close()
+
+
+if __name__ == "__main__":
+    test_synchronous_mode()
+    test_batches_by_size()
+    test_flushes_by_interval()
+    test_close_flushes_queue()
+    test_failed_batch_is_counted()
+    print("✅ Conversation writer tests passed!")
@@ -1,7 +1,7 @@
 """
 Test Emotion Detection - Kiểm tra nhận diện cảm xúc với nhiều biến thể câu
 """
-from conversation_state_machine import ConversationStateMachine
+from state_machine.conversation_state_machine import ConversationStateMachine
 
 def test_emotion_detection():
     test_cases = [
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Test Fragrance Catalog
+Kiểm tra cache danh mục nến thơm: đọc không gọi database, làm mới khi phiên bản đổi
+(add_fragrance trong worker hoặc sửa từ nơi khác), người đọc không chờ refresh và lỗi
+database giữ snapshot cũ
+"""
+
+import threading
+import time
+
+from db.fragrance_catalog import FragranceCatalog
+
+
+class FakeFragranceSource:
+    """Thay PostgresDatabase: đếm truy vấn, phiên bản tăng sau mỗi lần sửa như trigger"""
+
+    def __init__(self):
+        self.rows = [
+            {'id': 1, 'name': 'Lavender', 'description': 'calm', 'emotion': 'negative', 'image_url': None},
+            {'id': 2, 'name': 'Citrus', 'description': 'fresh', 'emotion': 'positive', 'image_url': None},
+        ]
+        self.version = 1
+        self.queries = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def get_fragrances(self, emotion=None):
+        self.release.wait(5)
+        self.queries += 1
+        if self.error:
+            raise self.error
+        return [dict(row) for row in self.rows if emotion is None or row['emotion'] == emotion]
+
+    def get_fragrance_by_id(self, fragrance_id):
+        self.queries += 1
+        return next((dict(row) for row in self.rows if row['id'] == fragrance_id), None)
+
+    def add_fragrance(self, name, description, emotion, image_url=None):
+        row = {'id': len(self.rows) + 1, 'name': name, 'description': description,
+               'emotion': emotion, 'image_url': image_url}
+        self.rows.append(row)
+        self.version += 1
+        return dict(row)
+
+    def catalog_version(self):
+        if self.error:
+            raise self.error
+        return self.version
+
+
+def test_reads_served_from_snapshot():
+    """Sau lần nạp đầu, đọc theo cảm xúc và theo id không chạm database"""
+    source = FakeFragranceSource()
+    catalog = FragranceCatalog(source, poll_interval=0)
+    catalog.start()
+    queries = source.queries
+    for _ in range(100):
+        assert [row['name'] for row in catalog.get_fragrances('negative')] == ['Lavender']
+        assert catalog.get_fragrance_by_id(2)['name'] == 'Citrus'
+    assert catalog.get_fragrances('unknown') == [] and catalog.get_fragrance_by_id(99) is None
+    assert len(catalog.get_fragrances()) == 2
+    assert source.queries == queries
+    # Danh sách trả về là bản sao, sửa không ảnh hưởng snapshot
+    catalog.get_fragrances('negative').clear()
+    assert len(catalog.get_fragrances('negative')) == 1
+
+
+def test_add_and_external_change_refresh():
+    """add_fragrance làm mới ngay; sửa từ worker khác được nhận khi poll thấy phiên bản mới"""
+    source = FakeFragranceSource()
+    catalog = FragranceCatalog(source, poll_interval=0)
+    catalog.start()
+    catalog.add_fragrance('Rose', 'sweet', 'positive')
+    assert catalog.version == 2 and len(catalog.get_fragrances('positive')) == 2
+
+    assert catalog.refresh() is False  # phiên bản không đổi: chỉ đọc một dòng
+    source.rows.append({'id': 4, 'name': 'Mint', 'description': '', 'emotion': 'neutral', 'image_url': None})
+    source.version += 1
+    assert catalog.refresh() is True
+    assert catalog.get_fragrance_by_id(4)['name'] == 'Mint'
+
+
+def test_poller_picks_up_new_version():
+    """Luồng nền poll phiên bản và thay snapshot"""
+    source = FakeFragranceSource()
+    catalog = FragranceCatalog(source, poll_interval=0.01)
+    catalog.start()
+    source.rows.append({'id': 3, 'name': 'Mint', 'description': '', 'emotion': 'neutral', 'image_url': None})
+    source.version += 1
+    deadline = time.time() + 2
+    while catalog.version != 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert catalog.get_fragrance_by_id(3) is not None
+    catalog.close()
+
+
+def test_readers_do_not_block_during_refresh():
+    """Refresh chậm không chặn người đọc: họ thấy snapshot cũ cho đến khi snapshot mới sẵn sàng"""
+    source = FakeFragranceSource()
+    catalog = FragranceCatalog(source, poll_interval=0)
+    catalog.start()
+    source.version += 1
+    source.release.clear()
+    refresher = threading.Thread(target=catalog.refresh)
+    refresher.start()
+    time.sleep(0.05)
+
+    start = time.perf_counter()
+    assert len(catalog.get_fragrances()) == 2 and catalog.version == 1
+    assert time.perf_counter() - start < 0.05
+    assert catalog.refresh() is False  # refresh khác đang chạy: bỏ qua, không chờ
+    source.release.set()
+    refresher.join()
+    assert catalog.version == 2
+
+
+def test_keyset_pages():
+    """Phân trang theo id: sắp theo id dù database trả lộn xộn, cursor là id cuối trang, lọc cảm xúc"""
+    source = FakeFragranceSource()
+    source.rows = [{'id': i, 'name': f'Nến {i}', 'description': '', 'image_url': None,
+                    'emotion': 'negative' if i % 2 else 'positive'} for i in (7, 3, 9, 1, 5, 2, 8, 4, 6)]
+    catalog = FragranceCatalog(source, poll_interval=0)
+    catalog.start()
+    queries = source.queries
+
+    rows, cursor, version = catalog.page(limit=4)
+    assert [row['id'] for row in rows] == [1, 2, 3, 4] and cursor == 4 and version == 1
+    rows, cursor, _ = catalog.page(cursor, limit=4)
+    assert [row['id'] for row in rows] == [5, 6, 7, 8] and cursor == 8
+    rows, cursor, _ = catalog.page(cursor, limit=4)
+    assert [row['id'] for row in rows] == [9] and cursor is None
+
+    rows, cursor, _ = catalog.page(3, limit=2, emotion='negative')
+    assert [row['id'] for row in rows] == [5, 7] and cursor == 7
+    assert catalog.page(7, limit=2, emotion='negative')[:2] == ([source.rows[2]], None)
+    assert catalog.page(emotion='unknown')[:2] == ([], None)
+    assert source.queries == queries
+
+
+def test_errors_keep_last_snapshot():
+    """Database lỗi: giữ snapshot cũ; chưa nạp được lần nào thì đọc thẳng database"""
+    source = FakeFragranceSource()
+    source.error = RuntimeError("database down")
+    catalog = FragranceCatalog(source, poll_interval=0)
+    catalog.start()
+    assert catalog.version is None and catalog.stats()['refresh_errors'] == 1
+    source.error = None
+    assert len(catalog.get_fragrances()) == 2 and catalog.stats()['passthrough_reads'] == 1
+
+    assert catalog.refresh() is True
+    source.error = RuntimeError("database down")
+    assert catalog.refresh() is False
+    assert len(catalog.get_fragrances()) == 2 and catalog.stats()['refresh_errors'] == 2
+
+
+if __name__ == "__main__":
+    test_reads_served_from_snapshot()
+    test_add_and_external_change_refresh()
+    test_poller_picks_up_new_version()
+    test_readers_do_not_block_during_refresh()
+    test_keyset_pages()
+    test_errors_keep_last_snapshot()
+    print("✅ Fragrance catalog tests passed!")
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Test Fragrance Import
+Kiểm tra import danh mục nến thơm hàng loạt: CSV/NDJSON, dòng lỗi hủy cả file (hoặc bị bỏ qua
+với skip_invalid), dedupe theo tên + cảm xúc, phiên bản danh mục đổi một lần, và backend
+Postgres COPY vào bảng tạm rồi chỉ chạy một câu INSERT
+"""
+
+import csv
+import io
+import os
+import tempfile
+from contextlib import contextmanager
+
+from db.connection import SQLiteConnectionManager
+from db.fragrance_catalog import FragranceCatalog
+from db.fragrance_import import FragranceImportError, detect_format, import_fragrances, validate_fragrance
+from db.fragrance_store import MemoryFragranceStore, SQLiteFragranceStore
+from db.postgres_database import PostgresDatabase
+
+CSV_CATALOG = """name,description,emotion,image_url
+Nến Quế,Ấm áp,neutral,https://example.com/que.jpg
+Nến Hoa Nhài, Dịu nhẹ ,Positive,
+Nến Quế,Bản trùng,neutral,
+"""
+
+
+def test_validate_fragrance():
+    """Chuẩn hóa khoảng trắng/chữ hoa, ô trống thành None; thiếu trường hoặc sai giá trị thì báo lỗi"""
+    row = validate_fragrance({'name': ' Nến Trà ', 'description': '', 'emotion': 'NEGATIVE'})
+    assert row == {'name': 'Nến Trà', 'description': None, 'emotion': 'negative', 'image_url': None}
+    for record, reason in [({'emotion': 'positive'}, 'thiếu tên'),
+                           ({'name': 'A'}, 'thiếu cảm xúc'),
+                           ({'name': 'A', 'emotion': 'angry'}, 'không thuộc'),
+                           ({'name': 'A', 'emotion': 'positive', 'image_url': 'ftp://x'}, 'image_url'),
+                           ({'name': 5, 'emotion': 'positive'}, 'phải là chuỗi'),
+                           (['A'], 'object')]:
+        try:
+            validate_fragrance(record)
+            assert False, f"{record} phải không hợp lệ"
+        except ValueError as e:
+            assert reason in str(e)
+    assert detect_format('catalog.ndjson') == 'ndjson'
+    assert detect_format(content_type='application/x-ndjson') == 'ndjson'
+    assert detect_format('catalog.csv', 'text/csv') == 'csv'
+
+
+def test_csv_import_refreshes_catalog_once():
+    """Import CSV qua catalog: một transaction, catalog làm mới một lần, dedupe bỏ dòng trùng"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteFragranceStore(os.path.join(directory, "chatbot.db"))
+        catalog = FragranceCatalog(store, poll_interval=0)
+        catalog.start()
+        count, refreshes = len(catalog.get_fragrances()), catalog.refreshes
+
+        report = import_fragrances(catalog, io.StringIO(CSV_CATALOG), 'csv', dedupe=True)
+        assert (report['received'], report['inserted'], report['duplicates'], report['invalid']) == (3, 2, 1, 0)
+        assert catalog.refreshes == refreshes + 1
+        assert len(catalog.get_fragrances()) == count + 2
+        jasmine = next(row for row in catalog.get_fragrances('positive') if row['name'] == 'Nến Hoa Nhài')
+        assert jasmine['description'] == 'Dịu nhẹ' and jasmine['image_url'] is None
+
+        # Chạy lại cùng file với dedupe: mọi dòng đã có trong database
+        report = import_fragrances(catalog, io.StringIO(CSV_CATALOG), 'csv', dedupe=True)
+        assert report['inserted'] == 0 and report['duplicates'] == 3
+        assert catalog.refreshes == refreshes + 1
+        store.close()
+
+
+def test_invalid_rows_abort_or_skip():
+    """Có dòng lỗi: mặc định không ghi dòng nào; skip_invalid ghi dòng hợp lệ và báo số dòng lỗi"""
+    ndjson = '{"name": "Nến Sả", "emotion": "negative"}\n\n{"name": "", "emotion": "negative"}\n{bad json\n'
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteFragranceStore(os.path.join(directory, "chatbot.db"))
+        count, version = len(store.get_fragrances()), store.catalog_version()
+        try:
+            import_fragrances(store, io.StringIO(ndjson), 'ndjson')
+            assert False, "dòng lỗi phải hủy import"
+        except FragranceImportError as e:
+            assert e.invalid == 2 and [error['line'] for error in e.errors] == [3, 4]
+        assert len(store.get_fragrances()) == count and store.catalog_version() == version
+
+        report = import_fragrances(store, io.StringIO(ndjson), 'ndjson', skip_invalid=True)
+        assert report['inserted'] == 1 and report['invalid'] == 2
+        assert len(store.get_fragrances()) == count + 1
+        store.close()
+
+
+def test_sqlite_import_bumps_version_once():
+    """SQLite: seed và mỗi lần import tăng phiên bản đúng một lần, sửa từng dòng vẫn tăng qua trigger"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteFragranceStore(os.path.join(directory, "chatbot.db"))
+        assert store.catalog_version() == 1
+        report = import_fragrances(store, io.StringIO(CSV_CATALOG), 'csv')
+        assert report['inserted'] == 3 and store.catalog_version() == 2
+        report = import_fragrances(store, io.StringIO(CSV_CATALOG), 'csv', dedupe=True)
+        assert report['inserted'] == 0 and store.catalog_version() == 2
+        store.add_fragrance('Nến Trà Xanh', None, 'neutral')
+        assert store.catalog_version() == 3
+        store.close()
+
+
+def test_sqlite_import_streams_without_write_lock():
+    """Trong lúc body upload còn đang stream (và validate), writer khác vẫn ghi được chatbot.db;
+    khóa ghi chỉ được lấy cho câu INSERT ... SELECT cuối cùng"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "chatbot.db")
+        store = SQLiteFragranceStore(path)
+        other_worker = SQLiteConnectionManager(path, busy_timeout_ms=100)
+        with other_worker.transaction() as conn:
+            conn.execute('CREATE TABLE conversations (id INTEGER PRIMARY KEY, message TEXT)')
+
+        def upload(count):
+            for i in range(count):
+                # Như ConversationWriter của worker khác ghi xen giữa các lô của upload
+                with other_worker.transaction() as conn:
+                    conn.execute('INSERT INTO conversations (message) VALUES (?)', (f'tin nhắn {i}',))
+                yield f'{{"name": "Nến {i}", "emotion": "neutral"}}\n'
+            yield '{"name": "", "emotion": "neutral"}\n'
+
+        version = store.catalog_version()
+        try:
+            import_fragrances(store, upload(30), 'ndjson', batch_size=4)
+            assert False, "dòng lỗi phải hủy import"
+        except FragranceImportError:
+            pass
+        report = import_fragrances(store, upload(30), 'ndjson', skip_invalid=True, batch_size=4)
+        assert report['inserted'] == 30 and store.catalog_version() == version + 1
+        assert other_worker.connection().execute('SELECT COUNT(*) FROM conversations').fetchone()[0] == 60
+        other_worker.close()
+        store.close()
+
+
+def test_memory_store_bumps_version_once():
+    """Memory: nhiều dòng chỉ tăng phiên bản một lần, dedupe trong cùng file"""
+    store = MemoryFragranceStore(rows=[])
+    result = store.bulk_add_fragrances(
+        [{'name': f'Nến {i % 50}', 'description': None, 'emotion': 'neutral', 'image_url': None} for i in range(120)],
+        dedupe=True, batch_size=16)
+    assert result == {'received': 120, 'inserted': 50, 'duplicates': 70}
+    assert store.catalog_version() == 1 and len(store.get_fragrances()) == 50
+
+
+class CopyCursor:
+    """Cursor psycopg2 giả: nhận COPY vào bảng tạm, ghi lại các câu lệnh"""
+
+    def __init__(self, server):
+        self.server = server
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        statement = ' '.join(sql.split())
+        self.server.statements.append(statement)
+        if statement.startswith('INSERT INTO fragrances') and 'fragrance_import' in statement:
+            self.rowcount = len(self.server.staged)
+            self.server.rows.extend(self.server.staged)
+
+    def copy_expert(self, sql, buffer):
+        self.server.statements.append(sql.split()[0])
+        self.server.staged.extend(csv.reader(buffer))
+
+
+class CopyServer:
+    def __init__(self):
+        self.statements = []
+        self.staged = []
+        self.rows = []
+
+    def cursor(self):
+        return CopyCursor(self)
+
+
+class CopyPool:
+    def __init__(self, server):
+        self.server = server
+
+    @contextmanager
+    def connection(self):
+        yield self.server
+
+    def warm_up(self):
+        pass
+
+
+def test_postgres_copy_single_insert():
+    """Postgres: COPY từng lô vào bảng tạm, một câu INSERT ... SELECT cho cả file"""
+    server = CopyServer()
+    db = PostgresDatabase(pool=CopyPool(server))
+    server.statements.clear()
+    rows = [{'name': f'Nến {i}', 'description': None, 'emotion': 'positive', 'image_url': None} for i in range(25)]
+    result = db.bulk_add_fragrances(rows, batch_size=10)
+    assert result == {'received': 25, 'inserted': 25, 'duplicates': 0}
+    assert server.statements.count('COPY') == 3
+    inserts = [s for s in server.statements if s.startswith('INSERT')]
+    assert len(inserts) == 1 and 'ORDER BY position' in inserts[0]
+    # Cột rỗng (None) được gửi dưới dạng ô trống không trích dẫn = NULL trong COPY csv
+    assert server.staged[0] == ['0', 'Nến 0', '', 'positive', '']
+    assert db.bulk_add_fragrances([]) == {'received': 0, 'inserted': 0, 'duplicates': 0}
+
+
+if __name__ == "__main__":
+    test_validate_fragrance()
+    test_csv_import_refreshes_catalog_once()
+    test_invalid_rows_abort_or_skip()
+    test_sqlite_import_bumps_version_once()
+    test_sqlite_import_streams_without_write_lock()
+    test_memory_store_bumps_version_once()
+    test_postgres_copy_single_insert()
+    print("✅ Fragrance import tests passed!")
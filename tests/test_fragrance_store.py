@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test Fragrance Store
+Kiểm tra các backend danh mục nến thơm nhúng (SQLite, memory): seed từ FragranceMapper,
+cùng hợp đồng với PostgresDatabase (get/add/catalog_version), chọn backend theo cấu hình
+và FragranceCatalog nhận thay đổi từ worker khác qua phiên bản trong SQLite
+"""
+
+import os
+import tempfile
+
+from db.connection import SQLiteConnectionManager
+from db.fragrance_catalog import FragranceCatalog
+from db.fragrance_store import (FRAGRANCE_COLUMNS, FragranceStore, MemoryFragranceStore,
+                                SQLiteFragranceStore, create_fragrance_store, seed_fragrances)
+from utils.fragrance_mapping import FragranceMapper
+
+
+def check_store_contract(store):
+    mapper = FragranceMapper()
+    seeded = sum(len(data['fragrances']) for data in mapper.emotion_fragrance_map.values())
+    fragrances = store.get_fragrances()
+    assert len(fragrances) == seeded
+    assert all(tuple(row) == FRAGRANCE_COLUMNS for row in fragrances)
+    negative = store.get_fragrances('negative')
+    assert {row['name'] for row in negative} == {f['name'] for f in mapper.emotion_fragrance_map['negative']['fragrances']}
+    assert store.get_fragrance_by_id(negative[0]['id']) == negative[0]
+    assert store.get_fragrance_by_id(10_000) is None
+
+    version = store.catalog_version()
+    added = store.add_fragrance('Nến Hoa Hồng', 'Lãng mạn', 'positive', 'https://example.com/rose.jpg')
+    assert store.catalog_version() > version
+    assert store.get_fragrance_by_id(added['id']) == added
+    assert len(store.get_fragrances('positive')) == len(mapper.emotion_fragrance_map['positive']['fragrances']) + 1
+
+
+def test_sqlite_store_seeds_once():
+    """SQLite: seed khi bảng trống, khởi tạo lại không seed trùng, dữ liệu còn sau khi mở lại"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "chatbot.db")
+        store = SQLiteFragranceStore(path)
+        check_store_contract(store)
+        count = len(store.get_fragrances())
+        store.close()
+
+        reopened = SQLiteFragranceStore(path)
+        assert len(reopened.get_fragrances()) == count
+        assert reopened.seed() == 0
+        reopened.close()
+
+
+def test_memory_store():
+    """Memory: cùng hợp đồng, dict trả về là bản sao"""
+    store = MemoryFragranceStore()
+    check_store_contract(store)
+    store.get_fragrances()[0]['name'] = 'đã sửa'
+    assert store.get_fragrance_by_id(1)['name'] != 'đã sửa'
+    assert MemoryFragranceStore(rows=[]).get_fragrances() == []
+
+
+def test_seed_rows_from_mapper():
+    """Mỗi nến thơm của FragranceMapper thành một dòng, mô tả gồm lợi ích và mùi hương"""
+    rows = seed_fragrances()
+    lavender = next(row for row in rows if 'Oải Hương' in row['name'])
+    assert lavender['emotion'] == 'negative' and 'Lavender' in lavender['description']
+
+
+def test_factory_selects_backend():
+    """create_fragrance_store chọn backend theo tên, bỏ qua tham số pool của Postgres"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = SQLiteConnectionManager(os.path.join(directory, "chatbot.db"))
+        store = create_fragrance_store('sqlite', connections=manager, min_size=1, max_size=10)
+        assert store.backend == 'sqlite' and store.connections is manager
+        assert create_fragrance_store('memory', connections=manager, acquire_timeout=5).backend == 'memory'
+        try:
+            create_fragrance_store('mongodb')
+            assert False, "backend không hợp lệ phải báo lỗi"
+        except ValueError:
+            pass
+        manager.close()
+
+
+def test_incomplete_backend_fails_at_creation():
+    """Backend thiếu phương thức của FragranceStore báo lỗi ngay khi tạo, không đợi lần gọi đầu"""
+    class ReadOnlyStore(FragranceStore):
+        def get_fragrances(self, emotion=None):
+            return []
+
+    try:
+        ReadOnlyStore()
+        assert False, "backend thiếu phương thức phải không tạo được"
+    except TypeError as e:
+        assert 'add_fragrance' in str(e) and 'catalog_version' in str(e)
+
+
+def test_catalog_sees_other_worker_changes():
+    """Worker khác thêm nến thơm vào cùng file SQLite: trigger tăng phiên bản, catalog làm mới"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "chatbot.db")
+        catalog = FragranceCatalog(SQLiteFragranceStore(path), poll_interval=0)
+        catalog.start()
+        count = len(catalog.get_fragrances())
+
+        other_worker = SQLiteFragranceStore(path)
+        other_worker.add_fragrance('Nến Quế', 'Ấm áp', 'neutral')
+        assert catalog.refresh() is True
+        assert len(catalog.get_fragrances()) == count + 1
+        other_worker.close()
+        catalog.source.close()
+
+
+if __name__ == "__main__":
+    test_sqlite_store_seeds_once()
+    test_memory_store()
+    test_seed_rows_from_mapper()
+    test_factory_selects_backend()
+    test_incomplete_backend_fails_at_creation()
+    test_catalog_sees_other_worker_changes()
+    print("✅ Fragrance store tests passed!")
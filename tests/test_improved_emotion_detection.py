@@ -6,7 +6,7 @@ Kiểm tra logic cải thiện phân loại cảm xúc và intent detection
 
 import re
 from typing import Dict, List, Tuple, Optional
-from ImprovedEmotionDetector import ImprovedEmotionDetector
+from detectors.ImprovedEmotionDetector import ImprovedEmotionDetector
 
 def test_improved_detection():
     """Test logic cải thiện"""
@@ -108,6 +108,21 @@ def test_specific_cases():
         
         print(f"{status} '{message}' -> {intent} (expected: {expected_intent})")
 
+def test_analyze_batch_matches_analyze_message():
+    """analyze_batch phải cho kết quả giống hệt analyze_message từng tin nhắn"""
+    detector = ImprovedEmotionDetector()
+    messages = [
+        "ok", "có", "không", "tạm biệt", "bắt đầu lại", "thế tôi dùng sao", "tôi vui", "tôi buồn",
+        "stre...", "....", "vậy", "không biết", "tôi vui và muốn tiếp tục", "ok tôi buồn",
+        "không tôi không muốn", "thôi", "tôi thôi", "😊 Tôi vui", "Có", "Có", "", "hôm nay mệt mỏi quá",
+    ]
+    
+    results = detector.analyze_batch(messages)
+    
+    assert results == [detector.analyze_message(message) for message in messages]
+    assert results[18] is not results[19]  # Tin nhắn trùng vẫn nhận dict riêng
+    assert detector.analyze_batch([]) == []
+
 if __name__ == "__main__":
     # Test logic cải thiện
     success = test_improved_detection()
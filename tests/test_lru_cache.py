@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test LRU Cache
+Kiểm tra cache kết quả có giới hạn trước analyze_message và detect_emotion:
+bộ đếm hit/miss/eviction, an toàn đa luồng và invalidation khi lexicon thay đổi
+"""
+
+import threading
+
+from detectors.ImprovedEmotionDetector import ImprovedEmotionDetector
+from state_machine.conversation_state_machine import DEFAULT_LEXICON, ConversationStateMachine
+from utils.lru_cache import LRUCache
+
+
+def test_lru_eviction_and_counters():
+    """Vượt maxsize thì loại mục ít dùng nhất"""
+    cache = LRUCache(2)
+    assert cache.get_or_compute("a", lambda: 1) == 1
+    assert cache.get_or_compute("b", lambda: 2) == 2
+    assert cache.get_or_compute("a", lambda: -1) == 1  # hit, "a" thành mới dùng nhất
+    assert cache.get_or_compute("c", lambda: 3) == 3   # loại "b"
+    assert cache.get_or_compute("b", lambda: 4) == 4
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['size']) == (1, 4, 2, 2)
+
+
+def test_lru_thread_safe():
+    """Nhiều luồng cùng đọc/ghi không làm hỏng cache hay bộ đếm"""
+    cache = LRUCache(50)
+
+    def worker(offset):
+        for i in range(2000):
+            key = (i + offset) % 80
+            assert cache.get_or_compute(key, lambda: key * 2) == key * 2
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == 8 * 2000
+    assert stats['size'] <= 50
+
+
+def test_detector_cache():
+    """Tin nhắn lặp lại (khác hoa/thường) được lấy từ cache, kết quả trả về là bản sao"""
+    detector = ImprovedEmotionDetector(cache_size=16)
+    first = detector.analyze_message("Tôi buồn quá")
+    first["type"] = "mutated"
+    second = detector.analyze_message("tôi buồn quá")
+    assert second["type"] == "emotion"
+    assert detector.cache_stats()['hits'] == 1
+
+
+def test_detector_cache_invalidated_on_lexicon_change():
+    """compile_lexicons() xóa cache để từ khóa mới có hiệu lực ngay"""
+    detector = ImprovedEmotionDetector()
+    assert detector.detect_emotion("đồ xịn xò") == ("neutral", 0.0)
+    assert detector.analyze_message("đồ xịn xò")["type"] == "unknown"
+    detector.emotion_keywords["positive"].append("xịn xò")
+    detector.compile_lexicons()
+    assert detector.analyze_message("đồ xịn xò")["emotion"] == "positive"
+    assert detector.cache_stats()['size'] == 1
+
+
+def test_state_machine_cache_shared():
+    """Cache detect_emotion dùng chung giữa các cuộc hội thoại có cùng lexicon"""
+    before = ConversationStateMachine.cache_stats()
+    first, second = ConversationStateMachine(), ConversationStateMachine()
+    result = first.detect_emotion("mình thấy cô đơn quá")
+    assert second.detect_emotion("mình thấy cô đơn quá!") == result
+    assert ConversationStateMachine.cache_stats()['hits'] == before['hits'] + 1
+
+    # Lexicon riêng của một máy không đọc nhầm kết quả của máy khác
+    emotion_keywords = dict(DEFAULT_LEXICON.emotion_keywords)
+    emotion_keywords["positive"] += ("cô đơn",)
+    emotion_keywords["negative"] = tuple(word for word in emotion_keywords["negative"] if word != "cô đơn")
+
+    class CustomMachine(ConversationStateMachine):
+        lexicon = DEFAULT_LEXICON.replace(emotion_keywords=emotion_keywords)
+
+    custom = CustomMachine()
+    assert custom.detect_emotion("mình thấy cô đơn quá")[0] == "positive"
+    assert ConversationStateMachine().detect_emotion("mình thấy cô đơn quá") == result
+
+
+if __name__ == "__main__":
+    test_lru_eviction_and_counters()
+    test_lru_thread_safe()
+    test_detector_cache()
+    test_detector_cache_invalidated_on_lexicon_change()
+    test_state_machine_cache_shared()
+    print("✅ LRU cache tests passed!")
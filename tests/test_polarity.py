@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test Polarity
+Kiểm tra PolarityScorer với lexicon đã biên dịch: cùng kết quả với thuật toán của TextBlob
+cho tiếng Anh (modifier, phủ định, "!", emoticon), lexicon tiếng Việt có/không dấu và
+ngưỡng (sentiment, confidence) như analyze_sentiment
+"""
+
+import time
+
+from utils.polarity import PolarityLexicon, PolarityScorer, polarity_label
+
+# Giá trị TextBlob 0.17.1 (pattern en-sentiment.xml) cho cùng câu
+TEXTBLOB_POLARITY = {
+    "this is not good": -0.35,
+    "very good!": 1.0,
+    "not very good :)": 0.11538,
+    "I am happy :D": 0.9,
+    "really not good": -0.35,
+    "good.  Bad!": -0.0875,
+    "hello": 0.0,
+}
+
+
+def test_english_matches_textblob():
+    """Lexicon tiếng Anh và thuật toán assessments cho cùng polarity với TextBlob"""
+    scorer = PolarityScorer()
+    for text, expected in TEXTBLOB_POLARITY.items():
+        assert abs(scorer.polarity(text) - expected) < 1e-4, (text, scorer.polarity(text))
+    # TextBlob tách "isn't" thành "n ' t" nên bỏ sót phủ định; ở đây "n't" là phủ định
+    assert scorer.polarity("this isn't good") == scorer.polarity("this is not good")
+
+
+def test_vietnamese_lexicon():
+    """Từ/cụm từ tiếng Việt, modifier, phủ định, từ tăng cường và dạng không dấu"""
+    scorer = PolarityScorer()
+    assert scorer.tokenize("tôi rất hạnh phúc") == ["tôi", "rất", "hạnh phúc"]
+    assert scorer.analyze("tôi buồn")[0] == "negative"
+    assert scorer.analyze("toi buon")[0] == "negative"
+    assert scorer.polarity("tôi rất vui") > scorer.polarity("tôi vui") > scorer.polarity("tôi hơi vui") > 0
+    assert scorer.polarity("tôi vui quá") > scorer.polarity("tôi vui")
+    assert scorer.analyze("tôi không vui")[0] == "negative"
+    assert scorer.analyze("khong vui")[0] == "negative"
+    assert scorer.analyze("😔 Tôi buồn")[0] == "negative"
+    assert scorer.analyze("Có") == ("neutral", 1.0)
+
+
+def test_polarity_label_thresholds():
+    """Cùng ngưỡng với analyze_sentiment dùng TextBlob trước đây"""
+    assert polarity_label(0.5) == ("positive", 0.5)
+    assert polarity_label(-0.35) == ("negative", 0.35)
+    assert polarity_label(0.1) == ("neutral", 0.9)
+    assert polarity_label(0.0) == ("neutral", 1.0)
+
+
+def test_lexicon_loads_fast():
+    """Artifact nạp trong vài ms (worker không cần import TextBlob/NLTK)"""
+    start = time.perf_counter()
+    lexicon = PolarityLexicon.load()
+    elapsed = time.perf_counter() - start
+    assert len(lexicon.words) > 2000 and "n't" in lexicon.negations
+    assert elapsed < 0.5, elapsed
+
+
+if __name__ == "__main__":
+    test_english_matches_textblob()
+    test_vietnamese_lexicon()
+    test_polarity_label_thresholds()
+    test_lexicon_loads_fast()
+    print("✅ Polarity tests passed!")
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Test Postgres Pool
+Kiểm tra PostgresConnectionPool với server giả: giới hạn max_size và timeout khi mượn,
+health check khi mượn, tự kết nối lại sau khi Postgres restart, và PostgresDatabase
+chạy lại câu đọc trên connection mới
+"""
+
+import threading
+import time
+
+import psycopg2
+
+from db.postgres_database import DISCONNECT_ERRORS, PostgresDatabase
+from db.postgres_pool import PoolTimeoutError, PostgresConnectionPool
+
+
+class FakeServer:
+    """Postgres giả: restart() làm mọi connection cũ mất kết nối"""
+
+    def __init__(self):
+        self.epoch = 0
+        self.down = False
+        self.connects = 0
+        self.statements = []
+        self.rows = [{'id': 1, 'name': 'Lavender', 'emotion': 'negative'}]
+        # pg_advisory_xact_lock: giữ đến khi transaction của connection kết thúc
+        self.advisory_lock = threading.Lock()
+        self.ddl = []
+
+    def connect(self):
+        if self.down:
+            raise psycopg2.OperationalError("could not connect to server")
+        self.connects += 1
+        return FakeConnection(self)
+
+    def restart(self):
+        self.epoch += 1
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self.conn.check()
+        if 'pg_advisory_xact_lock' in sql:
+            self.conn.server.advisory_lock.acquire()
+            self.conn.holds_advisory_lock = True
+        if 'CREATE' in sql:
+            self.conn.server.ddl.append(id(self.conn))
+            time.sleep(0.01)
+        self.conn.server.statements.append(sql.strip().split()[0])
+        self.result = [{'?column?': 1}] if sql == 'SELECT 1' else list(self.conn.server.rows)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.epoch = server.epoch
+        self.closed = 0
+        self.commits = 0
+        self.holds_advisory_lock = False
+
+    def check(self):
+        if self.closed or self.epoch != self.server.epoch:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.check()
+        self.commits += 1
+        self.end_transaction()
+
+    def rollback(self):
+        self.check()
+        self.end_transaction()
+
+    def end_transaction(self):
+        if self.holds_advisory_lock:
+            self.holds_advisory_lock = False
+            self.server.advisory_lock.release()
+
+    def close(self):
+        self.closed = 1
+
+
+def new_pool(server, **options):
+    options.setdefault('disconnect_errors', DISCONNECT_ERRORS)
+    return PostgresConnectionPool(server.connect, **options)
+
+
+def test_reuse_and_max_size_timeout():
+    """Connection được dùng lại; pool đầy thì chờ rồi timeout và được đếm"""
+    server = FakeServer()
+    pool = new_pool(server, min_size=1, max_size=2, acquire_timeout=0.05)
+    pool.warm_up()
+    assert server.connects == 1
+    for _ in range(10):
+        with pool.connection() as conn, conn.cursor() as cur:
+            cur.execute('SELECT * FROM fragrances')
+    assert server.connects == 1
+
+    first, second = pool.acquire(), pool.acquire()
+    try:
+        pool.acquire()
+        assert False, "pool đầy phải timeout"
+    except PoolTimeoutError:
+        pass
+
+    # Trả connection từ luồng khác: người đang chờ nhận được
+    releaser = threading.Timer(0.01, lambda: pool._release(first))
+    releaser.start()
+    pool.acquire_timeout = 1.0
+    assert pool.acquire() is first
+    stats = pool.stats()
+    assert stats['timeouts'] == 1 and stats['waits'] == 1 and stats['size'] == 2 and stats['in_use'] == 2
+    assert stats['max_wait_ms'] >= 10
+    pool._release(first)
+    pool._release(second)
+    pool.close()
+
+
+def test_reconnect_after_restart():
+    """Postgres restart: health check khi mượn phát hiện connection chết và mở connection mới"""
+    server = FakeServer()
+    now = [0.0]
+    pool = new_pool(server, ping_idle_seconds=5.0, clock=lambda: now[0])
+    with pool.connection() as conn:
+        conn.cursor().execute('SELECT 1')
+
+    server.restart()
+    now[0] += 10  # idle đủ lâu: ping trước khi giao connection
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute('SELECT * FROM fragrances')
+    stats = pool.stats()
+    assert stats['health_check_failures'] == 1 and stats['discarded'] == 1
+    assert server.connects == 2 and stats['size'] == 1
+
+
+def test_broken_connection_is_discarded():
+    """Lỗi mất kết nối giữa transaction: connection bị bỏ, không trả về pool"""
+    server = FakeServer()
+    pool = new_pool(server, ping_idle_seconds=None)
+    with pool.connection():
+        pass
+    server.restart()
+    try:
+        with pool.connection() as conn, conn.cursor() as cur:
+            cur.execute('SELECT * FROM fragrances')
+        assert False, "phải báo lỗi mất kết nối"
+    except psycopg2.OperationalError:
+        pass
+    assert pool.stats()['idle'] == 0 and pool.stats()['size'] == 0
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute('SELECT * FROM fragrances')
+    assert server.connects == 2
+
+
+def test_database_retries_reads_not_writes():
+    """PostgresDatabase chạy lại câu đọc sau khi mất kết nối; câu ghi báo lỗi cho caller"""
+    server = FakeServer()
+    db = PostgresDatabase(pool=new_pool(server, ping_idle_seconds=None))
+    assert db.get_fragrances('negative')[0]['name'] == 'Lavender'
+
+    server.restart()
+    assert db.get_fragrance_by_id(1)['name'] == 'Lavender'
+    server.restart()
+    try:
+        db.add_fragrance('Rose', 'sweet', 'positive')
+        assert False, "câu ghi không được chạy lại"
+    except psycopg2.OperationalError:
+        pass
+    assert server.statements.count('INSERT') == 0
+    assert db.add_fragrance('Rose', 'sweet', 'positive') is not None
+    assert server.statements.count('INSERT') == 1
+
+
+def test_down_at_startup_recovers():
+    """Không mở sẵn được connection thì vẫn khởi tạo pool; hết lỗi thì mượn bình thường"""
+    server = FakeServer()
+    server.down = True
+    pool = new_pool(server, min_size=2)
+    pool.warm_up()
+    assert pool.stats()['connect_errors'] == 1 and pool.stats()['size'] == 0
+    server.down = False
+    with pool.connection() as conn:
+        conn.cursor().execute('SELECT 1')
+    assert pool.stats()['size'] == 1
+
+
+def test_concurrent_checkouts_stay_within_max():
+    """Nhiều luồng mượn cùng lúc không vượt max_size"""
+    server = FakeServer()
+    pool = new_pool(server, max_size=3, acquire_timeout=5.0)
+    peak = [0]
+    active = [0]
+    lock = threading.Lock()
+
+    def work():
+        for _ in range(20):
+            with pool.connection():
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.001)
+                with lock:
+                    active[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] <= 3 and server.connects <= 3
+    assert pool.stats()['acquires'] == 160
+
+
+
+def test_workers_create_schema_one_at_a_time():
+    """Nhiều worker khởi động cùng lúc: DDL của ensure_tables chạy tuần tự dưới khóa advisory"""
+    server = FakeServer()
+    threads = [threading.Thread(target=PostgresDatabase, kwargs={'pool': new_pool(server, ping_idle_seconds=None)})
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Mỗi worker chạy hai câu DDL liền nhau, không xen với worker khác
+    assert len(server.ddl) == 8
+    assert all(server.ddl[i] == server.ddl[i + 1] for i in range(0, 8, 2))
+    assert not server.advisory_lock.locked()
+
+if __name__ == "__main__":
+    test_reuse_and_max_size_timeout()
+    test_reconnect_after_restart()
+    test_broken_connection_is_discarded()
+    test_database_retries_reads_not_writes()
+    test_down_at_startup_recovers()
+    test_concurrent_checkouts_stay_within_max()
+    test_workers_create_schema_one_at_a_time()
+    print("✅ Postgres pool tests passed!")
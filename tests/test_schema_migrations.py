@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Test Schema Migrations
+Kiểm tra migration theo phiên bản (idempotent, chờ bảng được tạo) và EXPLAIN QUERY PLAN
+của các truy vấn nóng: quay lại quét toàn bảng thì test thất bại
+"""
+
+import os
+import re
+import tempfile
+
+from db.connection import SQLiteConnectionManager
+from db.migrations import LATEST_VERSION, MIGRATIONS, apply_migrations, applied_versions
+from db.schema import create_app_db, create_conversations_table
+from db.user_database import BEST_SUGGESTION, UserDatabase
+
+# Truy vấn nóng -> index bắt buộc phải dùng
+HOT_QUERIES = [
+    ('''SELECT message, sentiment, confidence, fragrance_recommendation, timestamp
+        FROM conversations ORDER BY timestamp DESC LIMIT 10''', (), 'idx_conversations_timestamp'),
+    ('''UPDATE conversation_sessions SET end_time = CURRENT_TIMESTAMP, emotions_discussed = ?,
+        fragrances_suggested = ? WHERE session_id = ?''', (None, None, "s1"), 'idx_conversation_sessions_session_id'),
+    ('''SELECT COUNT(*) as total_sessions, AVG(total_messages) as avg_messages
+        FROM conversation_sessions WHERE user_id = ?''', ("u1",), 'idx_conversation_sessions_user_id'),
+    ('''SELECT emotion, fragrance_name, rating, used_count, last_used FROM user_preferences
+        WHERE user_id = ? ORDER BY used_count DESC, last_used DESC''', ("u1",), 'idx_user_preferences'),
+    ('''SELECT emotion, COUNT(*) as count FROM user_preferences WHERE user_id = ?
+        GROUP BY emotion ORDER BY count DESC LIMIT 1''', ("u1",), 'idx_user_preferences'),
+    (BEST_SUGGESTION, ("u1", "negative", 3), 'idx_user_preferences_suggestion'),
+    ('SELECT * FROM users WHERE user_id = ?', ("u1",), 'sqlite_autoindex_users'),
+]
+
+
+def query_plan(conn, sql, params):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def test_migrations_wait_for_tables_and_are_idempotent():
+    """Migration của conversations chờ init_db tạo bảng; chạy lại không đổi gì"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = SQLiteConnectionManager(os.path.join(directory, "chatbot.db"))
+        UserDatabase(connections=manager)
+        conn = manager.connection()
+        waiting = set(range(1, LATEST_VERSION + 1)) - applied_versions(conn)
+        assert waiting and all('conversations' in MIGRATIONS[version - 1].requires for version in waiting)
+
+        create_conversations_table(manager)
+        assert apply_migrations(manager) == sorted(waiting)
+        assert applied_versions(conn) == set(range(1, LATEST_VERSION + 1))
+        indexes = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {'idx_conversations_timestamp', 'idx_conversation_sessions_session_id',
+                'idx_user_preferences_unique', 'idx_user_preferences_suggestion'} <= indexes
+
+        assert apply_migrations(manager) == []
+        UserDatabase(connections=manager)
+        assert applied_versions(conn) == set(range(1, LATEST_VERSION + 1))
+        manager.close()
+
+
+def test_hot_queries_use_indexes():
+    """Mỗi truy vấn nóng dùng đúng index, không có bước quét toàn bảng"""
+    with tempfile.TemporaryDirectory() as directory:
+        manager = create_app_db(directory)
+        conn = manager.connection()
+        for sql, params, index in HOT_QUERIES:
+            plan = query_plan(conn, sql, params)
+            assert any(index in step for step in plan), (sql, plan)
+            assert not any(re.fullmatch(r'SCAN \w+', step) for step in plan), (sql, plan)
+        manager.close()
+
+
+if __name__ == "__main__":
+    test_migrations_wait_for_tables_and_are_idempotent()
+    test_hot_queries_use_indexes()
+    print("✅ Schema migration tests passed!")
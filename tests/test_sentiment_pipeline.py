@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test Sentiment Pipeline
+Kiểm tra phân tích cảm xúc theo tầng: fallback polarity không chạy khi state machine hoặc
+lexicon đã quyết định, chế độ async trả kết quả qua Future và số liệu từng tầng
+"""
+
+import threading
+
+from detectors.sentiment_pipeline import SentimentPipeline
+from state_machine.conversation_state_machine import ConversationStateMachine
+
+
+class CountingFallback:
+    """Fallback giả: đếm số lần gọi, có thể chặn để kiểm tra chế độ async"""
+
+    def __init__(self, result=("positive", 0.8), error=None):
+        self.calls = []
+        self.result = result
+        self.error = error
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, text):
+        self.release.wait(5)
+        self.calls.append(text)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def new_machine():
+    machine = ConversationStateMachine()
+    machine.reset_conversation("u1")
+    return machine
+
+
+def test_state_machine_tier_skips_fallback():
+    """Cảm xúc state machine đã xác định được dùng ngay, không gọi lexicon/fallback"""
+    fallback = CountingFallback()
+    pipeline = SentimentPipeline(fallback)
+    machine = new_machine()
+    machine.process_message("xin chào")
+    machine.process_message("tôi buồn quá")
+    emotion, confidence = machine.get_detected_emotion()
+    assert emotion
+
+    result = pipeline.analyze("tôi buồn quá", machine)
+    assert (result.sentiment, result.confidence, result.tier) == (emotion, confidence, 'state_machine')
+    assert fallback.calls == []
+    stats = pipeline.stats()['tiers']
+    assert stats['state_machine']['decided'] == 1 and stats['lexicon']['calls'] == 0
+
+
+def test_lexicon_tier_and_fallback():
+    """Lexicon quyết định khi có từ khóa; chỉ tin nhắn không khớp mới gọi fallback"""
+    fallback = CountingFallback()
+    pipeline = SentimentPipeline(fallback)
+    machine = new_machine()
+
+    result = pipeline.analyze("hôm nay tôi rất vui", machine)
+    assert result.tier == 'lexicon' and result.confidence > 0
+    assert fallback.calls == []
+
+    result = pipeline.analyze("the weather report", machine)
+    assert (result.sentiment, result.confidence, result.tier) == ("positive", 0.8, 'fallback')
+    assert fallback.calls == ["the weather report"]
+
+    stats = pipeline.stats()
+    assert stats['messages'] == 2
+    assert stats['tiers']['lexicon'] == dict(stats['tiers']['lexicon'], calls=2, decided=1, hit_rate=0.5)
+    assert stats['tiers']['fallback']['calls'] == 1 and stats['tiers']['fallback']['hit_rate'] == 0.5
+
+
+def test_async_fallback_does_not_block():
+    """Chế độ async trả kết quả tạm ngay, kết quả fallback đến qua Future"""
+    fallback = CountingFallback(result=("negative", 0.4))
+    fallback.release.clear()
+    pipeline = SentimentPipeline(fallback, mode='async')
+    machine = new_machine()
+
+    result = pipeline.analyze("the weather report", machine)
+    assert (result.sentiment, result.confidence) == ("neutral", 0.0) and result.pending is not None
+    assert not result.pending.done()
+    fallback.release.set()
+    assert result.pending.result(5) == ("negative", 0.4)
+    pipeline.close()
+    assert pipeline.stats()['deferred'] == 1
+
+
+def test_fallback_errors_are_counted():
+    """Fallback lỗi không làm hỏng request: trả neutral và đếm lỗi"""
+    pipeline = SentimentPipeline(CountingFallback(error=RuntimeError("boom")))
+    result = pipeline.analyze("the weather report", new_machine())
+    assert (result.sentiment, result.confidence) == ("neutral", 0.0)
+    assert pipeline.stats()['fallback_errors'] == 1
+    try:
+        SentimentPipeline(CountingFallback(), mode='eager')
+        assert False, "mode không hợp lệ phải báo lỗi"
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    test_state_machine_tier_skips_fallback()
+    test_lexicon_tier_and_fallback()
+    test_async_fallback_does_not_block()
+    test_fallback_errors_are_counted()
+    print("✅ Sentiment pipeline tests passed!")
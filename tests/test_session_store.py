@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Test Session Store
+Kiểm tra store phiên thay cho active_conversations: idle TTL, giới hạn số phiên (LRU),
+kết thúc phiên bị loại theo lô và số liệu
+"""
+
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import uuid
+
+from db.session_store import SessionStore, SQLiteSessionStore, create_session_store
+from db.user_database import UserDatabase
+from state_machine.conversation_record import ConversationRecord
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def new_store(**options):
+    batches = []
+    clock = FakeClock()
+    store = SessionStore(batches.append, clock=clock, **options)
+    return store, clock, batches
+
+
+def create(user_id):
+    return lambda: ConversationRecord(user_id, str(uuid.uuid4()))
+
+
+def test_idle_ttl_eviction():
+    """Phiên idle quá TTL bị sweeper loại và kết thúc"""
+    store, clock, batches = new_store(idle_ttl=60)
+    first = store.get_or_create("a", create("a"))
+    store.get_or_create("b", create("b"))
+    clock.now = 50
+    assert store.get("a") is first  # truy cập lại làm mới thời hạn của "a"
+    clock.now = 100
+    assert store.sweep() == 1
+    assert [record.user_id for record in batches[0]] == ["b"]
+    assert "a" in store and "b" not in store
+    assert store.stats()['evictions']['idle'] == 1
+
+
+def test_expired_session_not_returned():
+    """get() không trả về phiên đã hết hạn dù sweeper chưa chạy"""
+    store, clock, batches = new_store(idle_ttl=60)
+    store.get_or_create("a", create("a"))
+    clock.now = 61
+    assert store.get("a") is None
+    store.sweep()
+    assert len(batches) == 1 and batches[0][0].user_id == "a"
+
+
+def test_capacity_lru_eviction():
+    """Vượt max_entries thì loại phiên ít dùng nhất"""
+    store, clock, batches = new_store(max_entries=2)
+    store.get_or_create("a", create("a"))
+    store.get_or_create("b", create("b"))
+    store.get("a")
+    store.get_or_create("c", create("c"))
+    assert "b" not in store and "a" in store and "c" in store
+    assert store.stats()['evictions']['capacity'] == 1
+    store.sweep()
+    assert [record.user_id for record in batches[0]] == ["b"]
+
+
+def test_sweeper_batches_and_close():
+    """Phiên bị loại được kết thúc theo lô; close() kết thúc các phiên còn lại"""
+    store, clock, batches = new_store(idle_ttl=10, sweep_batch_size=3)
+    for i in range(7):
+        store.get_or_create(i, create(str(i)))
+    clock.now = 11
+    assert store.sweep() == 7
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+
+    store.get_or_create("late", create("late"))
+    store.close()
+    assert batches[-1][0].user_id == "late"
+    stats = store.stats()
+    assert stats['live_sessions'] == 0 and stats['finalized'] == 8
+    assert stats['sweeps'] == 1 and stats['last_sweep_ms'] >= 0
+
+
+def test_pop_is_not_finalized_by_store():
+    """Phiên kết thúc qua /api/conversation/end do caller tự kết thúc"""
+    store, clock, batches = new_store()
+    record = store.get_or_create("a", create("a"))
+    assert store.pop("a") is record
+    assert store.pop("a") is None
+    store.close()
+    assert batches == []
+
+
+def test_end_sessions_batch():
+    """UserDatabase.end_sessions cập nhật nhiều phiên trong một lần"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = UserDatabase(os.path.join(directory, "test.db"))
+        db.create_session("u1", "s1")
+        db.create_session("u2", "s2")
+        db.end_sessions([("s1", ["negative"], ["Lavender"]), ("s2", None, None)])
+
+        conn = sqlite3.connect(db.db_path)
+        rows = dict((row[0], row[1:]) for row in conn.execute(
+            "SELECT session_id, end_time, emotions_discussed, fragrances_suggested FROM conversation_sessions"))
+        conn.close()
+        assert rows["s1"][0] is not None and json.loads(rows["s1"][1]) == ["negative"]
+        assert rows["s2"][0] is not None and rows["s2"][1] is None
+
+
+def test_sqlite_store_shared_between_workers():
+    """Hai store trên cùng file (hai worker) thấy cùng state; phiên hết hạn chỉ được kết thúc một lần"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.db")
+        clock = FakeClock()
+        first_batches, second_batches = [], []
+        first = SQLiteSessionStore(first_batches.append, db_path=path, idle_ttl=60, clock=clock)
+        second = SQLiteSessionStore(second_batches.append, db_path=path, idle_ttl=60, clock=clock)
+
+        record = first.get_or_create("a", create("a"))
+        record.add_emotion("negative")
+        first.save("a", record)
+        assert second.get("a") == record
+        assert len(second) == 1
+
+        clock.now = 100
+        assert first.sweep() + second.sweep() == 1
+        assert len(first_batches) + len(second_batches) == 1
+        assert first.get("a") is None and second.get("a") is None
+        first.close()
+        second.close()
+
+
+def test_sqlite_store_capacity_and_pop():
+    """Vượt max_entries loại phiên cũ nhất; pop() gỡ phiên mà không kết thúc"""
+    with tempfile.TemporaryDirectory() as directory:
+        clock = FakeClock()
+        batches = []
+        store = create_session_store(batches.append, backend="sqlite", db_path=os.path.join(directory, "s.db"),
+                                     max_entries=2, clock=clock)
+        for second, user_id in enumerate(["a", "b", "c"]):
+            clock.now = second
+            store.get_or_create(user_id, create(user_id))
+        assert store.get("a") is None and store.get("c") is not None
+        assert store.pop("b").user_id == "b"
+        store.close()
+        assert [record.user_id for batch in batches for record in batch] == ["a"]
+        assert store.stats()['evictions']['capacity'] == 1
+
+
+def test_sqlite_store_save_after_removal_and_close():
+    """Phiên bị worker khác gỡ giữa get và save không sống lại; close() đóng kết nối và file khóa"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.db")
+        clock = FakeClock()
+        first = SQLiteSessionStore(lambda records: None, db_path=path, clock=clock)
+        second = SQLiteSessionStore(lambda records: None, db_path=path, clock=clock)
+        record = first.get_or_create("a", create("a"))
+        record.add_emotion("negative")
+        assert second.pop("a") is not None
+        first.save("a", record)
+        assert second.get("a") is None
+
+        first.close()
+        assert first.connections.stats()['open_connections'] == 0
+        assert first._user_locks._fd is None
+        assert first.stats()['live_sessions'] == 0
+        first.close()
+        second.close()
+
+
+def test_sqlite_store_sweep_between_get_and_save():
+    """Sweeper của worker khác loại phiên idle giữa get và save: phiên chỉ được kết thúc một lần"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.db")
+        clock = FakeClock()
+        finalized = []
+        worker = SQLiteSessionStore(finalized.extend, db_path=path, clock=clock, idle_ttl=10)
+        sweeper = SQLiteSessionStore(finalized.extend, db_path=path, clock=clock, idle_ttl=10)
+        record = worker.get_or_create("a", create("a"))
+        clock.now = 5
+        with worker.lock("a"):
+            record = worker.get("a")
+            clock.now = 20
+            assert sweeper.sweep() == 1
+            record.add_emotion("negative")
+            worker.save("a", record)
+        clock.now = 40
+        assert sweeper.sweep() == 0 and worker.sweep() == 0
+        assert [r.session_id for r in finalized] == [record.session_id]
+
+        # Tin nhắn tiếp theo mở phiên mới
+        assert worker.get_or_create("a", create("a")).session_id != record.session_id
+        worker.close()
+        sweeper.close()
+
+
+def _increment_worker(path, rounds):
+    store = SQLiteSessionStore(lambda records: None, db_path=path)
+    for _ in range(rounds):
+        with store.lock("shared_user"):
+            record = store.get_or_create("shared_user", create("shared_user"))
+            record.confidence += 1
+            store.save("shared_user", record)
+    store.close()
+
+
+def test_sqlite_store_per_user_ordering():
+    """Khóa theo user giữa các tiến trình: không mất cập nhật khi nhiều worker xử lý cùng user"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.db")
+        SQLiteSessionStore(lambda records: None, db_path=path).close()
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=_increment_worker, args=(path, 25)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert all(worker.exitcode == 0 for worker in workers)
+        store = SQLiteSessionStore(lambda records: None, db_path=path)
+        assert store.get("shared_user").confidence == 100
+        store.close()
+
+
+if __name__ == "__main__":
+    test_idle_ttl_eviction()
+    test_expired_session_not_returned()
+    test_capacity_lru_eviction()
+    test_sweeper_batches_and_close()
+    test_pop_is_not_finalized_by_store()
+    test_end_sessions_batch()
+    test_sqlite_store_shared_between_workers()
+    test_sqlite_store_capacity_and_pop()
+    test_sqlite_store_save_after_removal_and_close()
+    test_sqlite_store_sweep_between_get_and_save()
+    test_sqlite_store_per_user_ordering()
+    print("✅ Session store tests passed!")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Test State Machine Lexicon
+Kiểm tra lexicon bất biến dùng chung: mọi state machine trỏ tới cùng một bản đã biên dịch,
+mỗi cuộc hội thoại chỉ giữ state, user id, cảm xúc và độ tin cậy
+"""
+
+from state_machine.conversation_state_machine import (
+    DEFAULT_LEXICON,
+    ConversationState,
+    ConversationStateMachine,
+)
+
+
+def test_lexicon_shared_between_machines():
+    """Không biên dịch lại từ khóa cho mỗi user"""
+    first, second = ConversationStateMachine(), ConversationStateMachine()
+    assert first.lexicon is second.lexicon is DEFAULT_LEXICON
+    assert first.lexicon.emotion is second.lexicon.emotion
+
+
+def test_machine_holds_only_conversation_state():
+    """State machine dùng __slots__, không còn bản sao danh sách từ khóa"""
+    machine = ConversationStateMachine()
+    machine.reset_conversation("user_1")
+    assert not hasattr(machine, "__dict__")
+    assert (machine.current_state, machine.user_id, machine.detected_emotion, machine.confidence) == \
+        (ConversationState.GREETING, "user_1", None, 0.0)
+
+
+def test_lexicon_is_immutable():
+    """Lexicon dùng chung không thể bị sửa từ một cuộc hội thoại"""
+    for mutate in (
+        lambda: setattr(DEFAULT_LEXICON, "end_keywords", ("bye",)),
+        lambda: DEFAULT_LEXICON.emotion_keywords.__setitem__("positive", ("vui",)),
+        lambda: DEFAULT_LEXICON.agreement_keywords.append("ừ"),
+    ):
+        try:
+            mutate()
+        except (AttributeError, TypeError):
+            continue
+        raise AssertionError("lexicon dùng chung bị sửa được")
+
+
+def test_replace_builds_new_lexicon():
+    """replace() tạo lexicon mới, lexicon mặc định giữ nguyên"""
+    lexicon = DEFAULT_LEXICON.replace(end_keywords=DEFAULT_LEXICON.end_keywords + ("ngủ thôi",))
+    assert "ngủ thôi" in lexicon.end_keywords
+    assert "ngủ thôi" not in DEFAULT_LEXICON.end_keywords
+    assert lexicon.agreement_keywords == DEFAULT_LEXICON.agreement_keywords
+
+
+if __name__ == "__main__":
+    test_lexicon_shared_between_machines()
+    test_machine_holds_only_conversation_state()
+    test_lexicon_is_immutable()
+    test_replace_builds_new_lexicon()
+    print("✅ State machine lexicon tests passed!")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test Text Normalization
+Kiểm tra NormalizedMessage được tính một lần và dùng chung cho intent, emotion và scorer bên ngoài,
+cùng bảng fold dấu tiếng Việt và lượt so khớp lại có phân biệt dấu
+"""
+
+from detectors.ImprovedEmotionDetector import ImprovedEmotionDetector
+from state_machine.conversation_state_machine import ConversationStateMachine
+from utils.keyword_matching import KeywordLexicon
+from utils.text_normalization import NormalizedMessage, accent_compatible, fold_diacritics
+
+
+def test_normalized_fields():
+    """Các trường chuẩn hóa giống cách detector xử lý trước đây"""
+    normalized = NormalizedMessage("  Tôi VUI... và muốn tiếp tục!")
+    assert normalized.lower == "  tôi vui... và muốn tiếp tục!"
+    assert normalized.clean == "  tôi vui    và muốn tiếp tục "
+    assert normalized.stripped == "tôi vui    và muốn tiếp tục"
+    assert normalized.tokens == ["tôi", "vui", "và", "muốn", "tiếp", "tục"]
+    assert "vui" in normalized.token_set
+    assert NormalizedMessage.of(normalized) is normalized
+
+
+def test_detector_accepts_normalized_message():
+    """Truyền str hay NormalizedMessage đều cho cùng kết quả"""
+    detector = ImprovedEmotionDetector()
+    for message in ["tôi vui", "ok...", "không tôi không muốn", "stre...", "vậy"]:
+        normalized = NormalizedMessage(message)
+        assert detector.analyze_message(normalized) == detector.analyze_message(message)
+        assert detector.detect_intent(normalized) == detector.detect_intent(message)
+        assert detector.detect_emotion(normalized) == detector.detect_emotion(message)
+
+
+def test_registered_scorer_shares_features():
+    """Scorer bên ngoài nhận cùng NormalizedMessage và dùng chung đặc trưng đã tính"""
+    detector = ImprovedEmotionDetector()
+    calls = []
+
+    def token_count(normalized):
+        calls.append(normalized)
+        return normalized.feature("token_count", lambda n: len(n.tokens))
+
+    detector.register_scorer("length", token_count)
+    result = detector.analyze_message("tôi rất vui hôm nay")
+    assert result["scores"] == {"length": 5}
+    assert result["type"] == "emotion"
+    assert len(calls) == 1 and isinstance(calls[0], NormalizedMessage)
+
+
+def test_fold_diacritics():
+    """Bảng fold bỏ dấu tiếng Việt, giữ nguyên độ dài chuỗi"""
+    assert fold_diacritics("tạm biệt") == "tam biet"
+    assert fold_diacritics("Đồng ý, BUỒN") == "Dong y, BUON"
+    assert len(fold_diacritics("ưởng ạ")) == len("ưởng ạ")
+    # Tin nhắn gõ kiểu tổ hợp (NFD) được đưa về NFC trước khi fold
+    assert NormalizedMessage("bu\u00f4\u0300n").folded == "buon"
+
+
+def test_accent_sensitive_second_pass():
+    """Phần không dấu khớp mọi dạng, phần có dấu phải đúng dấu"""
+    assert accent_compatible("co", "có")
+    assert accent_compatible("có", "có")
+    assert not accent_compatible("cô", "có")
+    assert accent_compatible("buồn", "buồn") and not accent_compatible("buôn", "buồn")
+    assert NormalizedMessage("khong biet gi").contains("không biết")
+    assert not NormalizedMessage("tối nay").startswith("tôi")
+
+
+def test_lexicon_deduplicated_on_fold():
+    """Từ khóa có dấu/không dấu được gộp khi nạp, mỗi từ khóa chỉ tính một lần"""
+    lexicon = KeywordLexicon({"negative": ["buồn", "buon", "mệt"], "positive": ["vui"]}, fold=True)
+    assert set(lexicon.owners) == {"buon", "met", "vui"}
+    assert lexicon.forms["buon"] == {"buồn", "buon"}
+
+    for message in ["tôi buồn", "toi buon", "tôi buon", "buồn buon"]:
+        normalized = NormalizedMessage(message)
+        assert lexicon.count(lexicon.match(normalized.clean, normalized.folded))["negative"] == 1
+    # "buôn" (buôn bán) mang dấu khác nên không khớp "buồn"
+    normalized = NormalizedMessage("đi buôn")
+    assert lexicon.match(normalized.clean, normalized.folded) == set()
+
+
+def test_duplicate_keywords_keep_old_count():
+    """Dạng khai báo hai lần ("kết thúc"/"ket thuc" trong intent end) vẫn tính hai lần như trước khi fold,
+    chỉ các dạng dấu khác nhau của cùng một từ mới gộp lại: "kết thúc" và "ket thuc" đều confidence 1.0"""
+    detector = ImprovedEmotionDetector()
+    for message in ["kết thúc", "ket thuc", "nay bạn ket thuc"]:
+        result = detector.analyze_message(message)
+        assert (result["type"], result["intent"]) == ("intent", "end")
+        assert result["intent_confidence"] == 1.0
+
+
+def test_short_words_need_accents_in_accented_messages():
+    """Tin nhắn có dấu: "so" (so sánh), "te", "on" là từ khác, không khớp "sợ"/"tệ"/"ổn" sau khi bỏ dấu"""
+    detector = ImprovedEmotionDetector()
+    for message in ["tôi muốn so sánh", "so với hôm qua", "con te quá", "bật on rồi"]:
+        assert detector.detect_emotion(message) == ("neutral", 0.0), message
+    lexicon = KeywordLexicon({"negative": ["sợ", "tệ"], "neutral": ["ổn"]}, fold=True)
+    normalized = NormalizedMessage("so với hôm qua thì on")
+    assert lexicon.match(normalized.clean, normalized.folded) == set()
+    # Cả tin nhắn không dấu thì từ ngắn vẫn khớp, từ dài khớp cả khi tin nhắn có dấu
+    assert detector.detect_emotion("toi so qua")[0] == "negative"
+    assert detector.detect_emotion("hôm nay met moi")[0] == "negative"
+
+
+def test_detectors_understand_mixed_forms():
+    """Tin nhắn không dấu hoặc dấu lẫn lộn được hiểu như bản có dấu"""
+    detector = ImprovedEmotionDetector()
+    assert detector.analyze_message("toi buon qua")["type"] == "emotion"
+    assert detector.detect_emotion("khong biet") == ("neutral", 0.5)
+    assert detector.detect_emotion("met moi qua")[0] == "negative"
+
+    machine = ConversationStateMachine()
+    assert machine.detect_emotion("hôm nay tuyet voi")[0] == "positive"
+    assert machine.detect_end_intent("tam biệt")
+    assert not machine.detect_agreement("cô đơn")
+
+
+if __name__ == "__main__":
+    test_normalized_fields()
+    test_detector_accepts_normalized_message()
+    test_registered_scorer_shares_features()
+    test_fold_diacritics()
+    test_accent_sensitive_second_pass()
+    test_lexicon_deduplicated_on_fold()
+    test_duplicate_keywords_keep_old_count()
+    test_short_words_need_accents_in_accented_messages()
+    test_detectors_understand_mixed_forms()
+    print("✅ Text normalization tests passed!")
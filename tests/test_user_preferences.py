@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Test User Preferences
+Kiểm tra UPSERT sở thích nến thơm: unique index, gộp dòng trùng cũ khi khởi tạo,
+nhiều luồng cùng lưu không tạo dòng trùng, bản bulk cho replay/backfill và gợi ý cá nhân hóa
+"""
+
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+
+from db.user_database import UserDatabase
+
+
+def create_legacy_db(path):
+    """Database kiểu cũ: chưa có unique index, đã có dòng trùng"""
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE user_preferences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            emotion TEXT NOT NULL,
+            fragrance_name TEXT NOT NULL,
+            rating INTEGER DEFAULT 0,
+            used_count INTEGER DEFAULT 1,
+            last_used DATETIME DEFAULT CURRENT_TIMESTAMP,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.executemany('''
+        INSERT INTO user_preferences (user_id, emotion, fragrance_name, rating, used_count, last_used, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        ("u1", "negative", "Lavender", 2, 1, "2024-01-01 10:00:00", "2024-01-01 10:00:00"),
+        ("u1", "negative", "Lavender", 5, 3, "2024-03-01 10:00:00", "2024-02-01 10:00:00"),
+        ("u1", "negative", "Lavender", 4, 2, "2024-02-01 10:00:00", "2024-02-01 10:00:00"),
+        ("u1", "positive", "Citrus", 3, 1, "2024-01-05 10:00:00", "2024-01-05 10:00:00"),
+    ])
+    conn.commit()
+    conn.close()
+
+
+def preference_rows(db):
+    return db.connections.connection().execute('''
+        SELECT user_id, emotion, fragrance_name, rating, used_count, last_used
+        FROM user_preferences ORDER BY id
+    ''').fetchall()
+
+
+def test_migration_merges_duplicates():
+    """Khởi tạo gộp dòng trùng: cộng used_count, rating và last_used của lần dùng gần nhất"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.db")
+        create_legacy_db(path)
+        db = UserDatabase(path)
+        assert preference_rows(db) == [
+            ("u1", "negative", "Lavender", 5, 6, "2024-03-01 10:00:00"),
+            ("u1", "positive", "Citrus", 3, 1, "2024-01-05 10:00:00"),
+        ]
+        try:
+            db.connections.connection().execute(
+                "INSERT INTO user_preferences (user_id, emotion, fragrance_name) VALUES ('u1', 'positive', 'Citrus')")
+            assert False, "unique index phải chặn dòng trùng"
+        except sqlite3.IntegrityError:
+            pass
+        db.connections.close()
+
+
+def test_upsert_increments_and_updates_rating():
+    """Lưu lại cùng một nến thơm chỉ cộng used_count và ghi đè rating"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = UserDatabase(os.path.join(directory, "test.db"))
+        db.save_user_preference("u1", "negative", "Lavender", 2)
+        db.save_user_preference("u1", "negative", "Lavender", 4)
+        db.save_user_preference("u1", "positive", "Lavender")
+        rows = preference_rows(db)
+        assert [(row[1], row[3], row[4]) for row in rows] == [("negative", 4, 2), ("positive", 0, 1)]
+        db.connections.close()
+
+
+def test_concurrent_saves_do_not_duplicate():
+    """Nhiều luồng cùng lưu một preference: một dòng, không mất lần dùng nào"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = UserDatabase(os.path.join(directory, "test.db"))
+
+        def worker():
+            for _ in range(25):
+                db.save_user_preference("u1", "negative", "Lavender", 3)
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        rows = preference_rows(db)
+        assert len(rows) == 1 and rows[0][4] == 100
+        db.connections.close()
+
+
+def test_bulk_replay():
+    """save_user_preferences gộp sự kiện trùng rồi UPSERT một lần, cộng vào dòng đã có"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = UserDatabase(os.path.join(directory, "test.db"))
+        db.save_user_preference("u1", "negative", "Lavender", 1)
+        commits = db.connections.stats()['transactions']
+        upserted = db.save_user_preferences([
+            ("u1", "negative", "Lavender", 2),
+            ("u2", "neutral", "Vanilla", 0),
+            ("u1", "negative", "Lavender", 5),
+        ])
+        assert upserted == 2
+        assert db.connections.stats()['transactions'] == commits + 1
+        rows = {(row[0], row[2]): (row[3], row[4]) for row in preference_rows(db)}
+        assert rows == {("u1", "Lavender"): (5, 3), ("u2", "Vanilla"): (0, 1)}
+        assert db.save_user_preferences([]) == 0
+        db.connections.close()
+
+
+def legacy_suggestions(db, user_id, emotion):
+    """Cách cũ (lọc danh sách preferences trong Python), gồm mọi nến thơm đồng hạng với kết quả"""
+    candidates = [pref for pref in db.get_user_preferences(user_id)
+                  if pref['emotion'] == emotion and pref['rating'] >= 3]
+    if not candidates:
+        return {None}
+    best = (candidates[0]['used_count'], candidates[0]['last_used'])
+    return {pref['fragrance_name'] for pref in candidates if (pref['used_count'], pref['last_used']) == best}
+
+
+def test_suggestion_query_matches_legacy_filter():
+    """Query có index trả về cùng nến thơm với cách lọc cũ"""
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as directory:
+        db = UserDatabase(os.path.join(directory, "test.db"))
+        for _ in range(400):
+            db.save_user_preference(f"u{rng.randrange(5)}", rng.choice(["positive", "negative", "neutral"]),
+                                    f"Nến {rng.randrange(8)}", rng.randrange(6))
+        for user in range(6):
+            for emotion in ["positive", "negative", "neutral", "unknown"]:
+                assert db.get_personalized_suggestion(f"u{user}", emotion) in legacy_suggestions(db, f"u{user}", emotion)
+        db.connections.close()
+
+
+def test_suggestion_cache_updated_on_save():
+    """Cache gợi ý được cập nhật ngay khi lưu preference"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = UserDatabase(os.path.join(directory, "test.db"), suggestion_cache_size=16)
+        assert db.get_personalized_suggestion("u1", "negative") is None
+        db.save_user_preference("u1", "negative", "Lavender", 4)
+        assert db.get_personalized_suggestion("u1", "negative") == "Lavender"
+        db.save_user_preference("u1", "negative", "Vanilla", 5)
+        db.save_user_preference("u1", "negative", "Vanilla", 5)
+        assert db.get_personalized_suggestion("u1", "negative") == "Vanilla"
+        db.save_user_preference("u1", "negative", "Vanilla", 1)
+        assert db.get_personalized_suggestion("u1", "negative") == "Lavender"
+        stats = db.suggestion_cache.stats()
+        assert stats['hits'] == 3 and stats['misses'] == 1
+
+        db.save_user_preferences([("u1", "negative", "Cedar", 5)] * 5)
+        assert db.get_personalized_suggestion("u1", "negative") == "Cedar"
+        db.connections.close()
+
+
+
+def test_suggestion_cache_follows_commit():
+    """Lượt chat rollback thì cache không giữ gợi ý chưa từng được commit"""
+    with tempfile.TemporaryDirectory() as directory:
+        db = UserDatabase(os.path.join(directory, "test.db"), suggestion_cache_size=16)
+        db.save_user_preference("u1", "negative", "Lavender", 4)
+        assert db.get_personalized_suggestion("u1", "negative") == "Lavender"
+        try:
+            with db.connections.transaction(immediate=True):
+                for _ in range(3):
+                    db.save_user_preference("u1", "negative", "Cedar", 5)
+                # Chưa commit: cache vẫn là giá trị đã commit
+                assert db.suggestion_cache.get_or_compute(("u1", "negative"), lambda: None) == "Lavender"
+                raise RuntimeError("lỗi cuối lượt chat")
+        except RuntimeError:
+            pass
+        assert db.get_personalized_suggestion("u1", "negative") == "Lavender"
+
+        with db.connections.transaction(immediate=True):
+            for _ in range(3):
+                db.save_user_preference("u1", "negative", "Cedar", 5)
+        assert db.get_personalized_suggestion("u1", "negative") == "Cedar"
+        db.connections.close()
+
+if __name__ == "__main__":
+    test_migration_merges_duplicates()
+    test_upsert_increments_and_updates_rating()
+    test_concurrent_saves_do_not_duplicate()
+    test_bulk_replay()
+    test_suggestion_query_matches_legacy_filter()
+    test_suggestion_cache_updated_on_save()
+    test_suggestion_cache_follows_commit()
+    print("✅ User preference tests passed!")
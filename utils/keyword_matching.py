@@ -0,0 +1,239 @@
+"""
+Keyword Matching - Bộ so khớp từ khóa dùng chung cho detector và state machine
+File này chứa automaton Aho-Corasick để tìm tất cả từ khóa trong một lượt quét tin nhắn
+và chỉ mục biến thể xóa 1 ký tự (kiểu SymSpell) cho so khớp fuzzy
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.text_normalization import accent_compatible, fold_diacritics
+
+
+class KeywordAutomaton:
+    """Automaton Aho-Corasick: biên dịch một lần, tìm mọi từ khóa (khớp chuỗi con) trong một lượt quét"""
+
+    def __init__(self, patterns: Iterable[str]):
+        # Trạng thái 0 là gốc; mỗi trạng thái có bảng chuyển, liên kết fail và danh sách pattern kết thúc tại đó
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        self.patterns: Set[str] = set()
+
+        for pattern in patterns:
+            if pattern and pattern not in self.patterns:
+                self.patterns.add(pattern)
+                self._insert(pattern)
+        self._build_failure_links()
+
+    def _insert(self, pattern: str):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state].append(pattern)
+
+    def _build_failure_links(self):
+        """Duyệt BFS để tạo liên kết fail và gộp output của hậu tố"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> Set[str]:
+        """Trả về tập các pattern xuất hiện trong text (mỗi pattern tối đa một lần)"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+    def find_all(self, text: str) -> List[Tuple[str, int]]:
+        """Mọi lần xuất hiện: (pattern, vị trí kết thúc - không bao gồm)"""
+        goto, fail, output = self._goto, self._fail, self._output
+        matches = []
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                end = index + 1
+                matches.extend((pattern, end) for pattern in output[state])
+        return matches
+
+
+class DeletionIndex:
+    """Chỉ mục SymSpell: biến thể xóa 1 ký tự -> các từ khóa gốc, dựng một lần khi khởi tạo
+
+    Giữ đúng ngữ nghĩa của simple_fuzzy_match: từ khóa khớp fuzzy khi một biến thể xóa
+    của nó xuất hiện ở bất kỳ đâu trong text. Các biến thể được biên dịch vào một automaton
+    nên chỉ cần một lượt quét text, sau đó tra hash để lấy từ khóa gốc.
+    """
+
+    def __init__(self, words: Iterable[str], min_length: int = 4):
+        self.variants: Dict[str, Set[str]] = {}
+        for word in words:
+            if len(word) < min_length:
+                continue
+            for i in range(len(word)):
+                self.variants.setdefault(word[:i] + word[i + 1:], set()).add(word)
+        self._automaton = KeywordAutomaton(self.variants)
+
+    def lookup(self, variant: str) -> Set[str]:
+        """Các từ khóa gốc có biến thể xóa này"""
+        return self.variants.get(variant, set())
+
+    def find(self, text: str) -> Set[str]:
+        """Trả về tập từ khóa có biến thể xóa xuất hiện trong text"""
+        found = set()
+        for variant in self._automaton.find(text):
+            found.update(self.variants[variant])
+        return found
+
+
+class KeywordLexicon:
+    """Lexicon theo nhóm (category -> danh sách từ khóa) đã biên dịch thành một automaton
+
+    fold=True: từ khóa được bỏ dấu và gộp khi nạp ("buồn"/"buon" -> "buon"), tin nhắn
+    được so khớp ở dạng bỏ dấu rồi kiểm tra lại có phân biệt dấu (accent_compatible) để dấu
+    người dùng đã gõ vẫn giữ nghĩa ("cô" không khớp "có").
+    whole_words=True: từ khóa một từ phải khớp nguyên token, cụm từ vẫn khớp chuỗi con.
+    Khớp chỉ sau khi bỏ dấu cần span dài ít nhất fold_min_length ký tự, trừ khi cả tin nhắn
+    không dấu: trong tin nhắn có dấu, "so" (so sánh) hay "on" là từ khác chứ không phải "sợ"/"ổn".
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]], fuzzy_min_length: Optional[int] = None,
+                 fold: bool = False, whole_words: bool = False, fold_min_length: int = 4):
+        self.categories = list(keywords)
+        self.fold = fold
+        self.fold_min_length = fold_min_length
+        self.whole_words = whole_words
+        # Từ khóa -> danh sách category chứa nó, giữ cả trùng lặp để điểm số như cách đếm cũ.
+        # fold: các dạng dấu khác nhau của một từ ("buồn"/"buon") gộp thành một lần, nhưng một dạng
+        # khai báo hai lần ("kết thúc" trong intent end) vẫn tính hai lần như trước
+        self.owners: Dict[str, List[str]] = {}
+        # Từ khóa (đã bỏ dấu) -> các dạng gốc có dấu trong lexicon
+        self.forms: Dict[str, Set[str]] = {}
+        declared: Dict[Tuple[str, str, str], int] = {}
+        for category, words in keywords.items():
+            for word in words:
+                form = word.lower()
+                key = fold_diacritics(form) if fold else form
+                self.forms.setdefault(key, set()).add(form)
+                owners = self.owners.setdefault(key, [])
+                declared[key, category, form] = declared.get((key, category, form), 0) + 1
+                if not fold or declared[key, category, form] > owners.count(category):
+                    owners.append(category)
+        self.automaton = KeywordAutomaton(self.owners)
+        self.deletions = DeletionIndex(self.owners, fuzzy_min_length) if fuzzy_min_length else None
+        # Automaton gộp từ khóa và biến thể xóa: một lượt quét cho cả khớp chính xác lẫn fuzzy
+        variants = self.deletions.variants if self.deletions is not None else {}
+        self._combined = KeywordAutomaton(list(self.owners) + list(variants)) if fold or whole_words else None
+        # Biến thể xóa của các dạng có dấu, dùng khi kiểm tra lại fuzzy hit có phân biệt dấu
+        self._form_deletions: Dict[str, Set[str]] = {
+            key: {form[:i] + form[i + 1:] for form in self.forms[key] for i in range(len(form))}
+            for key in self.owners
+        } if variants else {}
+
+    def find(self, text: str) -> Set[str]:
+        """Tìm tất cả từ khóa khớp chính xác (chuỗi con) trong text"""
+        return self.automaton.find(text)
+
+    def match(self, text: str, folded: Optional[str] = None) -> Set[str]:
+        """Tìm từ khóa khớp chính xác hoặc fuzzy (sai lệch 1 ký tự) trong text"""
+        return self.match_accents(text, folded)[0]
+
+    def match_accents(self, text: str, folded: Optional[str] = None) -> Tuple[Set[str], Set[str]]:
+        """Trả về (từ khóa khớp, từ khóa khớp đúng cả dấu) - nhóm sau dùng để phân xử khi hòa điểm
+
+        folded là fold_diacritics(text) nếu caller đã tính sẵn (NormalizedMessage.folded).
+        """
+        if not self.fold and not self.whole_words:
+            hits = self.automaton.find(text)
+            if self.deletions is not None:
+                hits |= self.deletions.find(text)
+            return hits, hits
+
+        if folded is None:
+            folded = fold_diacritics(text) if self.fold else text
+        forms = self.forms
+        variants = self.deletions.variants if self.deletions is not None else {}
+        # Tin nhắn gõ không dấu: span ngắn chỉ khớp được sau khi bỏ dấu nên vẫn chấp nhận
+        min_length = 0 if folded == text else self.fold_min_length
+        hits: Set[str] = set()
+        exact: Set[str] = set()
+        fuzzy: List[Tuple[str, int]] = []
+        for pattern, end in self._combined.find_all(folded):
+            if pattern in variants:
+                fuzzy.append((pattern, end))
+            if pattern not in forms:
+                continue
+            start = end - len(pattern)
+            if self.whole_words and " " not in pattern and not self._is_whole_word(folded, start, end):
+                continue
+            span = text[start:end]
+            if span in forms[pattern]:
+                hits.add(pattern)
+                exact.add(pattern)
+            elif pattern not in hits and len(span) >= min_length and self._is_whole_word(folded, start, end) and \
+                    any(accent_compatible(span, form) for form in forms[pattern]):
+                # Chỉ khớp sau khi bỏ dấu: yêu cầu nguyên từ để "con" không chứa "ổn"
+                hits.add(pattern)
+
+        for variant, end in fuzzy:
+            start = end - len(variant)
+            span = text[start:end]
+            for key in variants[variant]:
+                if key in hits:
+                    continue
+                deletions = self._form_deletions[key]
+                if span in deletions or (len(span) >= min_length and self._is_whole_word(folded, start, end) and
+                                         any(accent_compatible(span, deletion) for deletion in deletions)):
+                    hits.add(key)
+        return hits, exact
+
+    @staticmethod
+    def _is_whole_word(text: str, start: int, end: int) -> bool:
+        """text[start:end] đứng riêng (đầu/cuối text hoặc khoảng trắng hai bên)"""
+        return (start == 0 or text[start - 1].isspace()) and (end == len(text) or text[end].isspace())
+
+    def incidence(self) -> List[List[int]]:
+        """Ma trận từ khóa x category (số lần từ khóa xuất hiện trong category), theo thứ tự của owners"""
+        rows = []
+        for word, categories in self.owners.items():
+            rows.append([categories.count(category) for category in self.categories])
+        return rows
+
+    def count(self, hits: Iterable[str]) -> Dict[str, int]:
+        """Đếm số từ khóa khớp cho mỗi category (theo thứ tự khai báo category)"""
+        scores = {category: 0 for category in self.categories}
+        for word in hits:
+            for category in self.owners.get(word, ()):
+                scores[category] += 1
+        return scores
+
+
+def best_category(scores: Dict[str, int], exact_scores: Dict[str, int]) -> str:
+    """Category điểm cao nhất; khi hòa điểm, lượt thứ hai có phân biệt dấu quyết định
+    (category có nhiều từ khóa khớp đúng cả dấu hơn thắng, còn hòa thì giữ thứ tự khai báo)"""
+    return max(scores, key=lambda category: (scores[category], exact_scores[category]))
+
@@ -0,0 +1,69 @@
+"""
+LRU Cache - Bộ nhớ đệm kết quả có giới hạn kích thước, an toàn đa luồng
+File này chứa LRUCache dùng để ghi nhớ kết quả phân tích tin nhắn lặp lại (quick-reply)
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Cache LRU có giới hạn, kèm bộ đếm hit/miss/eviction/invalidation"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Trả về giá trị đã cache hoặc tính mới (compute chạy ngoài lock)"""
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is not _MISSING:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """Ghi giá trị, loại bỏ mục ít dùng nhất khi vượt maxsize"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Xóa toàn bộ cache (ví dụ khi lexicon thay đổi)"""
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Thống kê cache"""
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
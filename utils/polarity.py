@@ -0,0 +1,146 @@
+"""
+Polarity - Chấm điểm polarity (-1..1) bằng lexicon đã biên dịch sẵn, thay TextBlob trên luồng request
+File này chứa PolarityLexicon (nạp artifact utils/polarity_lexicon.json do
+scripts/build_polarity_lexicon.py sinh ra từ lexicon tiếng Anh của TextBlob/pattern và
+lexicon tiếng Việt) và PolarityScorer: cùng thuật toán assessments của pattern
+(modifier "very good", phủ định "not good" = -0.5x, "!" tăng cường, emoticon)
+"""
+
+import json
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'polarity_lexicon.json')
+LEXICON_FORMAT = 1
+
+# "don't" -> "do", "n't"; từ có gạch nối giữ nguyên; mỗi dấu câu/emoji là một token
+TOKEN_PATTERN = re.compile(r"\w+?(?=n't\b)|n't\b|\w+(?:-\w+)*|[^\w\s]")
+
+
+class PolarityLexicon:
+    """Lexicon polarity đã biên dịch: từ/cụm từ -> (polarity, intensity, là modifier)"""
+
+    def __init__(self, words: Dict[str, Tuple[float, float, bool]], negations, boosters: Dict[str, float],
+                 emoticons: Dict[str, float], source: str = ''):
+        self.words = words
+        self.negations = frozenset(negations)
+        self.boosters = boosters
+        self.emoticons = emoticons
+        self.source = source
+        # Token đầu của cụm từ nhiều từ ("hạnh phúc", "đâu có") -> số token dài nhất
+        self.phrases: Dict[str, int] = {}
+        for phrase in list(words) + list(self.negations) + list(boosters):
+            parts = phrase.split()
+            if len(parts) > 1:
+                self.phrases[parts[0]] = max(self.phrases.get(parts[0], 0), len(parts))
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_LEXICON_PATH) -> 'PolarityLexicon':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('format') != LEXICON_FORMAT:
+            raise ValueError(f"Polarity lexicon {path} có format {data.get('format')}, cần {LEXICON_FORMAT}")
+        words = {word: (polarity, intensity, bool(modifier))
+                 for word, (polarity, intensity, modifier) in data['words'].items()}
+        return cls(words, data['negations'], data['boosters'], data['emoticons'], data.get('source', ''))
+
+
+class PolarityScorer:
+    """Polarity của văn bản = trung bình polarity các đánh giá (từ đã biết kèm modifier/phủ định)"""
+
+    def __init__(self, lexicon: Optional[PolarityLexicon] = None):
+        self.lexicon = lexicon if lexicon is not None else PolarityLexicon.load()
+
+    def tokenize(self, text: str) -> List[str]:
+        """Tách token (lowercase, NFC), emoticon giữ nguyên, cụm từ trong lexicon gộp thành một token"""
+        emoticons, phrases = self.lexicon.emoticons, self.lexicon.phrases
+        tokens = []
+        for chunk in unicodedata.normalize('NFC', text).lower().split():
+            if chunk in emoticons:
+                tokens.append(chunk)
+            else:
+                tokens.extend(TOKEN_PATTERN.findall(chunk))
+        if not phrases:
+            return tokens
+
+        merged = []
+        i = 0
+        while i < len(tokens):
+            longest = phrases.get(tokens[i], 0)
+            for size in range(min(longest, len(tokens) - i), 1, -1):
+                phrase = " ".join(tokens[i:i + size])
+                if phrase in self.lexicon.words or phrase in self.lexicon.negations or phrase in self.lexicon.boosters:
+                    merged.append(phrase)
+                    i += size
+                    break
+            else:
+                merged.append(tokens[i])
+                i += 1
+        return merged
+
+    def assessments(self, tokens: List[str]) -> List[Tuple[List[str], float]]:
+        """Các đánh giá (chuỗi token, polarity) theo thuật toán của pattern.en.sentiment"""
+        words, negations = self.lexicon.words, self.lexicon.negations
+        boosters, emoticons = self.lexicon.boosters, self.lexicon.emoticons
+        found = []  # [token, polarity, intensity, phủ định]
+        modifier = None  # Modifier đứng trước ("very good")
+        negation = None  # Phủ định đứng trước ("not good")
+        for word in tokens:
+            entry = words.get(word)
+            if entry is not None:
+                polarity, intensity, is_modifier = entry
+                if modifier is None:
+                    found.append([[word], polarity, intensity, False])
+                else:
+                    last = found[-1]
+                    last[0].append(word)
+                    last[1] = max(-1.0, min(polarity * last[2], 1.0))
+                    last[2] = intensity
+                if negation is not None:
+                    last = found[-1]
+                    last[0].insert(0, negation)
+                    last[2] = 1.0 / last[2]
+                    last[3] = True
+                modifier = word if is_modifier else None
+                negation = word if word in negations else None
+                continue
+
+            if word in negations:
+                negation = word
+            elif negation and len(word.strip("'")) > 1:
+                # Giữ phủ định qua từ ngắn ("not a good")
+                negation = None
+            if negation is not None and modifier is not None and modifier.endswith("ly"):
+                # Phủ định sau modifier ("really not good")
+                found[-1][0].append(negation)
+                found[-1][3] = True
+                negation = None
+            elif modifier and len(word) > 2:
+                modifier = None
+            if word in boosters and found:
+                # "!" (và "quá", "lắm") tăng cường đánh giá liền trước
+                found[-1][0].append(word)
+                found[-1][1] = max(-1.0, min(found[-1][1] * boosters[word], 1.0))
+            if word in emoticons:
+                found.append([[word], emoticons[word], 1.0, False])
+        # "not good" = hơi tệ, "not bad" = hơi tốt
+        return [(chunk, polarity * -0.5 if negated else polarity) for chunk, polarity, _, negated in found]
+
+    def polarity(self, text: str) -> float:
+        found = self.assessments(self.tokenize(text))
+        return sum(polarity for _, polarity in found) / (len(found) or 1)
+
+    def analyze(self, text: str) -> Tuple[str, float]:
+        """(sentiment, confidence) cùng ngưỡng với cách dùng TextBlob polarity trước đây"""
+        return polarity_label(self.polarity(text))
+
+
+def polarity_label(polarity: float) -> Tuple[str, float]:
+    """polarity > 0.1 -> positive, < -0.1 -> negative (confidence = |polarity|), còn lại neutral"""
+    if polarity > 0.1:
+        return "positive", abs(polarity)
+    if polarity < -0.1:
+        return "negative", abs(polarity)
+    return "neutral", 1 - abs(polarity)
@@ -0,0 +1,103 @@
+"""
+Text Normalization - Chuẩn hóa tin nhắn một lần, dùng chung cho mọi bộ chấm điểm
+File này chứa NormalizedMessage: text đã lowercase, bỏ dấu câu, tokens và token set,
+cùng bảng fold dấu tiếng Việt ("buồn" -> "buon") dùng cho cả từ khóa và tin nhắn
+"""
+
+import re
+import unicodedata
+from typing import Any, Callable, Dict, FrozenSet, List, Union
+
+# Loại bỏ dấu câu (giữ chữ, số và khoảng trắng)
+PUNCTUATION_PATTERN = re.compile(r'[^\w\s]')
+
+# Các chữ cái có dấu tiếng Việt (dạng NFC) theo chữ cái gốc
+_VIETNAMESE_LETTERS = {
+    "a": "àáảãạăằắẳẵặâầấẩẫậ",
+    "e": "èéẻẽẹêềếểễệ",
+    "i": "ìíỉĩị",
+    "o": "òóỏõọôồốổỗộơờớởỡợ",
+    "u": "ùúủũụưừứửữự",
+    "y": "ỳýỷỹỵ",
+    "d": "đ",
+}
+
+# Bảng dịch tính sẵn một lần: mỗi ký tự có dấu -> một ký tự không dấu (giữ nguyên độ dài chuỗi)
+VIETNAMESE_FOLD_TABLE = str.maketrans(
+    "".join(accented + accented.upper() for accented in _VIETNAMESE_LETTERS.values()),
+    "".join(base * len(accented) + base.upper() * len(accented) for base, accented in _VIETNAMESE_LETTERS.items()),
+)
+_FOLDED_CHARS = {chr(code): chr(base) for code, base in VIETNAMESE_FOLD_TABLE.items()}
+
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: "tạm biệt" -> "tam biet" (text nên ở dạng NFC)"""
+    return text.translate(VIETNAMESE_FOLD_TABLE)
+
+
+def accent_compatible(span: str, form: str) -> bool:
+    """So khớp có phân biệt dấu: span (trong tin nhắn) khớp form (từ khóa) nếu mỗi ký tự
+    giống hệt, hoặc span không dấu ở vị trí đó và cùng chữ cái gốc
+
+    "co" và "có" khớp "có"; "cô" không khớp "có" vì dấu trong tin nhắn mang nghĩa khác.
+    """
+    if len(span) != len(form):
+        return False
+    for span_char, form_char in zip(span, form):
+        if span_char == form_char:
+            continue
+        if span_char in _FOLDED_CHARS or span_char != _FOLDED_CHARS.get(form_char, form_char):
+            return False
+    return True
+
+
+class NormalizedMessage:
+    """Tin nhắn đã chuẩn hóa, tính một lần rồi truyền cho intent, emotion và scorer bên ngoài"""
+
+    __slots__ = ('text', 'lower', 'clean', 'stripped', 'folded', 'tokens', 'token_set', '_features')
+
+    def __init__(self, text: str):
+        self.text = text
+        # NFC để chữ có dấu gõ kiểu tổ hợp (NFD) vẫn khớp từ khóa
+        self.lower = unicodedata.normalize('NFC', text).lower()
+        # Thay dấu câu bằng khoảng trắng để không dính các từ lại với nhau
+        self.clean = PUNCTUATION_PATTERN.sub(' ', self.lower)
+        self.stripped = self.clean.strip()
+        self.folded = fold_diacritics(self.clean)
+        self.tokens: List[str] = self.clean.split()
+        self.token_set: FrozenSet[str] = frozenset(self.tokens)
+        self._features: Dict[str, Any] = {}
+
+    @classmethod
+    def of(cls, message: Union[str, 'NormalizedMessage']) -> 'NormalizedMessage':
+        """Nhận str hoặc NormalizedMessage, chỉ chuẩn hóa khi cần"""
+        if isinstance(message, cls):
+            return message
+        return cls(message)
+
+    def contains(self, phrase: str) -> bool:
+        """phrase xuất hiện trong clean, bỏ qua phần dấu người dùng không gõ ("khong biet" ~ "không biết")"""
+        folded_phrase = fold_diacritics(phrase)
+        start = self.folded.find(folded_phrase)
+        while start != -1:
+            if accent_compatible(self.clean[start:start + len(phrase)], phrase):
+                return True
+            start = self.folded.find(folded_phrase, start + 1)
+        return False
+
+    def startswith(self, phrase: str) -> bool:
+        """stripped bắt đầu bằng phrase (so khớp có phân biệt dấu như contains)"""
+        return accent_compatible(self.stripped[:len(phrase)], phrase)
+
+    def equals(self, phrase: str) -> bool:
+        """stripped đúng bằng phrase (so khớp có phân biệt dấu như contains)"""
+        return accent_compatible(self.stripped, phrase)
+
+    def feature(self, name: str, compute: Callable[['NormalizedMessage'], Any]) -> Any:
+        """Lấy đặc trưng dẫn xuất (tính một lần cho mỗi tin nhắn, dùng chung giữa các scorer)"""
+        if name not in self._features:
+            self._features[name] = compute(self)
+        return self._features[name]
+
+    def __repr__(self) -> str:
+        return f"NormalizedMessage({self.text!r})"